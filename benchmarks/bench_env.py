@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+
+# Throughput of `MeasureFollowingEnv` and the cost of its components, swept
+# over window_size, memory_size, fps and score length. Results are written as
+# JSON so runs of different commits can be compared:
+#
+#   python -m benchmarks.bench_env --output bench.json --num-measures 0 128
+
+from argparse import ArgumentParser
+from collections.abc import Callable
+from datetime import datetime, timezone
+import itertools
+import json
+import os
+from pathlib import Path
+import platform
+import subprocess
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")  # `human` renders offscreen
+
+import numpy as np
+from sabanamusic.models.musical import make_score_measures
+
+from measure_following_game.environment import *
+
+SAMPLES_ROOT = Path(__file__).parents[1] / "samples"
+RECORD_NAME = "record/demo"
+
+
+def measure(fn: Callable, repeat: int = 5, number: int = 1) -> dict[str, float]:
+    # seconds per call of `fn`, from `repeat` rounds of `number` calls
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        timings.append((time.perf_counter() - start) / number)
+    timings = np.asarray(timings)
+    return {
+        "mean": float(timings.mean()),
+        "min": float(timings.min()),
+        "std": float(timings.std()),
+        "calls": repeat * number,
+    }
+
+
+def summarize(timings: list[float]) -> dict[str, float]:
+    timings = np.asarray(timings)
+    if len(timings) == 0:
+        return {"mean": float("nan"), "min": float("nan"), "std": 0.0, "calls": 0}
+    return {
+        "mean": float(timings.mean()),
+        "min": float(timings.min()),
+        "std": float(timings.std()),
+        "calls": len(timings),
+    }
+
+
+def tile_score(score_measures: ScoreFeatureStore, num_measures: int):
+    # synthetic score of `num_measures` measures built from the bundled one
+    indices = np.arange(num_measures) % len(score_measures)
+    return ScoreFeatureStore.from_measures([score_measures[i] for i in indices])
+
+
+def random_policies(rng: np.random.Generator, num_actions: int, size: int):
+    policies = rng.random((size, num_actions), dtype=np.float32)
+    return policies / policies.sum(axis=1, keepdims=True)
+
+
+def bench_config(
+    score_root: Path,
+    window_size: int,
+    memory_size: int,
+    fps: int,
+    num_measures: int,
+    num_steps: int,
+    seed: int = 0,
+) -> dict:
+    rng = np.random.default_rng(seed)
+    result = {}
+
+    result["make_score_measures"] = measure(
+        lambda: make_score_measures(score_root=score_root, fps=fps), repeat=3
+    )
+
+    param = make_env_param(
+        score_root=score_root,
+        record_name=RECORD_NAME,
+        window_size=window_size,
+        memory_size=memory_size,
+        fps=fps,
+        renderer_options={"headless": True},
+    )
+    score_measures = load_score_measures(score_root, fps)
+    if num_measures > 0:
+        score_measures = tile_score(score_measures, num_measures)
+    env = make_env(param, score_measures)
+    manager, reward = env.manager, env.reward
+    policies = random_policies(rng, manager.num_actions, num_steps)
+
+    reset_timings = []
+
+    def reset():
+        start = time.perf_counter()
+        env.reset(seed=int(rng.integers(2**31)))
+        reset_timings.append(time.perf_counter() - start)
+
+    # whole env steps, including resets at the end of episodes
+    reset()
+    start = time.perf_counter()
+    for policy in policies:
+        _, _, done, _ = env.step(policy)
+        if done:
+            reset()
+    elapsed = time.perf_counter() - start - sum(reset_timings[1:])
+    result["steps_per_sec"] = num_steps / elapsed
+    result["reset"] = summarize(reset_timings)
+
+    # similarity features of one record step
+    fill_timings = []
+    reset()
+    for _ in range(num_steps):
+        if manager.record.done:
+            reset()
+        manager.record.step()
+        start = time.perf_counter()
+        manager._fill_similarity_matrix()
+        fill_timings.append(time.perf_counter() - start)
+    result["fill_similarity_matrix"] = summarize(fill_timings)
+
+    true_actions = rng.integers(-2, window_size, size=num_steps).tolist()
+    calls = iter(zip(true_actions, policies))
+    result["reward"] = measure(lambda: reward(*next(calls)), repeat=1, number=num_steps)
+    result["reward_batch"] = measure(lambda: reward.batch(true_actions, policies))
+
+    reset()
+    env.render("rgb_array")  # the first render creates the surfaces
+    result["render_rgb_array"] = measure(lambda: env.render("rgb_array"), number=5)
+    env.close()
+
+    param.renderer_options = {}
+    env = make_env(param, score_measures)
+    env.reset(seed=seed)
+    env.render("human")
+    result["render_human"] = measure(lambda: env.render("human"), number=5)
+    env.close()
+
+    return result
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=Path(__file__).parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(
+    score_root: Path,
+    window_sizes: list[int],
+    memory_sizes: list[int],
+    fps_values: list[int],
+    num_measures_values: list[int],
+    num_steps: int,
+) -> dict:
+    results = []
+    configs = itertools.product(
+        window_sizes, memory_sizes, fps_values, num_measures_values
+    )
+    for window_size, memory_size, fps, num_measures in configs:
+        config = {
+            "window_size": window_size,
+            "memory_size": memory_size,
+            "fps": fps,
+            "num_measures": num_measures,  # 0: the score as is
+            "num_steps": num_steps,
+        }
+        print(json.dumps(config), flush=True)
+        try:
+            metrics = bench_config(score_root, **config)
+        except ValueError as error:
+            # e.g. a window larger than the score or than the visible staves
+            results.append({"config": config, "error": str(error)})
+            continue
+        results.append({"config": config, "metrics": metrics})
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "created": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "score_root": str(score_root),
+        },
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="benchmark env throughput")
+    parser.add_argument("--output", type=Path, default=Path("bench.json"))
+    parser.add_argument("--score-root", type=Path, default=SAMPLES_ROOT)
+    parser.add_argument("--window-sizes", type=int, nargs="+", default=[16, 24])
+    parser.add_argument("--memory-sizes", type=int, nargs="+", default=[16])
+    parser.add_argument("--fps", type=int, nargs="+", default=[20])
+    parser.add_argument("--num-measures", type=int, nargs="+", default=[0, 128])
+    parser.add_argument("--num-steps", type=int, default=200)
+    args = parser.parse_args()
+
+    report = run(
+        args.score_root,
+        args.window_sizes,
+        args.memory_sizes,
+        args.fps,
+        args.num_measures,
+        args.num_steps,
+    )
+    args.output.write_text(json.dumps(report, indent=2))
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+# Accuracy and throughput of the similarity backends (context managers) on
+# the same record. Each episode follows the record with the true actions, and
+# after every step the backend is scored on whether the measure being played
+# ranks first (top1) or within the best three (top3) by its similarity:
+#
+#   python -m benchmarks.bench_similarity --output similarity.json
+
+from argparse import ArgumentParser
+import json
+import os
+from pathlib import Path
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import numpy as np
+
+from benchmarks.bench_env import RECORD_NAME, SAMPLES_ROOT, git_commit, summarize
+from measure_following_game.environment import *
+
+
+def oracle_policy(num_actions: int, true_action: int) -> np.ndarray:
+    # moves to the measure being played, or slides once it left the window
+    policy = np.zeros(num_actions, dtype=np.float32)
+    policy[true_action if true_action >= 0 else -2] = 1.0
+    return policy
+
+
+def bench_manager(
+    score_root: Path,
+    manager_id: str,
+    window_size: int,
+    fps: int,
+    num_episodes: int,
+    seed: int = 0,
+) -> dict:
+    param = make_env_param(
+        score_root=score_root,
+        record_name=RECORD_NAME,
+        window_size=window_size,
+        fps=fps,
+        manager_id=manager_id,
+        renderer_id="layout",
+        validation="off",
+    )
+    env = make_env(param)
+    manager = env.manager
+
+    fill_timings, ranks = [], []
+    for episode in range(num_episodes):
+        np.random.seed(seed + episode)
+        env.reset(seed=seed + episode)
+        done = False
+        while not done:
+            true_action = manager.record.true_action - manager.window_head
+            if not 0 <= true_action < manager.num_window_measures:
+                true_action = -1
+            policy = oracle_policy(manager.num_actions, true_action)
+
+            start = time.perf_counter()
+            _, _, done, _ = env.step(policy)
+            fill_timings.append(time.perf_counter() - start)
+
+            true_action = manager.record.true_action - manager.window_head
+            num_measures = manager.num_window_measures
+            if not done and 0 <= true_action < num_measures:
+                similarities = manager.similarity_matrix[:num_measures, 0]
+                ranks.append(int(np.sum(similarities > similarities[true_action])))
+    env.close()
+
+    ranks = np.asarray(ranks)
+    return {
+        "step": summarize(fill_timings),
+        "steps_per_sec": len(fill_timings) / max(sum(fill_timings), 1e-12),
+        "num_scored": len(ranks),
+        "top1": float(np.mean(ranks < 1)) if len(ranks) else float("nan"),
+        "top3": float(np.mean(ranks < 3)) if len(ranks) else float("nan"),
+    }
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="benchmark similarity backends")
+    parser.add_argument("--output", type=Path, default=Path("similarity.json"))
+    parser.add_argument("--score-root", type=Path, default=SAMPLES_ROOT)
+    parser.add_argument("--manager-ids", nargs="+", default=["midi", "chroma"])
+    parser.add_argument("--window-size", type=int, default=16)
+    parser.add_argument("--fps", type=int, nargs="+", default=[20, 50])
+    parser.add_argument("--num-episodes", type=int, default=3)
+    args = parser.parse_args()
+
+    results = []
+    for manager_id in args.manager_ids:
+        for fps in args.fps:
+            config = {"manager_id": manager_id, "fps": fps}
+            print(json.dumps(config), flush=True)
+            metrics = bench_manager(
+                args.score_root,
+                manager_id,
+                args.window_size,
+                fps,
+                args.num_episodes,
+            )
+            results.append({"config": config, "metrics": metrics})
+
+    report = {
+        "meta": {"commit": git_commit(), "score_root": str(args.score_root)},
+        "results": results,
+    }
+    args.output.write_text(json.dumps(report, indent=2))
@@ -1,7 +1,15 @@
 # -*- coding: utf-8 -*-
 
+from measure_following_game.environment.async_vector import *
+from measure_following_game.environment.cache import *
 from measure_following_game.environment.context import *
 from measure_following_game.environment.env import *
+from measure_following_game.environment.features import *
 from measure_following_game.environment.param import *
+from measure_following_game.environment.record import *
 from measure_following_game.environment.rewards import *
+from measure_following_game.environment.vector import *
 from measure_following_game.environment.utils import *
+from measure_following_game.environment.precompute import *
+from measure_following_game.environment.realtime import *
+from measure_following_game.environment.recorder import *
@@ -0,0 +1,313 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ["AsyncVectorMeasureFollowingEnv"]
+
+from collections.abc import Callable, Sequence
+import multiprocessing as mp
+from multiprocessing.shared_memory import SharedMemory
+import os
+import traceback
+
+from gym import spaces
+import numpy as np
+import numpy.typing as npt
+
+from measure_following_game.environment.env import MeasureFollowingEnv
+from measure_following_game.environment.vector import VectorMeasureFollowingEnv
+
+EnvsFn = Callable[[int], Sequence[MeasureFollowingEnv]]
+
+
+def _buffer_specs(num_envs: int, spec: dict) -> dict[str, tuple[tuple, np.dtype]]:
+    window_shape, memory_shape = spec["window_shape"], spec["memory_shape"]
+    return {
+        "actions": ((num_envs, spec["num_actions"]), np.dtype(np.float32)),
+        "similarity_matrices": ((num_envs, *window_shape), np.dtype(np.float32)),
+        "policy_memories": ((num_envs, *memory_shape), np.dtype(np.float32)),
+        "step_rewards": ((num_envs,), np.dtype(np.float32)),
+        "dones": ((num_envs,), np.dtype(bool)),
+        "final_similarity_matrices": ((num_envs, *window_shape), np.dtype(np.float32)),
+        "final_policy_memories": ((num_envs, *memory_shape), np.dtype(np.float32)),
+    }
+
+
+def _attach(blocks: dict[str, SharedMemory], specs: dict) -> dict[str, np.ndarray]:
+    return {
+        name: np.ndarray(shape, dtype=dtype, buffer=blocks[name].buf)
+        for name, (shape, dtype) in specs.items()
+    }
+
+
+def _worker(make_envs: EnvsFn, head: int, tail: int, pipe, parent_pipe):
+    parent_pipe.close()
+    blocks, arrays, vector_env = {}, {}, None
+    try:
+        vector_env = VectorMeasureFollowingEnv(make_envs(tail - head))
+        pipe.send(
+            (
+                "ready",
+                {
+                    "num_actions": vector_env.num_actions,
+                    "window_shape": vector_env.window_shape,
+                    "memory_shape": vector_env.memory_shape,
+                    "metadata": vector_env.metadata,
+                    "reward_range": vector_env.reward_range,
+                },
+            )
+        )
+
+        _, (names, specs) = pipe.recv()
+        blocks = {name: SharedMemory(name=names[name]) for name in specs}
+        arrays = {k: v[head:tail] for k, v in _attach(blocks, specs).items()}
+        vector_env.bind_buffers(
+            arrays["similarity_matrices"],
+            arrays["policy_memories"],
+            arrays["step_rewards"],
+            arrays["dones"],
+        )
+        pipe.send(("ok", None))
+
+        while True:
+            command, data = pipe.recv()
+            if command == "step":
+                _, _, _, infos = vector_env.step(arrays["actions"])
+                # final observations of auto-reset episodes go through shared
+                # memory as well; only the (small) info dicts are pickled
+                for idx, info in enumerate(infos):
+                    final_observation = info.pop("final_observation", None)
+                    if final_observation is not None:
+                        arrays["final_similarity_matrices"][idx] = final_observation[0]
+                        arrays["final_policy_memories"][idx] = final_observation[1]
+                pipe.send(("ok", infos))
+            elif command == "reset":
+                _, infos = vector_env.reset(return_info=True, **data)
+                pipe.send(("ok", infos))
+            elif command == "close":
+                pipe.send(("ok", None))
+                break
+            else:
+                raise KeyError(f"unknown command: {command}")
+    except (KeyboardInterrupt, EOFError, BrokenPipeError):
+        pass  # interrupted, or the parent went away
+    except Exception:
+        try:
+            pipe.send(("error", traceback.format_exc()))
+        except BrokenPipeError:
+            pass
+    finally:
+        if vector_env is not None:
+            vector_env.close()
+        # views must be released before the blocks can be closed
+        vector_env = arrays = None
+        for block in blocks.values():
+            block.close()
+        pipe.close()
+
+
+class AsyncVectorMeasureFollowingEnv(object):
+    def __init__(
+        self,
+        make_envs: EnvsFn,
+        num_envs: int,
+        num_workers: int | None = None,
+        context: str | None = "spawn",
+    ):
+        self.num_envs = num_envs
+        self.num_workers = min(num_workers or os.cpu_count() or 1, num_envs)
+        self.closed = False
+        self.waiting = False
+        self.processes, self.pipes, self.blocks, self.arrays = [], [], {}, {}
+
+        # each worker owns a contiguous slice of the environments
+        bounds = np.linspace(0, num_envs, self.num_workers + 1).astype(int)
+        self.slices = list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+
+        ctx = mp.get_context(context)
+        for head, tail in self.slices:
+            parent_pipe, child_pipe = ctx.Pipe()
+            process = ctx.Process(
+                target=_worker,
+                args=(make_envs, head, tail, child_pipe, parent_pipe),
+                daemon=True,
+            )
+            process.start()
+            child_pipe.close()
+            self.processes.append(process)
+            self.pipes.append(parent_pipe)
+
+        spec = self._receive_all()[0]
+        specs = _buffer_specs(num_envs, spec)
+        for name, (shape, dtype) in specs.items():
+            size = max(int(np.prod(shape)) * dtype.itemsize, 1)
+            self.blocks[name] = SharedMemory(create=True, size=size)
+        self.arrays = _attach(self.blocks, specs)
+        names = {name: block.name for name, block in self.blocks.items()}
+        self._send_all("bind", (names, specs))
+        self._receive_all()
+
+        self.num_actions = spec["num_actions"]
+        self.window_shape = spec["window_shape"]
+        self.memory_shape = spec["memory_shape"]
+        self.metadata = spec["metadata"]
+        self.reward_range = spec["reward_range"]
+        self.action_space = spaces.Box(
+            low=0.0, high=1.0, shape=(num_envs, self.num_actions)
+        )
+        self.observation_space = spaces.Tuple(
+            (
+                spaces.Box(low=0.0, high=1.0, shape=(num_envs, *self.window_shape)),
+                spaces.Box(low=0.0, high=1.0, shape=(num_envs, *self.memory_shape)),
+            )
+        )
+
+    @property
+    def observations(self) -> tuple[np.ndarray, np.ndarray]:
+        # views of the shared buffers; callers that keep them must copy
+        return (self.arrays["similarity_matrices"], self.arrays["policy_memories"])
+
+    def _send_all(self, command: str, data=None):
+        self._send_each([(command, data)] * len(self.pipes))
+
+    def _send_each(self, messages: list[tuple]):
+        errors = []
+        for idx, (pipe, message) in enumerate(zip(self.pipes, messages)):
+            try:
+                pipe.send(message)
+            except (BrokenPipeError, ConnectionResetError):
+                process = self.processes[idx]
+                process.join(timeout=1.0)
+                errors.append(f"worker {idx} died (exit code {process.exitcode})")
+
+        if errors:
+            self.close(terminate=True)
+            raise RuntimeError("\n".join(errors))
+
+    def _receive_all(self, timeout: float | None = None) -> list:
+        results, errors = [], []
+        for idx, (pipe, process) in enumerate(zip(self.pipes, self.processes)):
+            try:
+                if timeout is not None and not pipe.poll(timeout):
+                    # replies of the other workers would be read by the next
+                    # step, so the environment cannot be used any more
+                    self.close(terminate=True)
+                    raise TimeoutError(f"worker {idx} did not respond in time")
+                status, data = pipe.recv()
+            except (EOFError, ConnectionResetError, BrokenPipeError):
+                process.join(timeout=1.0)
+                errors.append(f"worker {idx} died (exit code {process.exitcode})")
+                continue
+            if status == "error":
+                errors.append(f"worker {idx} raised:\n{data}")
+            else:
+                results.append(data)
+
+        if errors:
+            self.close(terminate=True)
+            raise RuntimeError("\n".join(errors))
+        return results
+
+    def _check_open(self):
+        if self.closed:
+            raise RuntimeError("the environment is closed")
+
+    def step_async(self, pred_policies: npt.NDArray[np.float32]):
+        self._check_open()
+        if self.waiting:
+            raise RuntimeError("`step_wait` must be called before stepping again")
+        pred_policies = np.asarray(pred_policies, dtype=np.float32)
+        if pred_policies.shape != (self.num_envs, self.num_actions):
+            raise ValueError(f"invalid policy shape: {pred_policies.shape}")
+        self.arrays["actions"][:] = pred_policies
+        self._send_all("step")
+        self.waiting = True
+
+    def step_wait(
+        self, timeout: float | None = None
+    ) -> tuple[tuple[np.ndarray, np.ndarray], np.ndarray, np.ndarray, list[dict]]:
+        if not self.waiting:
+            raise RuntimeError("`step_async` must be called first")
+        self.waiting = False
+
+        infos = [info for infos in self._receive_all(timeout) for info in infos]
+        for idx in np.flatnonzero(self.arrays["dones"]):
+            infos[idx]["final_observation"] = (
+                self.arrays["final_similarity_matrices"][idx].copy(),
+                self.arrays["final_policy_memories"][idx].copy(),
+            )
+        return (
+            self.observations,
+            self.arrays["step_rewards"],
+            self.arrays["dones"],
+            infos,
+        )
+
+    def step(self, pred_policies: npt.NDArray[np.float32]):
+        self.step_async(pred_policies)
+        return self.step_wait()
+
+    def reset(
+        self,
+        *,
+        seed: int | Sequence[int | None] | None = None,
+        return_info: bool = False,
+        options: dict | None = None,
+    ):
+        self._check_open()
+        if self.waiting:
+            raise RuntimeError("`step_wait` must be called before resetting")
+        if seed is None or isinstance(seed, int):
+            seeds = [None if seed is None else seed + i for i in range(self.num_envs)]
+        else:
+            seeds = list(seed)
+            if len(seeds) != self.num_envs:
+                raise ValueError("`seed` must have one entry per environment")
+
+        self._send_each(
+            [
+                ("reset", {"seed": seeds[head:tail], "options": options})
+                for head, tail in self.slices
+            ]
+        )
+        infos = [info for infos in self._receive_all() for info in infos]
+
+        if return_info:
+            return self.observations, infos
+        else:
+            return self.observations
+
+    def close(self, terminate: bool = False):
+        if self.closed:
+            return
+        self.closed = True
+
+        if not terminate:
+            for pipe, process in zip(self.pipes, self.processes):
+                if process.is_alive():
+                    try:
+                        pipe.send(("close", None))
+                        pipe.recv()
+                    except (EOFError, ConnectionResetError, BrokenPipeError):
+                        pass
+        for process in self.processes:
+            if terminate and process.is_alive():
+                process.terminate()
+            process.join(timeout=1.0 if terminate else 5.0)
+            if process.is_alive():
+                # SDL may swallow SIGTERM in workers that initialized pygame
+                process.kill()
+                process.join()
+        for pipe in self.pipes:
+            pipe.close()
+
+        self.arrays = {}
+        for block in self.blocks.values():
+            try:
+                block.close()
+            except BufferError:
+                pass  # callers still hold views of the buffer
+            block.unlink()
+        self.blocks = {}
+
+    def __del__(self):
+        if hasattr(self, "closed"):
+            self.close()
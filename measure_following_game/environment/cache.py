@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+
+__all__ = [
+    "check_similarity_cache",
+    "get_cache_dir",
+    "get_library_version",
+    "get_record_files",
+    "get_score_files",
+    "get_similarity_cache_path",
+    "hash_inputs",
+    "load_score_measures",
+]
+
+from collections.abc import Iterable
+import functools
+import hashlib
+from importlib import import_module
+from importlib.metadata import PackageNotFoundError, packages_distributions, version
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+from beartype import beartype
+from sabanamusic.common.types import PathLike
+from sabanamusic.models.musical import MIDIRecord, make_score_measures
+
+from measure_following_game.environment.features import ScoreFeatureStore
+from measure_following_game.environment.param import EnvParam
+
+CACHE_DIRNAME = ".cache"
+SCORE_CACHE_VERSION = 2
+SIMILARITY_CACHE_VERSION = 2
+
+
+def get_cache_dir(score_root: PathLike) -> Path:
+    return Path(score_root) / CACHE_DIRNAME
+
+
+def get_score_files(score_root: PathLike) -> list[Path]:
+    return sorted(p for p in Path(score_root).glob("score.*") if p.is_file())
+
+
+def get_record_files(record_root: PathLike) -> list[Path]:
+    record_root = Path(record_root)
+    if record_root.is_file():
+        return [record_root]
+    pattern = f"{record_root.name}.*"
+    return sorted(p for p in record_root.parent.glob(pattern) if p.is_file())
+
+
+@functools.cache
+def get_library_version(module_name: str = "sabanamusic") -> str:
+    # version of the installed distribution providing `module_name`
+    for distribution in packages_distributions().get(module_name, []):
+        try:
+            return version(distribution)
+        except PackageNotFoundError:
+            continue
+    return str(getattr(import_module(module_name), "__version__", "unknown"))
+
+
+def hash_inputs(paths: Iterable[PathLike], **params) -> str:
+    # content hash of the given files plus any (json-serializable) parameters.
+    # the parser version is part of every key, so upgrading sabanamusic
+    # invalidates what it parsed or computed
+    digest = hashlib.sha256()
+    digest.update(f"sabanamusic={get_library_version()}".encode())
+    for path in paths:
+        path = Path(path)
+        digest.update(path.name.encode())
+        digest.update(path.read_bytes())
+    digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+    return digest.hexdigest()[:16]
+
+
+def _read_score_timing(score_root: PathLike, num_measures: int):
+    # onsets and durations (in seconds) of the measures, if the score has them
+    csv_path = Path(score_root) / "score.csv"
+    if not csv_path.is_file():
+        return None, None
+    table = np.genfromtxt(csv_path, delimiter=",", names=True, ndmin=1)
+    names = table.dtype.names or ()
+    if len(table) != num_measures or not {"onset", "duration"} <= set(names):
+        return None, None
+    return table["onset"].astype(np.float64), table["duration"].astype(np.float64)
+
+
+def load_score_measures(
+    score_root: PathLike,
+    fps: int = 20,
+    onset_only: bool = True,
+    cache_dir: PathLike | None = None,
+) -> ScoreFeatureStore:
+    # parsed measure features keyed by the content of the score files, so the
+    # cache is invalidated when they or `fps`/`onset_only` change
+    key = hash_inputs(
+        get_score_files(score_root),
+        version=SCORE_CACHE_VERSION,
+        fps=fps,
+        onset_only=onset_only,
+    )
+    cache_dir = get_cache_dir(score_root) if cache_dir is None else Path(cache_dir)
+    cache_path = cache_dir / f"measures_{key}.npz"
+
+    if cache_path.exists():
+        with np.load(cache_path) as packed:
+            return ScoreFeatureStore(**packed)
+
+    score_measures = make_score_measures(
+        score_root=score_root, fps=fps, onset_only=onset_only
+    )
+    onsets, durations = _read_score_timing(score_root, len(score_measures))
+    store = ScoreFeatureStore.from_measures(score_measures, onsets, durations)
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        temp_path = cache_path.with_name(f"{cache_path.stem}.{os.getpid()}.tmp")
+        with open(temp_path, "wb") as file:
+            np.savez_compressed(file, **store.arrays)
+        os.replace(temp_path, cache_path)
+    except OSError:
+        pass  # read-only score directories are used without a cache
+    return store
+
+
+@beartype
+def get_similarity_cache_path(param: EnvParam) -> Path:
+    if param.record_name is None:
+        raise ValueError("similarity caches need an explicit `record_name`")
+    if param.manager_id.lower() != "midi":
+        raise KeyError(f"Unsupported manager id: {param.manager_id}")
+
+    record_root, _ = MIDIRecord.get_valid_record_root(
+        param.score_root, param.record_name
+    )
+    key = hash_inputs(
+        [*get_score_files(param.score_root), *get_record_files(record_root)],
+        version=SIMILARITY_CACHE_VERSION,
+        fps=param.fps,
+        onset_only=param.onset_only,
+        buffer_duration=param.buffer_duration,
+        buffer_step_size=param.buffer_step_size,
+        record_options=param.record_options,
+    )
+    return get_cache_dir(param.score_root) / f"similarity_{key}.npy"
+
+
+@beartype
+def check_similarity_cache(param: EnvParam, cache_path: PathLike):
+    # the file name carries the key of the inputs it was computed from, so a
+    # cache of another record, score or buffer setting is rejected (the file
+    # itself may be moved)
+    expected_path = get_similarity_cache_path(param)
+    if Path(cache_path).name != expected_path.name:
+        raise ValueError(
+            f"similarity cache {cache_path} does not match the environment, "
+            f"expected {expected_path.name}"
+        )
@@ -2,3 +2,4 @@
 
 from measure_following_game.environment.context.manager.base import *
 from measure_following_game.environment.context.manager.midi import *
+from measure_following_game.environment.context.manager.chroma import *
@@ -1,17 +1,55 @@
 # -*- coding: utf-8 -*-
 
-__all__ = ["ContextManager"]
+__all__ = ["ContextManager", "ContextState"]
 
 from abc import abstractmethod
-from typing import ClassVar
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Any, ClassVar
 
 from beartype import beartype
 import numpy as np
-from sabanamusic.models.musical import Measure, Record
+from sabanamusic.models.musical import Record
 from sabanamusic.common.types import Index, PositiveInt
 
 from measure_following_game.environment.context.renderer import ContextRenderer
+from measure_following_game.environment.features import (
+    PitchHistogramIndex,
+    ScoreFeatureStore,
+)
+from measure_following_game.environment.record import (
+    get_record_state,
+    set_record_state,
+)
+from measure_following_game.profiling import StepProfiler
 from measure_following_game.types import ActType, ObsType
+from measure_following_game.validation import validated
+
+
+def _frozen(array: np.ndarray) -> np.ndarray:
+    array = array.copy()
+    array.flags.writeable = False
+    return array
+
+
+@dataclass(frozen=True)
+class ContextState:
+    # everything a step depends on, to branch an episode for lookahead search
+    # without copying the environment. the score is shared, arrays are
+    # read-only copies and `backend` holds the state of the similarity backend
+    renderer: Any
+    record: Mapping
+    similarity_matrix: np.ndarray
+    policy_memory: np.ndarray
+    pred_policy: np.ndarray | None
+    true_action: int
+    done: bool
+    record_steps: int
+    candidates: np.ndarray
+    candidate_scores: np.ndarray
+    random_state: tuple
+    backend: Mapping = field(default_factory=lambda: MappingProxyType({}))
 
 
 class ContextManager(object):
@@ -26,14 +64,22 @@ class ContextManager(object):
         record: Record,
         window_size: PositiveInt = 16,
         memory_size: PositiveInt = 16,
+        decision_interval: PositiveInt = 1,
+        onset_trigger: bool = False,
+        num_candidates: int = 0,
         **kwargs,
     ):
         self.record = record
 
         self.renderer = renderer
+        self.validation = renderer.validation
         self.score_measures = renderer.score_measures
         self.num_score_measures = renderer.num_score_measures
-        self.metadata["render_modes"] = renderer.render_modes
+        # per instance: renderers (and so managers) differ in render modes
+        self.metadata = {
+            **type(self).metadata,
+            "render_modes": list(renderer.render_modes),
+        }
 
         if window_size > self.num_score_measures:
             raise ValueError(
@@ -59,6 +105,29 @@ class ContextManager(object):
         self.policy_memory = np.zeros(shape=self.memory_shape, dtype=np.float32)
 
         self.done = False
+        self.record_steps = 0  # record steps since the last reset
+
+        # frame skip: a step advances the record up to `decision_interval`
+        # frames and computes the similarity only at the next decision point,
+        # which `onset_trigger` brings forward to the first frame with onsets
+        self.decision_interval = decision_interval
+        self.onset_trigger = onset_trigger
+        self.skipped_true_actions: list[int] = []
+
+        # relocalization: the `num_candidates` score measures whose pitch
+        # histograms best match the record buffer, searched over the whole
+        # score at every decision point and reported in info["candidates"]
+        self.num_candidates = num_candidates
+        self.candidate_index: PitchHistogramIndex | None = None
+        if num_candidates > 0:
+            self.candidate_index = PitchHistogramIndex.from_store(self.score_measures)
+        self.candidates = np.empty(0, dtype=np.int64)
+        self.candidate_scores = np.empty(0, dtype=np.float32)
+
+        # opt-in phase timings and counters, reported under info["profile"]
+        self.profiler: StepProfiler | None = None
+        if kwargs.get("profile") is True or kwargs.get("profile_hook") is not None:
+            self.profiler = StepProfiler(kwargs.get("profile_hook"))
 
     @property
     def window_head(self) -> Index:
@@ -69,7 +138,8 @@ class ContextManager(object):
         return self.renderer.num_window_measures
 
     @property
-    def window_measures(self) -> list[Measure]:
+    def window_measures(self) -> ScoreFeatureStore:
+        # views into the score features, nothing is copied
         head = self.window_head
         tail = self.window_head + self.num_window_measures
         return self.score_measures[head:tail]
@@ -102,8 +172,138 @@ class ContextManager(object):
     def _fill_similarity_matrix(self):
         raise NotImplementedError()
 
-    @beartype
+    def _update_candidates(self):
+        if self.candidate_index is None:
+            return
+        record_histogram = self.record.get_pitch_histogram(
+            (0, max(self.record.num_frames, 1))
+        )
+        self.candidates, self.candidate_scores = self.candidate_index.query(
+            record_histogram, self.num_candidates
+        )
+        if self.profiler is not None:
+            self.profiler.lap("update_candidates")
+
+    def _step_info(self) -> dict:
+        # info of the subclass, with the channels of the base manager
+        info = self.info
+        if self.candidate_index is not None:
+            info = dict(info)
+            info["candidates"] = self.candidates.copy()
+            info["candidate_scores"] = self.candidate_scores.copy()
+        return info
+
+    def _has_new_onsets(self) -> bool:
+        onset_indices = self.record.onset_indices
+        return (
+            len(onset_indices) > 0 and onset_indices[-1] == self.record.num_frames - 1
+        )
+
+    def _skip_frames(self):
+        # moves the record on to the next decision point. the true actions of
+        # the skipped frames are kept for the reward; skipping stops early
+        # when the true measure leaves the window
+        self.skipped_true_actions = []
+        for _ in range(self.decision_interval - 1):
+            if self.record.done or (self.onset_trigger and self._has_new_onsets()):
+                break
+            true_action = self.record.true_action - self.window_head
+            if not (0 <= true_action < self.num_window_measures):
+                break
+            self.skipped_true_actions.append(true_action)
+            self.record.step()
+            self.record_steps += 1
+
+    def _advance(self, skip: bool = True):
+        # navigates by `pred_policy`, then moves the record to its next frame
+        # (or decision point, with `skip`)
+        profiler = self.profiler
+        self._fill_policy_memory()
+
+        pred_action = np.argmax(self.pred_policy)
+        if pred_action == self.num_actions - 1:
+            self.renderer.stay()
+            action_name = "stays"
+        elif pred_action == self.num_actions - 2:
+            self.renderer.slide()
+            action_name = "slides"
+        else:
+            self.renderer.step(self.pred_policy)
+            action_name = "moves"
+        if profiler is not None:
+            profiler.lap("navigate")
+            profiler.count(action_name)
+
+        self.record.step()
+        self.record_steps += 1
+        if skip:
+            self._skip_frames()
+        if profiler is not None:
+            profiler.lap("record_step")
+        self._fill_similarity_matrix()
+        if profiler is not None:
+            profiler.lap("fill_similarity_matrix")
+        self._update_candidates()
+
+    @validated
+    def relocalize(self, rank: int = 0) -> bool:
+        # jumps to the `rank`-th candidate measure of the last decision point
+        # (e.g. after the follower got lost) and refills the similarity
+        # matrix for the new window. returns whether the renderer could jump
+        if not 0 <= rank < len(self.candidates):
+            return False
+        if not self.renderer.jump(int(self.candidates[rank])):
+            return False
+        self._fill_similarity_matrix()
+        return True
+
+    def _get_backend_state(self) -> dict:
+        return {}
+
+    def _set_backend_state(self, state: Mapping):
+        pass
+
+    def get_state(self) -> ContextState:
+        pred_policy = self.pred_policy
+        return ContextState(
+            self.renderer.get_state(),
+            get_record_state(self.record),
+            _frozen(self.similarity_matrix),
+            _frozen(self.policy_memory),
+            None if pred_policy is None else _frozen(pred_policy),
+            self.true_action,
+            self.done,
+            self.record_steps,
+            self.candidates,
+            self.candidate_scores,
+            np.random.get_state(),
+            MappingProxyType(self._get_backend_state()),
+        )
+
+    @validated
+    def set_state(self, state: ContextState):
+        # restores a state of `get_state`, which can be restored again. the
+        # observation arrays are updated in place and nothing is rendered
+        self.renderer.set_state(state.renderer)
+        set_record_state(self.record, state.record)
+        np.copyto(self.similarity_matrix, state.similarity_matrix)
+        np.copyto(self.policy_memory, state.policy_memory)
+        pred_policy = state.pred_policy
+        self.pred_policy = None if pred_policy is None else pred_policy.copy()
+        self.true_action = state.true_action
+        self.done = state.done
+        self.record_steps = state.record_steps
+        self.skipped_true_actions = []
+        self.candidates = state.candidates
+        self.candidate_scores = state.candidate_scores
+        np.random.set_state(state.random_state)
+        self._set_backend_state(state.backend)
+
+    @validated
     def step(self, pred_policy: ActType) -> tuple[ObsType, int, bool, dict]:
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.begin()
         self.pred_policy = pred_policy
 
         if self.done:
@@ -116,23 +316,45 @@ class ContextManager(object):
                 self.done = True
                 self.true_action = -1
             else:
-                self._fill_policy_memory()
-
-                pred_action = np.argmax(self.pred_policy)
-                if pred_action == self.num_actions - 1:
-                    self.renderer.stay()
-                elif pred_action == self.num_actions - 2:
-                    self.renderer.slide()
-                else:
-                    self.renderer.step(self.pred_policy)
-
-                self.record.step()
-                self._fill_similarity_matrix()
+                self._advance()
                 self.done = self.record.done
 
-        return self.observation, self.true_action, self.done, self.info
-
-    @beartype
+        info = self._step_info()
+        if self.decision_interval > 1:
+            info = dict(info)
+            info["skipped_true_actions"] = self.skipped_true_actions
+            self.skipped_true_actions = []
+        if profiler is not None:
+            info = dict(info)
+            info["profile"] = profiler.end("step")
+        return self.observation, self.true_action, self.done, info
+
+    @validated
+    def follow(self, pred_policy: ActType) -> ObsType:
+        # live counterpart of `step` for records without ground truth: there
+        # is no true action, and the episode only ends when the record does.
+        # a live frame can only be closed once it has ended, so `follow`
+        # closes exactly one; frames between decision points are closed by
+        # `skip_frame` at their own end
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.begin()
+        self.pred_policy = pred_policy
+        if not self.done:
+            self._advance(skip=False)
+            self.done = self.record.done
+        if profiler is not None:
+            profiler.end("follow")
+        return self.observation
+
+    def skip_frame(self):
+        # closes the next record frame without a decision
+        if not self.done:
+            self.record.step()
+            self.record_steps += 1
+            self.done = self.record.done
+
+    @validated
     def reset(
         self,
         *,
@@ -148,24 +370,47 @@ class ContextManager(object):
             if isinstance(options.get("renderer"), dict):
                 renderer_options = options["renderer"]
 
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.reset()
+            profiler.begin()
+
         start_measure = self.renderer.reset(seed=seed, options=renderer_options)
+        if profiler is not None:
+            profiler.lap("renderer_reset")
         self.record.reset(start_measure, seed=seed, options=record_options)
+        if profiler is not None:
+            profiler.lap("record_reset")
 
+        self.done = False
+        self.record_steps = 0
+        self.skipped_true_actions = []
         self.true_action = -1
         self._init_pred_policy()
         self._init_policy_memory()
         self._fill_similarity_matrix()
+        if profiler is not None:
+            profiler.lap("fill_similarity_matrix")
+        self._update_candidates()
+
+        info = self._step_info()
+        if profiler is not None:
+            info = dict(info)
+            info["profile"] = profiler.end("reset")
 
         if return_info:
-            return self.observation, self.info
+            return self.observation, info
         else:
             return self.observation
 
-    @beartype
-    def render(self, mode: str = "human"):
+    @validated
+    def render(self, mode: str = "human", out: np.ndarray | None = None):
+        # `out`: a preallocated buffer for rgb_array frames
         if mode not in self.metadata["render_modes"]:
             raise KeyError(f"unsupported mode: {mode}")
-        return self.renderer.render(mode=mode)
+        if out is None:
+            return self.renderer.render(mode=mode)
+        return self.renderer.render(mode=mode, out=out)
 
     def close(self):
         self.renderer.close()
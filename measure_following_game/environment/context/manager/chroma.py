@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ["ChromaContextManager"]
+
+from typing import ClassVar
+
+from beartype import beartype
+import numpy as np
+from sabanamusic.common.types import PositiveInt
+from sabanamusic.models.musical import MIDIRecord
+from sabanamusic.similarity.utils import get_actual_alignment
+
+from measure_following_game.environment.context.manager.base import ContextManager
+from measure_following_game.environment.context.renderer import ContextRenderer
+from measure_following_game.environment.features import ScoreFeatureStore
+from measure_following_game.environment.record import StreamingRecord
+from measure_following_game.similarity import (
+    SlidingChromaCorrelation,
+    as_frames,
+    to_chroma,
+)
+
+
+class ChromaContextManager(ContextManager):
+
+    # Similarity features from the chroma of the window measures, correlated
+    # with the chroma of the record buffer at every offset by FFTs. The
+    # features share the layout of `MIDIContextManager` (similarity,
+    # subsequence offset, subsequence size), so agents can switch backends.
+
+    num_features: ClassVar[PositiveInt] = 3
+
+    @beartype
+    def __init__(
+        self,
+        renderer: ContextRenderer,
+        record: MIDIRecord | StreamingRecord,
+        window_size: PositiveInt = 16,
+        memory_size: PositiveInt = 16,
+        **kwargs,
+    ):
+        super(ChromaContextManager, self).__init__(
+            renderer, record, window_size, memory_size, **kwargs
+        )
+
+        store = self.score_measures
+        chroma_measures = ScoreFeatureStore(
+            to_chroma(store.repr_frames), store.repr_offsets, store.pitch_histograms
+        )
+        self.correlation = SlidingChromaCorrelation(
+            *chroma_measures.pad_repr_sequences()
+        )
+
+    @property
+    def info(self) -> dict:
+        return {}
+
+    def _fill_similarity_matrix(self):
+        record = self.record
+        num_measures = self.num_window_measures
+        window_keys = np.arange(self.window_head, self.window_head + num_measures)
+        record_chroma = to_chroma(as_frames(record.get_repr_sequence()))
+        scores, heads, tails = self.correlation.correlate(window_keys, record_chroma)
+        if self.profiler is not None:
+            self.profiler.count("correlations", num_measures)
+
+        if record.onset_only:
+            # chroma frames are onset frames; alignments are mapped to frames
+            onset_indices = record.onset_indices
+            resolved = {}
+            for idx, alignment in enumerate(zip(heads.tolist(), tails.tolist())):
+                if alignment not in resolved:
+                    resolved[alignment] = get_actual_alignment(alignment, onset_indices)
+                heads[idx], tails[idx] = resolved[alignment]
+
+        record_num_frames = record.num_frames
+        self.similarity_matrix[:num_measures, 0] = scores
+        self.similarity_matrix[:num_measures, 1] = heads / max(record_num_frames - 1, 1)
+        self.similarity_matrix[:num_measures, 2] = (tails - heads) / max(
+            record_num_frames, 1
+        )
+        self.similarity_matrix[num_measures:] = 0.0
@@ -1,17 +1,171 @@
 # -*- coding: utf-8 -*-
 
-__all__ = ["MIDIContextManager"]
+__all__ = [
+    "MIDIContextManager",
+    "calc_bound_similarities",
+    "calc_bounded_midi_similarity",
+    "calc_cheap_midi_similarity",
+    "calc_compact_midi_similarity",
+    "calc_midi_similarity",
+]
 
+from collections.abc import Mapping
+from pathlib import Path
+import time
 from typing import ClassVar
 
 from beartype import beartype
-from sabanamusic.common.types import PositiveInt
+import numpy as np
+from sabanamusic.common.types import PathLike, PositiveInt
 from sabanamusic.models.musical import MIDIRecord
 from sabanamusic.similarity.algorithms import *
 from sabanamusic.similarity.utils import get_actual_alignment
 
 from measure_following_game.environment.context.manager.base import ContextManager
 from measure_following_game.environment.context.renderer import ContextRenderer
+from measure_following_game.environment.features import ScoreFeatureStore
+from measure_following_game.environment.record import StreamingRecord
+from measure_following_game.similarity import (
+    BatchedSubsequenceDTW,
+    as_frames,
+    frames_fingerprint,
+    lower_bound_envelope,
+    nearest_frame_distances,
+    streamed_suffix,
+)
+
+
+def calc_midi_similarity(
+    similarity_matrix: np.ndarray,
+    dtw: BatchedSubsequenceDTW,
+    measure_histograms: np.ndarray,
+    record: MIDIRecord | StreamingRecord,
+):
+    # fills the first `len(measure_histograms)` rows of `similarity_matrix`
+    # from the DTW state of those measures against the current record buffer
+    onset_only = record.onset_only
+    record_num_frames = record.num_frames
+    record_onset_indices = record.onset_indices
+    num_measures = len(measure_histograms)
+
+    # alignments (and the record histograms over them) are shared by many
+    # measures, so each distinct one is resolved once
+    heads = np.empty(num_measures, dtype=np.int64)
+    tails = np.empty(num_measures, dtype=np.int64)
+    record_histograms = np.empty_like(measure_histograms)
+    resolved = {}
+    for idx, alignment in enumerate(zip(dtw.heads.tolist(), dtw.tails.tolist())):
+        if alignment not in resolved:
+            if onset_only:
+                actual = get_actual_alignment(alignment, record_onset_indices)
+            else:
+                actual = alignment
+            resolved[alignment] = (actual, record.get_pitch_histogram(actual))
+        (heads[idx], tails[idx]), record_histograms[idx] = resolved[alignment]
+
+    timewarping_distances = dtw.distances
+    euclidean_distances = np.linalg.norm(measure_histograms - record_histograms, axis=1)
+
+    # similarity, subsequence offset, sebsequence size
+    similarity_matrix[:num_measures, 0] = [
+        calc_algorithmic_similarity(distances=distances, scales=[1.0, 1.0])
+        for distances in zip(
+            timewarping_distances.tolist(), euclidean_distances.tolist()
+        )
+    ]
+    # a live record starts with a buffer of a single frame
+    similarity_matrix[:num_measures, 1] = heads / max(record_num_frames - 1, 1)
+    similarity_matrix[:num_measures, 2] = (tails - heads) / max(record_num_frames, 1)
+
+
+def calc_compact_midi_similarity(
+    similarity_matrix: np.ndarray,
+    measures: ScoreFeatureStore,
+    record: MIDIRecord | StreamingRecord,
+):
+    # the features of `dtw_compact` from scratch, one measure at a time: the
+    # reference of the streaming engine, and the `compact_dtw` mode
+    onset_only = record.onset_only
+    record_num_frames = record.num_frames
+    record_repr_sequence = record.get_repr_sequence()
+    record_onset_indices = record.onset_indices
+
+    similarity_matrix.fill(0.0)
+    for idx, measure in enumerate(measures):
+        timewarping_distance, (head, tail) = dtw_compact(
+            measure.repr_sequence, record_repr_sequence, subsequence=True
+        )
+
+        if onset_only:
+            head, tail = get_actual_alignment((head, tail), record_onset_indices)
+
+        record_pitch_histogram = record.get_pitch_histogram((head, tail))
+        euclidean_distance = euclidean(measure.pitch_histogram, record_pitch_histogram)
+
+        # similarity, subsequence offset, sebsequence size
+        similarity_matrix[idx, 0] = calc_algorithmic_similarity(
+            distances=[timewarping_distance, euclidean_distance], scales=[1.0, 1.0]
+        )
+        similarity_matrix[idx, 1] = head / max(record_num_frames - 1, 1)
+        similarity_matrix[idx, 2] = (tail - head) / max(record_num_frames, 1)
+
+
+def calc_cheap_midi_similarity(
+    similarity_matrix: np.ndarray,
+    measure_histograms: np.ndarray,
+    measure_densities: np.ndarray,
+    record: MIDIRecord | StreamingRecord,
+) -> np.ndarray:
+    # fallback features without DTW: the pitch histogram distance to the whole
+    # buffer and the difference of onset densities (onsets per frame, skipped
+    # where unknown) make the similarity, the subsequence spans the buffer.
+    # returns the similarities, used to rank measures for exact features
+    num_measures = len(measure_histograms)
+    record_num_frames = max(record.num_frames, 1)
+    record_histogram = record.get_pitch_histogram((0, record_num_frames))
+    euclidean_distances = np.linalg.norm(measure_histograms - record_histogram, axis=1)
+
+    record_density = len(record.onset_indices) / record_num_frames
+    density_distances = np.abs(np.log1p(measure_densities) - np.log1p(record_density))
+    if not record.onset_only:
+        density_distances = np.zeros(num_measures)
+    density_distances = np.nan_to_num(density_distances, nan=0.0, posinf=0.0)
+
+    similarities = np.array(
+        [
+            calc_algorithmic_similarity(distances=distances, scales=[1.0, 1.0])
+            for distances in zip(
+                density_distances.tolist(), euclidean_distances.tolist()
+            )
+        ]
+    )
+    similarity_matrix[:num_measures, 0] = similarities
+    similarity_matrix[:num_measures, 1] = 0.0
+    similarity_matrix[:num_measures, 2] = 1.0
+    return similarities
+
+
+def calc_bound_similarities(lower_bounds: np.ndarray) -> np.ndarray:
+    # upper bounds of the similarities of measures with DTW `lower_bounds`:
+    # the histogram of the aligned span is unknown, so its best case, a
+    # distance of zero, goes with the bound
+    return np.array(
+        [
+            calc_algorithmic_similarity(distances=[bound, 0.0], scales=[1.0, 1.0])
+            for bound in lower_bounds.tolist()
+        ]
+    )
+
+
+def calc_bounded_midi_similarity(
+    similarity_matrix: np.ndarray, lower_bounds: np.ndarray
+):
+    # features of pruned measures: the similarity is bounded from above by
+    # what the measure could reach, and the subsequence spans the buffer
+    num_measures = len(lower_bounds)
+    similarity_matrix[:num_measures, 0] = calc_bound_similarities(lower_bounds)
+    similarity_matrix[:num_measures, 1] = 0.0
+    similarity_matrix[:num_measures, 2] = 1.0
 
 
 class MIDIContextManager(ContextManager):
@@ -22,40 +176,344 @@ class MIDIContextManager(ContextManager):
     def __init__(
         self,
         renderer: ContextRenderer,
-        record: MIDIRecord,
+        record: MIDIRecord | StreamingRecord,
         window_size: PositiveInt = 16,
         memory_size: PositiveInt = 16,
+        similarity_cache: PathLike | None = None,
+        similarity_budget: float | None = None,
+        refine_chunk_size: PositiveInt = 4,
+        prune_ratio: float | None = None,
+        compact_dtw: bool = False,
         **kwargs,
     ):
         super(MIDIContextManager, self).__init__(
-            renderer, record, window_size, memory_size
+            renderer, record, window_size, memory_size, **kwargs
         )
 
-    def _fill_similarity_matrix(self):
-        record: MIDIRecord = self.record
-        onset_only = record.onset_only
-        record_num_frames = record.num_frames
-        record_repr_sequence = record.get_repr_sequence()
-        record_onset_indices = record.onset_indices
+        # batched DTW state of the window measures, keyed by score index
+        self.dtw: BatchedSubsequenceDTW | None = None
+        self.dtw_keys = np.empty(0, dtype=np.int64)
+        self.streamed_sequence: np.ndarray | None = None
+
+        # anytime mode: seconds per fill after which measures keep the cheap
+        # features; `exact_features` marks the rows that are exact DTW features
+        self.similarity_budget = similarity_budget
+        self.refine_chunk_size = refine_chunk_size
+        self.exact_features = np.zeros(window_size, dtype=bool)
+
+        # pruning: measures that replay the buffer skip DTW if the bound of
+        # their similarity is below the best exact one so far divided by
+        # `prune_ratio`. a ratio of 1 never prunes a measure that would beat
+        # the kept ones, larger ones prune less and smaller ones more
+        self.prune_ratio = prune_ratio
+        self.pruned_keys = np.empty(0, dtype=np.int64)
+        self.pruned_bounds = np.empty(0)
+        # nearest-frame distances of pruned measures, by score index, which
+        # are streamed like the DTW state instead of replaying the buffer
+        self.pruned_rows: dict[int, np.ndarray] = {}
+
+        # compact mode: the features of `dtw_compact`, recomputed from scratch
+        # at every step, for agents trained before the streaming engine
+        self.compact_dtw = compact_dtw
+
+        # lookup mode: features precomputed by `precompute_similarity`.
+        # episodes whose record buffer is not in the table use live DTW
+        self.similarity_table: np.ndarray | None = None
+        self.similarity_table_steps: dict[str, np.ndarray] = {}
+        self.similarity_table_offset: int | None = None
+        if similarity_cache is not None:
+            self._load_similarity_table(similarity_cache)
 
-        similarity_matrix = self.similarity_matrix
-        similarity_matrix.fill(0.0)
-        for idx, measure in enumerate(self.window_measures):
-            timewarping_distance, (head, tail) = dtw_compact(
-                measure.repr_sequence, record_repr_sequence, subsequence=True
+    @property
+    def info(self) -> dict:
+        info = {}
+        if self.similarity_budget is not None or self.prune_ratio is not None:
+            info["exact_features"] = self.exact_features.copy()
+        if self.prune_ratio is not None:
+            info["dtw_pruned"] = len(self.pruned_keys)
+            info["dtw_computed"] = len(self.dtw_keys)
+        return info
+
+    def _get_backend_state(self) -> dict:
+        # the streamed DTW state, so that a restored episode keeps streaming
+        return {
+            "dtw": None if self.dtw is None else self.dtw.copy(),
+            "dtw_keys": self.dtw_keys,
+            "streamed_sequence": self.streamed_sequence,
+            "exact_features": self.exact_features.copy(),
+            "pruned_keys": self.pruned_keys,
+            "pruned_bounds": self.pruned_bounds,
+            "pruned_rows": dict(self.pruned_rows),
+            "similarity_table_offset": self.similarity_table_offset,
+        }
+
+    def _set_backend_state(self, state: Mapping):
+        dtw = state["dtw"]
+        self.dtw = None if dtw is None else dtw.copy()
+        self.dtw_keys = state["dtw_keys"]
+        self.streamed_sequence = state["streamed_sequence"]
+        self.exact_features[:] = state["exact_features"]
+        self.pruned_keys = state["pruned_keys"]
+        self.pruned_bounds = state["pruned_bounds"]
+        self.pruned_rows = dict(state["pruned_rows"])
+        self.similarity_table_offset = state["similarity_table_offset"]
+
+    def _load_similarity_table(self, similarity_cache: PathLike):
+        table_path = Path(similarity_cache)
+        table = np.load(table_path, mmap_mode="r")
+        expected_shape = (self.num_score_measures, self.num_features)
+        if table.ndim != 3 or table.shape[1:] != expected_shape:
+            raise ValueError(f"cache does not match the score: {table_path}")
+        with np.load(table_path.with_suffix(".steps.npz")) as steps:
+            steps = dict(steps)
+        renderer = self.renderer
+        if "fps" not in steps or (steps["fps"], steps["onset_only"]) != (
+            renderer.fps,
+            renderer.onset_only,
+        ):
+            raise ValueError(f"cache does not match `fps`/`onset_only`: {table_path}")
+        self.similarity_table = table
+        self.similarity_table_steps = steps
+
+    def _stream_record_sequence(self, record_repr_sequence: np.ndarray) -> np.ndarray:
+        # returns the frames that have not been streamed yet. if the buffer no
+        # longer extends the streamed sequence (old frames were evicted or the
+        # record was reset), the DTW state is dropped and the buffer replayed.
+        new_frames = streamed_suffix(self.streamed_sequence, record_repr_sequence)
+        self.streamed_sequence = record_repr_sequence.copy()
+        if new_frames is not None:
+            return new_frames
+
+        self.dtw, self.dtw_keys = None, np.empty(0, dtype=np.int64)
+        self.pruned_rows = {}
+        return record_repr_sequence
+
+    def _stream_window_measures(
+        self,
+        record_repr_sequence: np.ndarray,
+        priorities: np.ndarray | None = None,
+        deadline: float | None = None,
+    ) -> BatchedSubsequenceDTW | None:
+        # brings the DTW state of the window measures up to date. measures that
+        # have to replay the whole buffer go in order of `priorities` (window
+        # rows, highest first) and in chunks, until `deadline` (perf_counter)
+        # passes; `dtw_keys` tells which measures are exact afterwards and
+        # `pruned_keys` which ones were skipped by their lower bound
+        self.pruned_keys = np.empty(0, dtype=np.int64)
+        self.pruned_bounds = np.empty(0)
+        new_frames = self._stream_record_sequence(record_repr_sequence)
+        window_keys = np.arange(
+            self.window_head, self.window_head + self.num_window_measures
+        )
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.count("dtw_calls")
+        if self.dtw is not None and np.array_equal(self.dtw_keys, window_keys):
+            self.dtw.extend(new_frames)
+            if profiler is not None:
+                profiler.count("dtw_cells", len(new_frames) * len(window_keys))
+            return self.dtw
+
+        # the window slid (or measures fell behind the budget): measures that
+        # stay keep their state, those that left are dropped and the others
+        # replay the whole buffer
+        batches, keys = [], []
+        if self.dtw is not None:
+            kept = np.flatnonzero(np.isin(self.dtw_keys, window_keys))
+            batches.append(self.dtw.take(kept))
+            batches[-1].extend(new_frames)
+            keys.append(self.dtw_keys[kept])
+
+        kept_keys = np.concatenate([np.empty(0, dtype=np.int64), *keys])
+        fresh_keys = np.setdiff1d(window_keys, kept_keys)
+        queries, lengths = self.score_measures.pad_repr_sequences(
+            fresh_keys, num_dims=record_repr_sequence.shape[1]
+        )
+
+        prune = self.prune_ratio is not None and len(fresh_keys) > 0
+        pruned_rows, bound_cells = {}, 0
+        if prune:
+            # cheap envelope bounds first, the nearest-frame bounds only for
+            # the measures that survive them. measures pruned on the last
+            # step stream their nearest-frame distances by the new frames
+            bounds = lower_bound_envelope(queries, lengths, record_repr_sequence)
+            tight = np.zeros(len(fresh_keys), dtype=bool)
+            for idx, key in enumerate(fresh_keys.tolist()):
+                if (rows := self.pruned_rows.get(key)) is None:
+                    continue
+                if len(new_frames) > 0:
+                    nearest = nearest_frame_distances(
+                        queries[idx, : lengths[idx]], new_frames
+                    )
+                    rows = np.minimum(rows, nearest)
+                    bound_cells += len(new_frames)
+                pruned_rows[key] = rows
+                bounds[idx], tight[idx] = rows.sum(), True
+            best = self._max_similarity(batches[0], keys[0]) if batches else -np.inf
+        if priorities is not None:
+            order = np.argsort(
+                -priorities[fresh_keys - self.window_head], kind="stable"
             )
+        elif prune:
+            order = np.argsort(bounds, kind="stable")  # likely best ones first
+        else:
+            order = np.arange(len(fresh_keys))
+        chunk_size = self.refine_chunk_size
+        if deadline is None and not prune:
+            chunk_size = len(fresh_keys)
 
-            if onset_only:
-                (head, tail) = get_actual_alignment((head, tail), record_onset_indices)
+        num_fresh, pruned = 0, []
+        for head in range(0, len(order), max(chunk_size, 1)):
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+            chunk = order[head : head + chunk_size]
+            if prune and np.isfinite(best):
+                threshold = best / self.prune_ratio
+                hopeless = calc_bound_similarities(bounds[chunk]) < threshold
+                candidates = chunk[~hopeless & ~tight[chunk]]
+                nearest = nearest_frame_distances(
+                    queries[candidates], record_repr_sequence
+                )
+                for idx, rows in zip(candidates.tolist(), nearest):
+                    pruned_rows[int(fresh_keys[idx])] = rows[: lengths[idx]]
+                    bounds[idx] = rows[: lengths[idx]].sum()
+                tight[candidates] = True
+                bound_cells += len(candidates) * len(record_repr_sequence)
+                hopeless |= calc_bound_similarities(bounds[chunk]) < threshold
+                pruned.append(chunk[hopeless])
+                chunk = chunk[~hopeless]
+                if len(chunk) == 0:
+                    continue
+            max_length = max(int(lengths[chunk].max()), 1)
+            fresh = BatchedSubsequenceDTW.from_padded(
+                queries[chunk, :max_length], lengths[chunk]
+            )
+            fresh.extend(record_repr_sequence)
+            batches.append(fresh)
+            keys.append(fresh_keys[chunk])
+            num_fresh += len(chunk)
+            if prune:
+                best = max(best, self._max_similarity(fresh, fresh_keys[chunk]))
+
+        if pruned:
+            pruned = np.concatenate(pruned)
+            self.pruned_keys = fresh_keys[pruned]
+            self.pruned_bounds = bounds[pruned]
+            if profiler is not None:
+                profiler.count("dtw_pruned", len(pruned))
+        # only measures that stay pruned keep streaming their bounds
+        self.pruned_rows = {
+            key: pruned_rows[key]
+            for key in self.pruned_keys.tolist()
+            if key in pruned_rows
+        }
 
-            record_pitch_histogram = record.get_pitch_histogram((head, tail))
-            euclidean_distance = euclidean(
-                measure.pitch_histogram, record_pitch_histogram
+        if profiler is not None:
+            # (measure, frame) pairs advanced; fresh measures replay the buffer
+            profiler.count("dtw_replays", num_fresh)
+            profiler.count(
+                "dtw_cells",
+                len(kept_keys) * len(new_frames)
+                + num_fresh * len(record_repr_sequence),
             )
+            if self.prune_ratio is not None:
+                profiler.count("bound_cells", bound_cells)
 
-            # similarity, subsequence offset, sebsequence size
-            similarity_matrix[idx, 0] = calc_algorithmic_similarity(
-                distances=[timewarping_distance, euclidean_distance], scales=[1.0, 1.0]
+        if not batches:
+            self.dtw, self.dtw_keys = None, np.empty(0, dtype=np.int64)
+            return None
+        keys = np.concatenate(keys).astype(np.int64)
+        order = np.argsort(keys)
+        self.dtw = BatchedSubsequenceDTW.concatenate(batches).take(order)
+        self.dtw_keys = keys[order]
+        return self.dtw
+
+    def _max_similarity(self, dtw: BatchedSubsequenceDTW, keys: np.ndarray) -> float:
+        # the best exact similarity of the measures of `keys`, to prune by
+        features = np.zeros((len(keys), self.num_features), dtype=np.float32)
+        measure_histograms = self.score_measures.pitch_histograms[keys]
+        calc_midi_similarity(
+            features, dtw, measure_histograms.astype(np.float64), self.record
+        )
+        return float(features[:, 0].max(initial=-np.inf))
+
+    def _find_similarity_table_offset(self) -> int | None:
+        # the table is indexed by record steps from the first measure. an
+        # episode is located by the fingerprint of its record buffer; rows of
+        # another buffer history would not be the features of this episode
+        steps = self.similarity_table_steps
+        fingerprint = frames_fingerprint(as_frames(self.record.get_repr_sequence()))
+        matched = np.flatnonzero(steps["fingerprints"] == fingerprint)
+        return int(matched[0]) if len(matched) > 0 else None
+
+    def _lookup_similarity_matrix(self) -> bool:
+        # False if the episode is not in the table, which is then followed by
+        # live DTW until the next reset
+        if self.record_steps == 0:
+            self.similarity_table_offset = self._find_similarity_table_offset()
+            if self.similarity_table_offset is None and self.profiler is not None:
+                self.profiler.count("similarity_misses")
+        if self.similarity_table_offset is None:
+            return False
+        if self.profiler is not None:
+            self.profiler.count("similarity_lookups")
+
+        table = self.similarity_table
+        row = min(self.similarity_table_offset + self.record_steps, len(table) - 1)
+        head, num_measures = self.window_head, self.num_window_measures
+        self.similarity_matrix[:num_measures] = table[row, head : head + num_measures]
+        self.similarity_matrix[num_measures:] = 0.0
+        return True
+
+    def _fill_similarity_matrix(self):
+        self.exact_features[:] = False
+        if self.similarity_table is not None and self._lookup_similarity_matrix():
+            self.exact_features[: self.num_window_measures] = True
+            return
+        if self.compact_dtw:
+            calc_compact_midi_similarity(
+                self.similarity_matrix, self.window_measures, self.record
             )
-            similarity_matrix[idx, 1] = head / (record_num_frames - 1)
-            similarity_matrix[idx, 2] = (tail - head) / record_num_frames
+            self.exact_features[: self.num_window_measures] = True
+            return
+
+        start = time.perf_counter()
+        num_measures = self.num_window_measures
+        window_histograms = self.window_measures.pitch_histograms.astype(np.float64)
+        record_repr_sequence = as_frames(self.record.get_repr_sequence())
+        self.similarity_matrix[num_measures:] = 0.0
+
+        if self.similarity_budget is None and self.prune_ratio is None:
+            dtw = self._stream_window_measures(record_repr_sequence)
+            calc_midi_similarity(
+                self.similarity_matrix, dtw, window_histograms, self.record
+            )
+            self.exact_features[:num_measures] = True
+            return
+
+        priorities, deadline = None, None
+        if self.similarity_budget is not None:
+            # anytime mode: cheap features for every measure first, then exact
+            # ones for as many measures as the budget allows, most promising
+            # first
+            window_measures = self.window_measures
+            densities = window_measures.repr_lengths / (
+                window_measures.durations * self.renderer.fps
+            )
+            priorities = calc_cheap_midi_similarity(
+                self.similarity_matrix, window_histograms, densities, self.record
+            )
+            deadline = start + self.similarity_budget
+
+        dtw = self._stream_window_measures(record_repr_sequence, priorities, deadline)
+        if len(self.pruned_keys) > 0:
+            rows = self.pruned_keys - self.window_head
+            features = np.zeros((len(rows), self.num_features), dtype=np.float32)
+            calc_bounded_midi_similarity(features, self.pruned_bounds)
+            self.similarity_matrix[rows] = features
+        if dtw is not None:
+            rows = self.dtw_keys - self.window_head
+            features = np.zeros((len(rows), self.num_features), dtype=np.float32)
+            calc_midi_similarity(features, dtw, window_histograms[rows], self.record)
+            self.similarity_matrix[rows] = features
+            self.exact_features[rows] = True
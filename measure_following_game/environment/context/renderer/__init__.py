@@ -2,3 +2,5 @@
 
 from measure_following_game.environment.context.renderer.base import *
 from measure_following_game.environment.context.renderer.grid import *
+from measure_following_game.environment.context.renderer.layout import *
+from measure_following_game.environment.context.renderer.raster import *
@@ -7,12 +7,16 @@ from pathlib import Path
 from typing import ClassVar
 
 from beartype import beartype
+import numpy as np
 from numpy import random
 from sabanamusic.common.types import Index, PathLike, PositiveInt
-from sabanamusic.models.musical import make_score_measures, Measure
+from sabanamusic.models.musical import make_score_measures
 from sabanamusic.models.graphical import Sheet, SheetView, JsonIO
 
+from measure_following_game.environment.cache import load_score_measures
+from measure_following_game.environment.features import ScoreFeatureStore
 from measure_following_game.types import ActType
+from measure_following_game.validation import Validation
 
 
 class ContextRenderer(object):
@@ -28,10 +32,19 @@ class ContextRenderer(object):
         **kwargs,
     ):
         self.score_root = Path(score_root)
+        self.validation: Validation = kwargs.get("validation") or Validation()
         self.fps, self.onset_only = fps, onset_only
-        self.score_measures: list[Measure] = make_score_measures(
-            score_root=score_root, fps=fps, onset_only=onset_only
-        )
+        # parsed measures can be shared between renderers of the same score
+        score_measures = kwargs.get("score_measures")
+        if score_measures is None and kwargs.get("score_cache", True):
+            score_measures = load_score_measures(
+                score_root, fps, onset_only, kwargs.get("score_cache_dir")
+            )
+        elif score_measures is None:
+            score_measures = make_score_measures(
+                score_root=score_root, fps=fps, onset_only=onset_only
+            )
+        self.score_measures = ScoreFeatureStore.from_measures(score_measures)
         self.num_score_measures = len(self.score_measures)
 
         self.json_io = JsonIO()
@@ -56,12 +69,23 @@ class ContextRenderer(object):
     def step(self, pred_policy: ActType):
         raise NotImplementedError()
 
+    def jump(self, measure_index: Index) -> bool:
+        # shows the given score measure and puts the cursor on it
+        raise NotImplementedError()
+
+    def get_state(self):
+        # a snapshot of the navigation state, restored by `set_state`
+        raise NotImplementedError()
+
+    def set_state(self, state):
+        raise NotImplementedError()
+
     @abstractmethod
     def reset(self, seed: int | None = None, options: dict = {}) -> Index:
         raise NotImplementedError()
 
     @abstractmethod
-    def render(self, mode: str = "human"):
+    def render(self, mode: str = "human", out: np.ndarray | None = None):
         raise NotImplementedError()
 
     def _init_sheet_view(self, layout_name: str | None = None):
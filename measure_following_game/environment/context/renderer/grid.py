@@ -1,8 +1,9 @@
 # -*- coding: utf-8 -*-
 
-__all__ = ["GridContextRenderer"]
+__all__ = ["GridContextRenderer", "GridRendererState"]
 
-from argparse import ArgumentError
+from dataclasses import dataclass
+import math
 import os
 import re
 from typing import ClassVar, Literal
@@ -11,10 +12,13 @@ from beartype import beartype
 import numpy as np
 import pygame
 from sabanamusic.common.types import Index, PathLike, PositiveInt
-from sabanamusic.models.graphical import Measure, Sheet, SheetView, JsonIO
 
-from measure_following_game.environment.context.renderer.base import ContextRenderer
-from measure_following_game.types import ActType
+from measure_following_game.environment.context.renderer.layout import (
+    LayoutContextRenderer,
+    RendererState,
+    calc_measure_rects,
+)
+from measure_following_game.validation import validated
 
 
 BLACK = (0, 0, 0)
@@ -25,7 +29,12 @@ ACTIVATE = (204, 227, 201)
 image_regex = r"score_img_([0-9]+)\.png"
 
 
-class GridContextRenderer(ContextRenderer):
+@dataclass(frozen=True)
+class GridRendererState(RendererState):
+    scroll_top: float = 0
+
+
+class GridContextRenderer(LayoutContextRenderer):
 
     render_modes: ClassVar[list[str]] = ["human", "rgb_array"]
 
@@ -48,106 +57,164 @@ class GridContextRenderer(ContextRenderer):
 
         self.measure_rects: list = []
 
-        self.cursor = 0
         self.scroll_top = 0
 
         self.channel_last = kwargs.get("channel_last") is True
 
-        self.measure_images = {}
-
-        pygame.init()
-        pygame.display.init()
-        self.screen = pygame.display.set_mode((self.screen_width, self.screen_height))
-        self.surf = pygame.Surface((self.screen_width, self.screen_height))
+        # rgb_array frames are written into one contiguous buffer (or a given
+        # one) of `resolution` (height, width), downscaled from the canvas
+        resolution = kwargs.get("resolution")
+        if resolution is None:
+            resolution = (self.screen_height, self.screen_width)
+        self.frame_height, self.frame_width = (int(size) for size in resolution)
+        if self.channel_last:
+            self.frame_shape = (self.frame_height, self.frame_width, 3)
+        else:
+            self.frame_shape = (3, self.frame_height, self.frame_width)
+        self.frame: np.ndarray | None = None
+        self.scaled_canvas = None
 
-        self.surf.fill(WHITE)
-        self._calc_resized_measure_rects()
-        self._load_measure_images()
-        self._render_layout_initial_measures()
+        # headless renderers never open a display and only offer `rgb_array`
+        self.headless = kwargs.get("headless") is True
+        if self.headless:
+            self.render_modes = ["rgb_array"]
 
-    @property
-    def visible_measures(self) -> list[Measure]:
-        return self.sheet_view.get_visible_measures()
+        self.measure_images = {}
 
-    @property
-    def visible_indices(self) -> list[Index]:
-        return [m.index for m in self.visible_measures]
+        # pixel state is created on the first `render` call, and the display
+        # window only on the first `render("human")` call
+        self.screen = None
+        self.canvas = None
+        self.surf = None
 
-    @property
-    def window_head(self) -> Index:
-        return self.visible_measures[0].index
+        # dirty rects: the color each measure was last drawn with on `surf`,
+        # and per render mode the areas of `surf` changed since its canvas
+        # was last presented (None: the whole viewport has to be blitted)
+        self.measure_colors: dict[Index, tuple] = {}
+        self.pending_rects: dict[str, list | None] = {}
+        self.presented_scroll: dict[str, int] = {}
 
-    @property
-    def num_window_measures(self) -> PositiveInt:
-        return len(self.visible_measures)
+        self._calc_resized_measure_rects()
 
     def slide(self):
-        self.sheet_view.slide()
+        super().slide()
         scroll_dest = self.measure_rects[self.window_head][1]
         # TODO(kaparoo): need smooth scroll
         self.scroll_top = scroll_dest
 
-    @beartype
-    def step(self, pred_policy: ActType):
-        index = np.argmax(pred_policy)
-        if index in self.visible_indices:
-            self.cursor = index
+    def get_state(self) -> GridRendererState:
+        state = super().get_state()
+        return GridRendererState(**vars(state), scroll_top=self.scroll_top)
 
-    @beartype
+    def set_state(self, state: RendererState):
+        # a moved viewport is blitted whole and measures whose color changed
+        # are redrawn by the next render
+        super().set_state(state)
+        self.scroll_top = getattr(state, "scroll_top", 0)
+
+    def _rewind(self):
+        super()._rewind()
+        self.scroll_top = 0
+
+    @validated
     def reset(self, seed: int | None = None, options: dict = {}) -> Index:
-        self._init_sheet_view(options.get("layout_name"))
         self.scroll_top = 0
-        self.cursor = 0
-        if isinstance(start_staff_idx := options.get("start_staff_idx"), int):
-            sheet_view = self.sheet_view
-            for _ in range(len(sheet_view.sheet.staves)):
-                if start_staff_idx == sheet_view.get_visible_staves()[0].index:
-                    break
-                else:
-                    sheet_view.slide()
-            else:
-                raise ArgumentError()
-        np.random.seed(seed)
-        start_measure: Measure = np.random.choice(self.visible_measures)
-        return start_measure.index
+        return super().reset(seed=seed, options=options)
 
-    @beartype
-    def render(self, mode: Literal["human", "rgb_array"] = "human"):
+    @validated
+    def render(
+        self,
+        mode: Literal["human", "rgb_array"] = "human",
+        out: np.ndarray | None = None,
+    ):
+        if mode not in self.render_modes:
+            raise KeyError(f"Unsupported mode: {mode}")
+
+        self._init_surfaces()
         self._render_layout_visible_measures()
-        self.screen.fill(WHITE)
-        self.screen.blit(
-            self.surf,
-            (0, 0),
-            area=[0, self.scroll_top, self.screen_width, self.screen_height],
-        )
 
         if mode == "human":
-            pygame.display.flip()
-        elif mode == "rgb_array":
-            rgb_array = pygame.surfarray.pixels3d(self.screen)  # W X H X C
-            channel_order = (1, 0, 2) if self.channel_last else (2, 1, 0)
-            return np.transpose(rgb_array, channel_order)
+            self._init_display()
+            canvas = self.screen
         else:
-            raise KeyError(f"Unsupported mode: {mode}")
+            canvas = self.canvas
 
-    def _calc_resized_measure_rects(self):
-        self.measure_rects = []
-        cur_x = 0
-        cur_y = 0
-        for staff in self.sheet_view.sheet.staves:
-            total_measure_width = 0
-            for measure in staff.measures:
-                total_measure_width += measure.width
+        updated = self._present(mode, canvas)
+        if mode == "human":
+            if updated is None:
+                pygame.display.flip()
+            elif updated:
+                pygame.display.update(updated)
+        else:
+            return self._copy_frame(canvas, out)
+
+    def _copy_frame(self, canvas, out: np.ndarray | None = None) -> np.ndarray:
+        # pixels are copied into the buffer without locking the canvas. the
+        # frame buffer is reused by every render: copy to keep a frame
+        if out is None:
+            if self.frame is None:
+                self.frame = np.empty(self.frame_shape, dtype=np.uint8)
+            out = self.frame
+        elif out.shape != self.frame_shape or out.dtype != np.uint8:
+            raise ValueError(f"invalid buffer of shape {out.shape}")
+
+        source = canvas
+        size = (self.frame_width, self.frame_height)
+        if size != canvas.get_size():
+            if self.scaled_canvas is None:
+                self.scaled_canvas = pygame.Surface(size)
+            pygame.transform.smoothscale(canvas, size, self.scaled_canvas)
+            source = self.scaled_canvas
+
+        # surfaces are indexed (x, y)
+        view = out.transpose(1, 0, 2) if self.channel_last else out.transpose(2, 1, 0)
+        pygame.pixelcopy.surface_to_array(view, source)
+        return out
+
+    def _init_surfaces(self):
+        if self.surf is not None:
+            return
+        self.canvas = pygame.Surface((self.screen_width, self.screen_height))
+        self.surf = pygame.Surface((self.screen_width, self.sheet_height))
+        self._load_measure_images()
+        self._render_layout_initial_measures()
 
-            weight = self.screen_width / total_measure_width
-            for measure in staff.measures:
-                resized_width = measure.width * weight
-                measure_rect = (cur_x, cur_y, resized_width, staff.height)
-                self.measure_rects.append(measure_rect)
-                cur_x += resized_width
+    def _present(self, mode: str, canvas) -> list | None:
+        # brings `canvas` up to date with `surf`: the whole viewport after a
+        # scroll or on the first call, otherwise only the pending rects.
+        # returns the updated canvas rects, or None for the whole canvas
+        pending = self.pending_rects.get(mode)
+        self.pending_rects[mode] = []
+        if pending is None or self.presented_scroll.get(mode) != self.scroll_top:
+            self.presented_scroll[mode] = self.scroll_top
+            canvas.fill(WHITE)
+            canvas.blit(
+                self.surf,
+                (0, 0),
+                area=[0, self.scroll_top, self.screen_width, self.screen_height],
+            )
+            return None
+
+        viewport = pygame.Rect(
+            0, self.scroll_top, self.screen_width, self.screen_height
+        )
+        updated = []
+        for area in pending:
+            area = area.clip(viewport)
+            if area.width > 0 and area.height > 0:
+                canvas.blit(self.surf, (area.x, area.y - self.scroll_top), area=area)
+                updated.append(area.move(0, -self.scroll_top))
+        return updated
+
+    def _init_display(self):
+        if self.screen is not None:
+            return
+        pygame.display.init()
+        self.screen = pygame.display.set_mode((self.screen_width, self.screen_height))
 
-            cur_x = 0
-            cur_y += staff.height
+    def _calc_resized_measure_rects(self):
+        rects = calc_measure_rects(self.sheet_view.sheet, self.screen_width)
+        self.measure_rects = [tuple(rect) for rect in rects.tolist()]
 
     def _load_measure_images(self):
         image_dir = self.score_root / "score_images"
@@ -176,30 +243,42 @@ class GridContextRenderer(ContextRenderer):
     def _render_layout_initial_measures(self):
         self.surf.fill(WHITE)
         self._render_measures(lambda _: PLAIN)
+        self.pending_rects = {}
 
     def _render_layout_visible_measures(self):
-        def callback(index):
-            if index in self.visible_indices:
-                return ACTIVATE if self.cursor == index else PLAIN
-            else:
-                return None
-
-        self._render_measures(callback)
+        # only the visible measures whose color changed are redrawn: the old
+        # and new cursor, and measures that became visible with a stale color
+        for index in self.visible_indices:
+            color = ACTIVATE if self.cursor == index else PLAIN
+            if self.measure_colors.get(index) != color:
+                self._render_measure(index, color)
 
     def _render_measures(self, get_color_by_index):
-        for index, rect in enumerate(self.measure_rects):
+        for index in range(len(self.measure_rects)):
             color = get_color_by_index(index)
             if color:
-                pygame.draw.rect(self.surf, color, rect)
-                pygame.draw.rect(self.surf, BLACK, rect, 1)
-                if index in self.measure_images:
-                    image = self.measure_images.get(index)
-                    iw = image.get_width()
-                    ih = image.get_height()
-                    x, y, w, h = rect
-                    self.surf.blit(image, (x + w / 2 - iw / 2, y + h / 2 - ih / 2))
+                self._render_measure(index, color)
+
+    def _render_measure(self, index: Index, color: tuple):
+        rect = self.measure_rects[index]
+        pygame.draw.rect(self.surf, color, rect)
+        pygame.draw.rect(self.surf, BLACK, rect, 1)
+        if index in self.measure_images:
+            image = self.measure_images.get(index)
+            iw = image.get_width()
+            ih = image.get_height()
+            x, y, w, h = rect
+            self.surf.blit(image, (x + w / 2 - iw / 2, y + h / 2 - ih / 2))
+
+        self.measure_colors[index] = color
+        x, y, w, h = rect
+        left, top = math.floor(x), math.floor(y)
+        area = pygame.Rect(left, top, math.ceil(x + w) - left, math.ceil(y + h) - top)
+        for pending in self.pending_rects.values():
+            if pending is not None:
+                pending.append(area)
 
     def close(self):
-        if self.screen is not None:
+        if getattr(self, "screen", None) is not None:
             pygame.display.quit()
-            pygame.quit()
+            self.screen = None
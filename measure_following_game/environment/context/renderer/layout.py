@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+
+__all__ = [
+    "LayoutContextRenderer",
+    "RenderSnapshot",
+    "RendererState",
+    "calc_measure_rects",
+]
+
+from argparse import ArgumentError
+import copy
+from dataclasses import dataclass
+from typing import ClassVar
+
+from beartype import beartype
+import numpy as np
+from sabanamusic.common.types import Index, PathLike, PositiveInt
+from sabanamusic.models.graphical import Measure, Sheet, SheetView
+
+from measure_following_game.environment.context.renderer.base import ContextRenderer
+from measure_following_game.types import ActType
+from measure_following_game.validation import validated
+
+
+def calc_measure_rects(sheet: Sheet, width: float) -> np.ndarray:
+    # (num_measures, 4) rects (x, y, w, h) of the measures on a sheet of
+    # `width`: staves are stacked and their measures stretched to the width
+    rects = []
+    top = 0
+    for staff in sheet.staves:
+        weight = width / sum(measure.width for measure in staff.measures)
+        left = 0
+        for measure in staff.measures:
+            resized_width = measure.width * weight
+            rects.append((left, top, resized_width, staff.height))
+            left += resized_width
+        top += staff.height
+    return np.array(rects, dtype=np.float64).reshape(-1, 4)
+
+
+@dataclass(frozen=True)
+class RenderSnapshot:
+    # everything a frame depends on, cheap enough to take at every step
+    sheet: Sheet
+    window_head: Index
+    cursor: Index
+    visible_indices: frozenset[Index]
+    display_height: float
+
+
+@dataclass(frozen=True)
+class RendererState:
+    # position of the window and the cursor, to branch and restore a
+    # renderer. the sheet is shared, the view is a copy of its own
+    sheet_view: SheetView
+    cursor: Index
+    visible_measures: tuple[Measure, ...]
+
+
+def _copy_sheet_view(sheet_view: SheetView) -> SheetView:
+    # shallow copy sharing the sheet; lists of the view are copied as well,
+    # in case sliding updates them in place
+    sheet_view = copy.copy(sheet_view)
+    for name, value in vars(sheet_view).items():
+        if isinstance(value, list):
+            setattr(sheet_view, name, list(value))
+    return sheet_view
+
+
+class LayoutContextRenderer(ContextRenderer):
+
+    # window and cursor logic of the sheet layout without any pixel state;
+    # used for training rollouts where nothing is drawn
+
+    render_modes: ClassVar[list[str]] = []
+
+    @beartype
+    def __init__(
+        self,
+        score_root: PathLike,
+        fps: PositiveInt = 20,
+        onset_only: bool = True,
+        **kwargs,
+    ):
+        super().__init__(score_root, fps, onset_only, **kwargs)
+        self.cursor = 0
+
+    def _init_sheet_view(self, layout_name: str | None = None):
+        super()._init_sheet_view(layout_name)
+        self._invalidate_visible()
+
+    def _invalidate_visible(self):
+        # the visible measures only change when the sheet view moves, so they
+        # are cached until the next slide, rewind or reset
+        self._visible_measures: list[Measure] | None = None
+        self._visible_indices: list[Index] = []
+        self._visible_index_set: frozenset[Index] = frozenset()
+
+    def _cache_visible(self):
+        if self._visible_measures is None:
+            self._visible_measures = self.sheet_view.get_visible_measures()
+            self._visible_indices = [m.index for m in self._visible_measures]
+            self._visible_index_set = frozenset(self._visible_indices)
+
+    @property
+    def visible_measures(self) -> list[Measure]:
+        self._cache_visible()
+        return self._visible_measures
+
+    @property
+    def visible_indices(self) -> list[Index]:
+        self._cache_visible()
+        return self._visible_indices
+
+    def is_visible(self, index: Index) -> bool:
+        self._cache_visible()
+        return index in self._visible_index_set
+
+    def snapshot(self) -> RenderSnapshot:
+        self._cache_visible()
+        return RenderSnapshot(
+            self.sheet_view.sheet,
+            self.window_head,
+            int(self.cursor),
+            self._visible_index_set,
+            self.sheet_view.display_height,
+        )
+
+    def get_state(self) -> RendererState:
+        return RendererState(
+            _copy_sheet_view(self.sheet_view),
+            int(self.cursor),
+            tuple(self.visible_measures),
+        )
+
+    def set_state(self, state: RendererState):
+        # nothing is drawn: renderers with pixels catch up on the next render
+        self.sheet_view = _copy_sheet_view(state.sheet_view)
+        self.cursor = state.cursor
+        self._visible_measures = list(state.visible_measures)
+        self._visible_indices = [m.index for m in self._visible_measures]
+        self._visible_index_set = frozenset(self._visible_indices)
+
+    @property
+    def window_head(self) -> Index:
+        return self.visible_measures[0].index
+
+    @property
+    def num_window_measures(self) -> PositiveInt:
+        return len(self.visible_measures)
+
+    def slide(self):
+        self.sheet_view.slide()
+        self._invalidate_visible()
+
+    @validated
+    def step(self, pred_policy: ActType):
+        index = np.argmax(pred_policy)
+        if self.is_visible(index):
+            self.cursor = index
+
+    @validated
+    def jump(self, measure_index: Index) -> bool:
+        # the view only slides forward, so it is rewound to the first staff
+        # to reach an earlier measure. returns whether the measure is shown
+        if not 0 <= measure_index < self.num_score_measures:
+            return False
+        if measure_index < self.window_head:
+            self._rewind()
+        for _ in range(len(self.sheet_view.sheet.staves)):
+            if self.is_visible(measure_index):
+                break
+            self.slide()
+        if not self.is_visible(measure_index):
+            return False
+        self.cursor = measure_index
+        return True
+
+    def _rewind(self):
+        self.sheet_view = SheetView(self.sheet_view.sheet)
+        self._invalidate_visible()
+
+    @validated
+    def reset(self, seed: int | None = None, options: dict = {}) -> Index:
+        self._init_sheet_view(options.get("layout_name"))
+        self.cursor = 0
+        if isinstance(start_staff_idx := options.get("start_staff_idx"), int):
+            sheet_view = self.sheet_view
+            for _ in range(len(sheet_view.sheet.staves)):
+                if start_staff_idx == sheet_view.get_visible_staves()[0].index:
+                    break
+                else:
+                    sheet_view.slide()
+            else:
+                raise ArgumentError()
+            self._invalidate_visible()
+        np.random.seed(seed)
+        start_measure: Measure = np.random.choice(self.visible_measures)
+        return start_measure.index
+
+    def render(self, mode: str = "human", out: np.ndarray | None = None):
+        raise KeyError(f"Unsupported mode: {mode}")
+
+    def close(self):
+        pass
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ["RasterContextRenderer", "rasterize_batch"]
+
+from collections.abc import Sequence
+import os
+import re
+from typing import ClassVar, Literal
+
+from beartype import beartype
+import numpy as np
+import pygame
+from sabanamusic.common.types import Index, PathLike, PositiveInt
+
+from measure_following_game.environment.context.renderer.grid import (
+    ACTIVATE,
+    BLACK,
+    PLAIN,
+    WHITE,
+    image_regex,
+)
+from measure_following_game.environment.context.renderer.layout import (
+    LayoutContextRenderer,
+    RenderSnapshot,
+    calc_measure_rects,
+)
+from measure_following_game.validation import validated
+
+# ITU-R BT.601 luma
+GRAY_WEIGHTS = np.array([0.299, 0.587, 0.114])
+
+
+class RasterContextRenderer(LayoutContextRenderer):
+
+    # Draws the viewport of the grid renderer (measure rects, borders, cursor
+    # highlight and measure images) with NumPy into a preallocated uint8
+    # frame of `resolution` (height, width), RGB or `grayscale`. No pygame
+    # surface is kept; images are decoded and scaled to the frame once per
+    # sheet layout. `render` returns the same frame buffer on every call.
+
+    render_modes: ClassVar[list[str]] = ["rgb_array"]
+
+    @beartype
+    def __init__(
+        self,
+        score_root: PathLike,
+        fps: PositiveInt = 20,
+        onset_only: bool = True,
+        **kwargs,
+    ):
+        super().__init__(score_root, fps, onset_only, **kwargs)
+        self.channel_last = kwargs.get("channel_last") is True
+        self.grayscale = kwargs.get("grayscale") is True
+        self.num_channels = 1 if self.grayscale else 3
+
+        self.screen_width = self.sheet_view.sheet.layout_width
+        self.screen_height = self.sheet_view.display_height
+        resolution = kwargs.get("resolution")
+        if resolution is None:
+            resolution = (self.screen_height, self.screen_width)
+        self.frame_height, self.frame_width = (int(size) for size in resolution)
+        self.frame_shape = (self.frame_height, self.frame_width, self.num_channels)
+        self.frame = np.zeros(self.frame_shape, dtype=np.uint8)
+
+        self.colors = {
+            name: self._to_channels(np.array(color, dtype=np.float64))
+            for name, color in (
+                ("white", WHITE),
+                ("black", BLACK),
+                ("plain", PLAIN),
+                ("activate", ACTIVATE),
+            )
+        }
+        self.source_images = self._load_measure_images()
+        self.layout_sheet = None  # the sheet the geometry below belongs to
+        self.layout_width = self.screen_width
+        self.measure_rects = np.empty((0, 4))
+        self.measure_images: dict[Index, tuple[np.ndarray, np.ndarray]] = {}
+
+    @property
+    def scroll_top(self) -> float:
+        # the viewport starts at the first staff of the window
+        self._update_layout(self.sheet_view.sheet, self.sheet_view.display_height)
+        return float(self.measure_rects[self.window_head, 1])
+
+    def _to_channels(self, rgb: np.ndarray) -> np.ndarray:
+        if self.grayscale:
+            return np.round(rgb @ GRAY_WEIGHTS)[..., np.newaxis].astype(np.uint8)
+        return np.round(rgb).astype(np.uint8)
+
+    def _load_measure_images(self) -> dict[Index, np.ndarray]:
+        # (h, w, 4) float RGBA arrays of score_images/score_img_<i>.png
+        image_dir = self.score_root / "score_images"
+        images = {}
+        if not os.path.exists(image_dir):
+            return images
+        for image_path in image_dir.glob("score_img_*.png"):
+            res = re.findall(image_regex, str(image_path))
+            if not res or len(res) != 1:
+                break
+            image = pygame.image.load(str(image_path))
+            rgb = pygame.surfarray.array3d(image).transpose(1, 0, 2)
+            if image.get_flags() & pygame.SRCALPHA:
+                alpha = pygame.surfarray.array_alpha(image).T
+            else:
+                alpha = np.full(rgb.shape[:2], 255, dtype=np.uint8)
+            images[int(res[0])] = np.dstack([rgb, alpha]).astype(np.float64)
+        return images
+
+    def _scale_image(self, image: np.ndarray, width: int, height: int) -> np.ndarray:
+        # nearest-neighbour resampling; frames are small, so finer filters
+        # would not show
+        rows = (np.arange(height) + 0.5) * image.shape[0] / height
+        cols = (np.arange(width) + 0.5) * image.shape[1] / width
+        return image[rows.astype(int)][:, cols.astype(int)]
+
+    def _update_layout(self, sheet, display_height: float):
+        # geometry in frame pixels, recomputed when a reset draws a new layout
+        # or a snapshot comes from the view of another sheet
+        if sheet is self.layout_sheet and display_height == self.screen_height:
+            return
+        self.layout_sheet = sheet
+        self.layout_width = sheet.layout_width
+        self.screen_height = display_height
+        self.measure_rects = calc_measure_rects(sheet, self.layout_width)
+        scale_x = self.frame_width / self.layout_width
+        scale_y = self.frame_height / self.screen_height
+
+        self.measure_images = {}
+        for index, image in self.source_images.items():
+            if index >= len(self.measure_rects):
+                continue
+            _, _, rw, rh = self.measure_rects[index]
+            ratio = min(rw / image.shape[1], rh / image.shape[0])
+            width = int(image.shape[1] * ratio * scale_x)
+            height = int(image.shape[0] * ratio * scale_y)
+            if width > 0 and height > 0:
+                scaled = self._scale_image(image, width, height)
+                alpha = scaled[..., 3:] / 255.0
+                self.measure_images[index] = (self._to_channels(scaled[..., :3]), alpha)
+
+    def _paint_measure(self, out: np.ndarray, index: Index, rect, color):
+        height, width = out.shape[:2]
+        x, y, w, h = rect
+        left, right = int(round(x)), int(round(x + w))
+        top, bottom = int(round(y)), int(round(y + h))
+        clip_left, clip_right = max(left, 0), min(right, width)
+        clip_top, clip_bottom = max(top, 0), min(bottom, height)
+        if clip_left >= clip_right or clip_top >= clip_bottom:
+            return
+
+        out[clip_top:clip_bottom, clip_left:clip_right] = color
+        black = self.colors["black"]
+        if 0 <= top < height:
+            out[top, clip_left:clip_right] = black
+        if 0 < bottom <= height:
+            out[bottom - 1, clip_left:clip_right] = black
+        if 0 <= left < width:
+            out[clip_top:clip_bottom, left] = black
+        if 0 < right <= width:
+            out[clip_top:clip_bottom, right - 1] = black
+
+        if index in self.measure_images:
+            pixels, alpha = self.measure_images[index]
+            ih, iw = pixels.shape[:2]
+            image_top = int(round(y + h / 2 - ih / 2))
+            image_left = int(round(x + w / 2 - iw / 2))
+            rows = slice(max(image_top, 0), min(image_top + ih, height))
+            cols = slice(max(image_left, 0), min(image_left + iw, width))
+            if rows.start >= rows.stop or cols.start >= cols.stop:
+                return
+            source = (
+                slice(rows.start - image_top, rows.stop - image_top),
+                slice(cols.start - image_left, cols.stop - image_left),
+            )
+            target = out[rows, cols]
+            blended = target * (1.0 - alpha[source]) + pixels[source] * alpha[source]
+            target[...] = np.round(blended).astype(np.uint8)
+
+    def rasterize(self, out: np.ndarray | None = None) -> np.ndarray:
+        # draws the viewport into `out` (height, width, channels), by default
+        # the frame buffer of the renderer, and returns it
+        return self.rasterize_snapshot(self.snapshot(), out)
+
+    def rasterize_snapshot(
+        self, snapshot: RenderSnapshot, out: np.ndarray | None = None
+    ) -> np.ndarray:
+        # the same for the state of any renderer of the score, e.g. taken
+        # earlier or by another renderer
+        if out is None:
+            out = self.frame
+        self._update_layout(snapshot.sheet, snapshot.display_height)
+        scroll_top = float(self.measure_rects[snapshot.window_head, 1])
+        scale_x = self.frame_width / self.layout_width
+        scale_y = self.frame_height / self.screen_height
+
+        out[...] = self.colors["white"]
+        rects = self.measure_rects
+        in_view = (rects[:, 1] < scroll_top + self.screen_height) & (
+            rects[:, 1] + rects[:, 3] > scroll_top
+        )
+        for index in np.flatnonzero(in_view).tolist():
+            x, y, w, h = rects[index].tolist()
+            rect = (x * scale_x, (y - scroll_top) * scale_y, w * scale_x, h * scale_y)
+            active = snapshot.cursor == index and index in snapshot.visible_indices
+            color = self.colors["activate" if active else "plain"]
+            self._paint_measure(out, index, rect, color)
+        return out
+
+    @validated
+    def render(
+        self, mode: Literal["rgb_array"] = "rgb_array", out: np.ndarray | None = None
+    ) -> np.ndarray:
+        # into `out` (in the channel order of the renderer) or else views of
+        # the frame buffer: copy to keep a frame across renders
+        if mode not in self.render_modes:
+            raise KeyError(f"Unsupported mode: {mode}")
+        if out is None:
+            frame = self.rasterize()
+            return frame if self.channel_last else frame.transpose(2, 0, 1)
+        view = out if self.channel_last else out.transpose(1, 2, 0)
+        if view.shape != self.frame_shape or out.dtype != np.uint8:
+            raise ValueError(f"invalid buffer of shape {out.shape}")
+        self.rasterize(view)
+        return out
+
+    def close(self):
+        pass
+
+
+def rasterize_batch(
+    renderers: Sequence[RasterContextRenderer], out: np.ndarray | None = None
+) -> np.ndarray:
+    # (N, height, width, channels) frames of many environments in one array
+    frame_shape = renderers[0].frame_shape
+    if any(renderer.frame_shape != frame_shape for renderer in renderers):
+        raise ValueError("all renderers must share the same frame shape")
+    if out is None:
+        out = np.empty((len(renderers), *frame_shape), dtype=np.uint8)
+    elif out.shape != (len(renderers), *frame_shape) or out.dtype != np.uint8:
+        raise ValueError(f"invalid buffer of shape {out.shape}")
+    for idx, renderer in enumerate(renderers):
+        renderer.rasterize(out[idx])
+    return out
@@ -4,9 +4,12 @@ __all__ = ["MeasureFollowingEnv"]
 
 from beartype import beartype
 from gym import Env, spaces
+import numpy as np
 
 from measure_following_game.types import ActType, ObsType
-from measure_following_game.environment.context import ContextManager
+from measure_following_game.validation import validated
+from measure_following_game.environment.context import ContextManager, ContextState
+from measure_following_game.environment.recorder import EpisodeRecorder
 from measure_following_game.environment.rewards import Reward
 
 
@@ -14,8 +17,11 @@ class MeasureFollowingEnv(Env[ObsType, ActType]):
     @beartype
     def __init__(self, manager: ContextManager, reward: Reward):
         self.manager = manager
-        self.metadata.update(manager.metadata)
+        self.metadata = {**type(self).metadata, **manager.metadata}
         self.reward = reward
+        # one validation level for every component of the environment
+        self.validation = manager.validation
+        reward.validation = self.validation
         self.reward_range = reward.range
         self.action_space = spaces.Box(low=0.0, high=1.0, shape=(manager.num_actions,))
         self.observation_space = spaces.Tuple(
@@ -24,15 +30,36 @@ class MeasureFollowingEnv(Env[ObsType, ActType]):
                 spaces.Box(low=0.0, high=1.0, shape=manager.memory_shape),
             )
         )
+        self.recorder: EpisodeRecorder | None = None
 
-    @beartype
+    def start_recording(self, output_path, **recorder_options) -> EpisodeRecorder:
+        # frames of every following step and reset are written in background
+        self.stop_recording()
+        self.recorder = EpisodeRecorder(
+            self.manager.renderer, output_path, **recorder_options
+        )
+        return self.recorder
+
+    def stop_recording(self) -> dict:
+        # waits for the pending frames; returns the stats of the recording
+        if self.recorder is None:
+            return {}
+        recorder, self.recorder = self.recorder, None
+        return recorder.close()
+
+    @validated
     def step(self, pred_policy: ActType) -> tuple[ObsType, float, bool, dict]:
-        assert self.action_space.contains(pred_policy)
+        if self.validation.active:
+            assert self.action_space.contains(pred_policy)
         observation, true_action, done, info = self.manager.step(pred_policy)
         reward = self.reward(true_action, pred_policy)
+        if info.get("skipped_true_actions"):
+            reward += self.reward.total(info["skipped_true_actions"], pred_policy)
+        if self.recorder is not None:
+            self.recorder.capture()
         return observation, reward, done, info
 
-    @beartype
+    @validated
     def reset(
         self,
         *,
@@ -40,13 +67,27 @@ class MeasureFollowingEnv(Env[ObsType, ActType]):
         return_info: bool = False,
         options: dict | None = None
     ) -> ObsType | tuple[ObsType, dict]:
-        return self.manager.reset(seed=seed, return_info=return_info, options=options)
+        observation = self.manager.reset(
+            seed=seed, return_info=return_info, options=options
+        )
+        if self.recorder is not None:
+            self.recorder.capture()
+        return observation
 
-    @beartype
-    def render(self, mode: str = "human"):
-        return self.manager.render(mode)
+    def get_state(self) -> ContextState:
+        # branch points for lookahead search; the reward is stateless
+        return self.manager.get_state()
+
+    @validated
+    def set_state(self, state: ContextState):
+        self.manager.set_state(state)
+
+    @validated
+    def render(self, mode: str = "human", out: np.ndarray | None = None):
+        return self.manager.render(mode, out)
 
     def close(self):
+        self.stop_recording()
         self.manager.close()
 
     def __del__(self):
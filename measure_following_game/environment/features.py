@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ["MeasureFeatures", "PitchHistogramIndex", "ScoreFeatureStore"]
+
+from collections.abc import Sequence
+
+import numpy as np
+import numpy.typing as npt
+
+
+class MeasureFeatures(object):
+
+    # features of a single measure, as views into a `ScoreFeatureStore`
+
+    __slots__ = ("index", "repr_sequence", "pitch_histogram", "onset", "duration")
+
+    def __init__(
+        self,
+        index: int,
+        repr_sequence: np.ndarray,
+        pitch_histogram: np.ndarray,
+        onset: float = float("nan"),
+        duration: float = float("nan"),
+    ):
+        self.index = index
+        self.repr_sequence = repr_sequence
+        self.pitch_histogram = pitch_histogram
+        self.onset = onset
+        self.duration = duration
+
+
+class ScoreFeatureStore(object):
+
+    # Struct-of-arrays features of consecutive score measures. The repr
+    # sequences of all measures are concatenated in `repr_frames` and measure
+    # i spans repr_frames[repr_offsets[i]:repr_offsets[i + 1]]. Slicing with
+    # a range returns a store of views, so windows are never copied.
+
+    def __init__(
+        self,
+        repr_frames: np.ndarray,
+        repr_offsets: np.ndarray,
+        pitch_histograms: np.ndarray,
+        onsets: np.ndarray | None = None,
+        durations: np.ndarray | None = None,
+        first_index: int = 0,
+    ):
+        num_measures = len(pitch_histograms)
+        if len(repr_offsets) != num_measures + 1:
+            raise ValueError("`repr_offsets` must have one entry per measure + 1")
+        if onsets is None:
+            onsets = np.full(num_measures, np.nan)
+        if durations is None:
+            durations = np.full(num_measures, np.nan)
+
+        self.repr_frames = repr_frames
+        self.repr_offsets = repr_offsets
+        self.pitch_histograms = pitch_histograms
+        self.onsets = onsets
+        self.durations = durations
+        self.first_index = first_index
+
+    @classmethod
+    def from_measures(
+        cls,
+        measures: Sequence,
+        onsets: npt.ArrayLike | None = None,
+        durations: npt.ArrayLike | None = None,
+    ) -> "ScoreFeatureStore":
+        if isinstance(measures, ScoreFeatureStore):
+            return measures
+        repr_sequences = [np.asarray(m.repr_sequence) for m in measures]
+        lengths = [len(repr_sequence) for repr_sequence in repr_sequences]
+        return cls(
+            repr_frames=np.concatenate(repr_sequences),
+            repr_offsets=np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64),
+            pitch_histograms=np.stack([m.pitch_histogram for m in measures]),
+            onsets=None if onsets is None else np.asarray(onsets, dtype=np.float64),
+            durations=(
+                None if durations is None else np.asarray(durations, dtype=np.float64)
+            ),
+        )
+
+    @property
+    def arrays(self) -> dict[str, np.ndarray]:
+        return {
+            "repr_frames": self.repr_frames,
+            "repr_offsets": self.repr_offsets,
+            "pitch_histograms": self.pitch_histograms,
+            "onsets": self.onsets,
+            "durations": self.durations,
+        }
+
+    @property
+    def repr_lengths(self) -> np.ndarray:
+        return np.diff(self.repr_offsets)
+
+    @property
+    def num_dims(self) -> int:
+        return self.repr_frames.shape[1]
+
+    def __len__(self) -> int:
+        return len(self.pitch_histograms)
+
+    def __iter__(self):
+        return (self[idx] for idx in range(len(self)))
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            head, tail, step = key.indices(len(self))
+            if step != 1:
+                raise IndexError("only contiguous slices of measures are supported")
+            tail = max(head, tail)
+            offsets = self.repr_offsets[head : tail + 1]
+            return ScoreFeatureStore(
+                repr_frames=self.repr_frames[offsets[0] : offsets[-1]],
+                repr_offsets=offsets - offsets[0],
+                pitch_histograms=self.pitch_histograms[head:tail],
+                onsets=self.onsets[head:tail],
+                durations=self.durations[head:tail],
+                first_index=self.first_index + head,
+            )
+
+        idx = int(key)
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(f"measure index out of range: {key}")
+        head, tail = self.repr_offsets[idx], self.repr_offsets[idx + 1]
+        return MeasureFeatures(
+            self.first_index + idx,
+            self.repr_frames[head:tail],
+            self.pitch_histograms[idx],
+            float(self.onsets[idx]),
+            float(self.durations[idx]),
+        )
+
+    def pad_repr_sequences(
+        self, indices: npt.ArrayLike | None = None, num_dims: int | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        # (len(indices), max_length, num_dims) zero-padded queries and their
+        # lengths, gathered from `repr_frames` in one indexing operation
+        if indices is None:
+            indices = np.arange(len(self))
+        indices = np.asarray(indices, dtype=np.int64)
+        heads = self.repr_offsets[indices]
+        lengths = self.repr_offsets[indices + 1] - heads
+        max_length = max(int(lengths.max(initial=0)), 1)
+        num_dims = self.num_dims if num_dims is None else num_dims
+
+        positions = heads[:, np.newaxis] + np.arange(max_length)
+        mask = np.arange(max_length) < lengths[:, np.newaxis]
+        padded = np.zeros((len(indices), max_length, num_dims))
+        width = min(num_dims, self.num_dims)
+        padded[mask, :width] = self.repr_frames[positions[mask], :width]
+        return padded, lengths
+
+
+class PitchHistogramIndex(object):
+
+    # Top-k search of score measures by the cosine similarity of their pitch
+    # histograms to a query histogram. The normalized histograms form one
+    # matrix, so a query is a matrix-vector product and a partial sort,
+    # well under a millisecond for thousands of measures.
+
+    def __init__(self, pitch_histograms: npt.ArrayLike, first_index: int = 0):
+        histograms = np.asarray(pitch_histograms, dtype=np.float32)
+        norms = np.linalg.norm(histograms, axis=1, keepdims=True)
+        self.matrix = histograms / np.maximum(norms, 1e-12)
+        self.first_index = first_index
+
+    @classmethod
+    def from_store(cls, store: ScoreFeatureStore) -> "PitchHistogramIndex":
+        return cls(store.pitch_histograms, store.first_index)
+
+    def __len__(self) -> int:
+        return len(self.matrix)
+
+    def query(
+        self, histogram: npt.ArrayLike, k: int = 5
+    ) -> tuple[np.ndarray, np.ndarray]:
+        # score indices of the `k` most similar measures, best first, and
+        # their similarities
+        histogram = np.asarray(histogram, dtype=np.float32).ravel()
+        width = min(len(histogram), self.matrix.shape[1])
+        histogram = histogram[:width] / max(np.linalg.norm(histogram[:width]), 1e-12)
+        scores = self.matrix[:, :width] @ histogram
+
+        k = min(k, len(scores))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return top + self.first_index, scores[top]
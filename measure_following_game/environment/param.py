@@ -31,3 +31,7 @@ class EnvParam:
     record_options: dict[str, Any] = field(default_factory=dict)
     renderer_options: dict[str, Any] = field(default_factory=dict)
     manager_options: dict[str, Any] = field(default_factory=dict)
+
+    # validation: "full", "sampled" (every `validation_interval` steps) or "off"
+    validation: str = "full"
+    validation_interval: int = 100
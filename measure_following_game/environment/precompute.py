@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ["get_similarity_cache_path", "precompute_similarity"]
+
+from argparse import ArgumentParser
+import os
+from pathlib import Path
+
+from beartype import beartype
+import numpy as np
+
+from measure_following_game.environment.cache import *
+from measure_following_game.environment.context import (
+    MIDIContextManager,
+    calc_midi_similarity,
+)
+from measure_following_game.environment.param import EnvParam
+from measure_following_game.environment.utils import make_record
+from measure_following_game.similarity import (
+    BatchedSubsequenceDTW,
+    as_frames,
+    frames_fingerprint,
+    streamed_suffix,
+)
+
+
+@beartype
+def precompute_similarity(param: EnvParam, overwrite: bool = False) -> Path:
+    # similarity features of every score measure at every record step,
+    # replaying the record from the first measure, saved as (num_record_steps,
+    # num_score_measures, num_features) along with the true action and a
+    # fingerprint of the record buffer per step
+    cache_path = get_similarity_cache_path(param)
+    steps_path = cache_path.with_suffix(".steps.npz")
+    if cache_path.exists() and steps_path.exists() and not overwrite:
+        return cache_path
+
+    score_measures = load_score_measures(param.score_root, param.fps, param.onset_only)
+    record = make_record(
+        param.record_id,
+        param.score_root,
+        param.record_name,
+        param.fps,
+        param.buffer_duration,
+        param.buffer_step_size,
+        param.onset_only,
+        param.record_options,
+    )
+    # the number of steps first, so that rows go straight to the file
+    record.reset(0)
+    num_steps = 1
+    while not record.done:
+        record.step()
+        num_steps += 1
+    record.reset(0)
+
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = cache_path.with_name(f"{cache_path.stem}.tmp.npy")
+    table = np.lib.format.open_memmap(
+        temp_path,
+        mode="w+",
+        dtype=np.float32,
+        shape=(num_steps, len(score_measures), MIDIContextManager.num_features),
+    )
+    true_actions = np.empty(num_steps, dtype=np.int64)
+    fingerprints = np.empty(num_steps, dtype=np.int64)
+
+    measure_histograms = score_measures.pitch_histograms.astype(np.float64)
+    dtw, streamed_sequence = None, None
+    for step in range(num_steps):
+        if step > 0:
+            record.step()
+        record_repr_sequence = as_frames(record.get_repr_sequence())
+        new_frames = streamed_suffix(streamed_sequence, record_repr_sequence)
+        if dtw is None or new_frames is None:
+            dtw = BatchedSubsequenceDTW.from_padded(
+                *score_measures.pad_repr_sequences(
+                    num_dims=record_repr_sequence.shape[1]
+                )
+            )
+            new_frames = record_repr_sequence
+        dtw.extend(new_frames)
+        streamed_sequence = record_repr_sequence.copy()
+
+        calc_midi_similarity(table[step], dtw, measure_histograms, record)
+        true_actions[step] = record.true_action
+        fingerprints[step] = frames_fingerprint(record_repr_sequence)
+    table.flush()
+    del table
+
+    np.savez(
+        steps_path,
+        true_actions=true_actions,
+        fingerprints=fingerprints,
+        fps=param.fps,
+        onset_only=param.onset_only,
+    )
+    os.replace(temp_path, cache_path)
+    return cache_path
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="precompute similarity features")
+    parser.add_argument("param_path", type=Path, help="json file of an EnvParam")
+    parser.add_argument("--overwrite", action="store_true")
+    args = parser.parse_args()
+
+    param = EnvParam.load_json(args.param_path)
+    precompute_similarity(param, overwrite=args.overwrite)
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ["MIDIFileSource", "RealTimeFollower", "make_streaming_manager"]
+
+import asyncio
+from collections.abc import AsyncIterator, Callable
+
+import numpy as np
+from sabanamusic.common.types import PathLike
+
+from measure_following_game.environment.context import ContextManager
+from measure_following_game.environment.param import EnvParam
+from measure_following_game.environment.record import StreamingRecord
+from measure_following_game.environment.utils import make_manager, make_renderer
+from measure_following_game.midi import read_midi_events
+from measure_following_game.types import ActType, ObsType
+
+
+class MIDIFileSource(object):
+
+    # local stand-in for a live MIDI input: replays the note events of a file
+    # at wall-clock pace (scaled by `speed`) as (pitch, velocity) pairs
+
+    def __init__(self, path: PathLike, speed: float = 1.0):
+        self.events = read_midi_events(path)
+        self.speed = speed
+
+    async def __aiter__(self) -> AsyncIterator[tuple[int, int]]:
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for event_time, pitch, velocity in self.events.tolist():
+            delay = start + event_time / self.speed - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            yield int(pitch), int(velocity)
+
+
+def make_streaming_manager(param: EnvParam, **record_options) -> ContextManager:
+    # a context manager of `param` whose record is a `StreamingRecord`
+    renderer = make_renderer(
+        param.renderer_id,
+        param.score_root,
+        param.fps,
+        param.onset_only,
+        param.renderer_options,
+    )
+    record = StreamingRecord(
+        fps=param.fps,
+        buffer_duration=param.buffer_duration,
+        buffer_step_size=param.buffer_step_size,
+        onset_only=param.onset_only,
+        num_dims=renderer.score_measures.num_dims,
+        **record_options,
+    )
+    return make_manager(
+        param.manager_id,
+        renderer,
+        record,
+        param.window_size,
+        param.memory_size,
+        param.manager_options,
+    )
+
+
+class RealTimeFollower(object):
+
+    # Follows a live performance: every 1/fps seconds the frame that just
+    # ended is closed and the observation of the current window is produced,
+    # which must happen before the next frame ends (the deadline). Late frames
+    # are reported; frames that end while the follower is still behind are
+    # folded into the next observation (`catch_up`) instead of queueing up.
+    # With the `decision_interval` of the manager, an observation is produced
+    # every that many frames (or at the first frame with note-ons, with
+    # `onset_trigger`); the frames in between are closed at their end too.
+
+    def __init__(
+        self,
+        manager: ContextManager,
+        policy: Callable[[ObsType], ActType],
+        on_frame: Callable[[ObsType, dict], None] | None = None,
+        catch_up: bool = True,
+    ):
+        if not isinstance(manager.record, StreamingRecord):
+            raise TypeError("`manager` must follow a `StreamingRecord`")
+        self.manager = manager
+        self.record: StreamingRecord = manager.record
+        self.policy = policy
+        self.on_frame = on_frame
+        self.catch_up = catch_up
+        self.frame_duration = 1.0 / self.record.fps
+
+        self.latencies: list[float] = []
+        self.num_missed = 0
+        self.num_dropped = 0
+
+    @property
+    def stats(self) -> dict:
+        latencies = np.asarray(self.latencies)
+        return {
+            "num_frames": len(latencies),
+            "missed_deadlines": self.num_missed,
+            "dropped_frames": self.num_dropped,
+            "deadline": self.frame_duration,
+            "mean_latency": float(latencies.mean()) if len(latencies) else 0.0,
+            "max_latency": float(latencies.max()) if len(latencies) else 0.0,
+        }
+
+    async def _ingest(self, source: AsyncIterator[tuple[int, int]]):
+        async for pitch, velocity in source:
+            self.record.push(pitch, velocity)
+        self.record.close()
+
+    async def _follow(self, max_duration: float | None):
+        record, manager = self.record, self.manager
+        observation = manager.reset()
+        num_skipped = 0  # frames closed since the last decision
+        while not manager.done:
+            # wait for the end of the frame after the last closed one
+            frame_end = (record.frame + 1) * self.frame_duration
+            delay = frame_end - record.elapsed
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if max_duration is not None and record.elapsed >= max_duration:
+                break
+
+            if self.catch_up:
+                num_ended = int(record.elapsed / self.frame_duration)
+                while record.frame + 1 < num_ended and not manager.done:
+                    manager.skip_frame()
+                    self.num_dropped += 1
+                    num_skipped += 1
+                if manager.done:
+                    break
+
+            decide = num_skipped + 1 >= manager.decision_interval or (
+                manager.onset_trigger and record.next_frame_has_onsets()
+            )
+            if not decide:
+                manager.skip_frame()
+                num_skipped += 1
+                await asyncio.sleep(0)
+                continue
+            num_skipped = 0
+
+            # latency on the clock of the record: from the end of the frame to
+            # its observation, so late scheduling counts as well
+            observation = manager.follow(self.policy(observation))
+            latency = record.elapsed - record.frame * self.frame_duration
+            missed = latency > self.frame_duration
+            self.latencies.append(latency)
+            self.num_missed += missed
+            if self.on_frame is not None:
+                self.on_frame(
+                    observation,
+                    {"frame": record.frame, "latency": latency, "missed": missed},
+                )
+            await asyncio.sleep(0)  # let the source deliver its events
+
+    async def run(
+        self,
+        source: AsyncIterator[tuple[int, int]],
+        max_duration: float | None = None,
+    ) -> dict:
+        # follows until the source is exhausted (or for `max_duration` s)
+        self.latencies, self.num_missed, self.num_dropped = [], 0, 0
+        follower = asyncio.ensure_future(self._follow(max_duration))
+        ingest = asyncio.ensure_future(self._ingest(source))
+        try:
+            await follower
+        finally:
+            ingest.cancel()
+            await asyncio.gather(ingest, return_exceptions=True)
+        return self.stats
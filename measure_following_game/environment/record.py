@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ["StreamingRecord", "get_record_state", "set_record_state"]
+
+from collections import deque
+from collections.abc import Callable, Mapping
+import copy
+import time
+from types import MappingProxyType
+
+import numpy as np
+from sabanamusic.common.types import PositiveInt
+from sabanamusic.models.musical import Record
+
+
+class StreamingRecord(Record):
+
+    # A record fed with MIDI note events as they arrive, for live following.
+    # It offers the interface of `MIDIRecord` used by the context managers:
+    # frames of 1/fps seconds are closed by `step`, and the buffer holds the
+    # last `buffer_duration` seconds, evicted `buffer_step_size` frames at a
+    # time so that streamed DTW state survives most steps. There is no ground
+    # truth, so `true_action` is always -1.
+
+    def __init__(
+        self,
+        fps: PositiveInt = 20,
+        buffer_duration: PositiveInt = 3,
+        buffer_step_size: PositiveInt = 10,
+        onset_only: bool = True,
+        num_dims: PositiveInt = 128,
+        clock: Callable[[], float] = time.monotonic,
+        **kwargs,
+    ):
+        self.fps = fps
+        self.buffer_size = buffer_duration * fps
+        self.buffer_step_size = min(buffer_step_size, self.buffer_size)
+        self.onset_only = onset_only
+        self.num_dims = num_dims
+        self.clock = clock
+
+        # note events not yet assigned to a frame: (time, pitch, velocity)
+        self.pending: deque[tuple[float, int, int]] = deque()
+        self.active = np.zeros(num_dims, dtype=np.float32)
+        self.roll = np.zeros((self.buffer_size, num_dims), dtype=np.float32)
+        self.onset_roll = np.zeros((self.buffer_size, num_dims), dtype=np.float32)
+        self.reset(0)
+
+    def _to_dim(self, pitch: int) -> int:
+        # 128: midi pitch, 88: piano key, otherwise pitch class like chroma
+        if self.num_dims == 128:
+            return pitch
+        if self.num_dims == 88:
+            return min(max(pitch - 21, 0), 87)
+        return pitch % self.num_dims
+
+    @property
+    def true_action(self) -> int:
+        return -1
+
+    @property
+    def num_frames(self) -> int:
+        return self.buffer_frames
+
+    @property
+    def onset_indices(self) -> np.ndarray:
+        onset_roll = self.onset_roll[: self.buffer_frames]
+        return np.flatnonzero(onset_roll.any(axis=1))
+
+    @property
+    def elapsed(self) -> float:
+        # seconds since the last reset
+        return self.clock() - self.origin
+
+    def push(self, pitch: int, velocity: int, timestamp: float | None = None):
+        # a note-on (or note-off for velocity 0) at `timestamp` seconds since
+        # the last reset; events without a timestamp are stamped on arrival
+        if timestamp is None:
+            timestamp = self.elapsed
+        self.pending.append((timestamp, int(pitch), int(velocity)))
+
+    def next_frame_has_onsets(self) -> bool:
+        # whether the frame closed by the next `step` has note-ons so far
+        frame_end = (self.frame + 1) / self.fps
+        for timestamp, _, velocity in self.pending:
+            if timestamp >= frame_end:
+                break
+            if velocity > 0:
+                return True
+        return False
+
+    def close(self):
+        # the performance is over; the episode ends after the pending frames
+        self.closed = True
+
+    def get_repr_sequence(self) -> np.ndarray:
+        if self.onset_only:
+            return self.onset_roll[self.onset_indices]
+        return self.roll[: self.buffer_frames]
+
+    def get_pitch_histogram(self, alignment: tuple[int, int]) -> np.ndarray:
+        # onsets, like the histograms of the score and of `MIDIRecord`; held
+        # notes would count once per frame
+        head, tail = alignment
+        histogram = self.onset_roll[head : max(tail, head + 1)].sum(axis=0)
+        return histogram / max(float(histogram.sum()), 1.0)
+
+    def step(self):
+        # closes the current frame with the events that arrived before its end
+        if self.buffer_frames == self.buffer_size:
+            keep = self.buffer_size - self.buffer_step_size
+            self.roll[:keep] = self.roll[self.buffer_step_size :]
+            self.onset_roll[:keep] = self.onset_roll[self.buffer_step_size :]
+            self.buffer_frames = keep
+
+        self.frame += 1
+        frame_end = self.frame / self.fps
+        onsets = np.zeros(self.num_dims, dtype=np.float32)
+        while self.pending and self.pending[0][0] < frame_end:
+            _, pitch, velocity = self.pending.popleft()
+            dim = self._to_dim(pitch)
+            if velocity > 0:
+                onsets[dim] = 1.0
+                self.active[dim] += 1.0
+            else:
+                self.active[dim] = max(self.active[dim] - 1.0, 0.0)
+
+        idx = self.buffer_frames
+        self.roll[idx] = np.minimum(self.active, 1.0)
+        np.maximum(self.roll[idx], onsets, out=self.roll[idx])
+        self.onset_roll[idx] = onsets
+        self.buffer_frames += 1
+        self.done = self.closed and not self.pending
+
+    def reset(self, start_measure: int = 0, seed: int | None = None, options={}):
+        # restarts the clock; the buffer starts with one silent frame
+        self.origin = self.clock()
+        self.frame = 0
+        self.pending.clear()
+        self.active.fill(0.0)
+        self.roll.fill(0.0)
+        self.onset_roll.fill(0.0)
+        self.buffer_frames = 1
+        self.closed = False
+        self.done = False
+
+    def get_state(self) -> Mapping:
+        # the attributes, with copies of the buffers that `step` writes into
+        state = dict(vars(self))
+        state["pending"] = tuple(self.pending)
+        for name in ("active", "roll", "onset_roll"):
+            state[name] = getattr(self, name).copy()
+        return MappingProxyType(state)
+
+    def set_state(self, state: Mapping):
+        for name, value in state.items():
+            if name == "pending":
+                self.pending.clear()
+                self.pending.extend(value)
+            elif name in ("active", "roll", "onset_roll"):
+                np.copyto(getattr(self, name), value)
+            else:
+                setattr(self, name, value)
+
+
+def _copy_mutable(value):
+    # buffers a record may update in place; read-only arrays (e.g. a parsed
+    # performance) are shared
+    if isinstance(value, np.ndarray):
+        return value.copy() if value.flags.writeable else value
+    if isinstance(value, (list, dict, set, deque)):
+        return copy.copy(value)
+    return value
+
+
+def get_record_state(record: Record) -> Mapping:
+    # records without `get_state` (e.g. `MIDIRecord`) are saved by their
+    # attributes, with copies of the mutable ones
+    if callable(getattr(record, "get_state", None)):
+        return record.get_state()
+    return MappingProxyType(
+        {name: _copy_mutable(value) for name, value in vars(record).items()}
+    )
+
+
+def set_record_state(record: Record, state: Mapping):
+    # copies again, so that the state can be restored again
+    if callable(getattr(record, "set_state", None)):
+        record.set_state(state)
+    else:
+        vars(record).update(
+            {name: _copy_mutable(value) for name, value in state.items()}
+        )
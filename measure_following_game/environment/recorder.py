@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ["EpisodeRecorder", "write_png"]
+
+from pathlib import Path
+import queue
+import struct
+import threading
+import zlib
+
+from beartype import beartype
+import numpy as np
+from sabanamusic.common.types import PathLike, PositiveInt
+
+from measure_following_game.environment.context import (
+    LayoutContextRenderer,
+    RasterContextRenderer,
+    RenderSnapshot,
+)
+
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def _png_chunk(tag: bytes, data: bytes) -> bytes:
+    crc = zlib.crc32(tag + data) & 0xFFFFFFFF
+    return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", crc)
+
+
+def write_png(path: PathLike, frame: np.ndarray, compression: int = 6):
+    # (height, width, 1 or 3) uint8 frame as an 8-bit gray or RGB PNG. zlib
+    # releases the GIL, so a writer thread runs alongside the agent loop
+    height, width, num_channels = frame.shape
+    color_type = {1: 0, 3: 2}[num_channels]
+    scanlines = np.zeros((height, width * num_channels + 1), dtype=np.uint8)
+    scanlines[:, 1:] = frame.reshape(height, -1)  # filter type 0 per line
+    header = struct.pack(">IIBBBBB", width, height, 8, color_type, 0, 0, 0)
+    with open(path, "wb") as file:
+        file.write(_PNG_SIGNATURE)
+        file.write(_png_chunk(b"IHDR", header))
+        file.write(_png_chunk(b"IDAT", zlib.compress(scanlines.tobytes(), compression)))
+        file.write(_png_chunk(b"IEND", b""))
+
+
+class EpisodeRecorder(object):
+
+    # Records the frames of a renderer without drawing in the agent loop:
+    # `capture` only takes a `RenderSnapshot` (sheet, window head, cursor and
+    # visible measures) and queues it. A worker thread rasterizes snapshots
+    # with its own `RasterContextRenderer` and writes them as a PNG sequence
+    # (`output_format="png"`) or a video ("mp4", needs imageio[ffmpeg]).
+    # The queue is bounded: when it is full, `capture` waits for the worker
+    # (`block=True`) or drops the frame and counts it.
+
+    @beartype
+    def __init__(
+        self,
+        renderer: LayoutContextRenderer,
+        output_path: PathLike,
+        output_format: str = "png",
+        resolution: tuple[int, int] | None = None,
+        grayscale: bool = False,
+        fps: PositiveInt | None = None,
+        max_queue_size: PositiveInt = 64,
+        block: bool = True,
+    ):
+        if output_format not in ("png", "mp4"):
+            raise ValueError(f"unsupported format: {output_format}")
+        self.renderer = renderer
+        self.output_path = Path(output_path)
+        self.output_format = output_format
+        self.block = block
+        self.fps = fps or renderer.fps
+
+        self.writer = None
+        if output_format == "mp4":
+            try:
+                import imageio.v2 as imageio
+            except ImportError as error:
+                raise ImportError("mp4 output requires imageio[ffmpeg]") from error
+            self.output_path.parent.mkdir(parents=True, exist_ok=True)
+            self.writer = imageio.get_writer(self.output_path, fps=self.fps)
+        else:
+            self.output_path.mkdir(parents=True, exist_ok=True)
+
+        # the rasterizer draws a sheet layout of its own when it is created,
+        # which must not advance the random state of the environment
+        random_state = np.random.get_state()
+        try:
+            self.raster = RasterContextRenderer(
+                renderer.score_root,
+                renderer.fps,
+                renderer.onset_only,
+                score_measures=renderer.score_measures,
+                resolution=resolution,
+                grayscale=grayscale,
+                channel_last=True,
+            )
+        finally:
+            np.random.set_state(random_state)
+        self.frame = np.empty(self.raster.frame_shape, dtype=np.uint8)
+
+        self.queue: queue.Queue[RenderSnapshot | None] = queue.Queue(max_queue_size)
+        self.num_captured = 0
+        self.num_written = 0
+        self.num_dropped = 0
+        self.error: BaseException | None = None
+        self.worker = threading.Thread(target=self._work, daemon=True)
+        self.worker.start()
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "captured": self.num_captured,
+            "written": self.num_written,
+            "dropped": self.num_dropped,
+        }
+
+    def capture(self) -> bool:
+        # queues the current state of the renderer; False if it was dropped
+        if self.error is not None:
+            raise RuntimeError("the recorder failed") from self.error
+        snapshot = self.renderer.snapshot()
+        try:
+            self.queue.put(snapshot, block=self.block)
+        except queue.Full:
+            self.num_dropped += 1
+            return False
+        self.num_captured += 1
+        return True
+
+    def _write(self, frame: np.ndarray):
+        if self.writer is not None:
+            self.writer.append_data(frame[..., 0] if frame.shape[-1] == 1 else frame)
+        else:
+            path = self.output_path / f"frame_{self.num_written:06d}.png"
+            write_png(path, frame)
+        self.num_written += 1
+
+    def _work(self):
+        while (snapshot := self.queue.get()) is not None:
+            try:
+                if self.error is None:
+                    self._write(self.raster.rasterize_snapshot(snapshot, self.frame))
+            except BaseException as error:
+                self.error = error
+            finally:
+                self.queue.task_done()
+        self.queue.task_done()
+
+    def close(self) -> dict:
+        # waits for the queued frames to be written and returns the stats
+        if self.worker.is_alive():
+            self.queue.put(None)
+            self.worker.join()
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        if self.error is not None:
+            raise RuntimeError("the recorder failed") from self.error
+        return self.stats
+
+    def __enter__(self) -> "EpisodeRecorder":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -6,10 +6,13 @@ from abc import abstractmethod
 from typing import ClassVar
 
 from beartype import beartype
+import numpy as np
+import numpy.typing as npt
 from numpy import clip
 from sabanamusic.common.types import PositiveInt
 
 from measure_following_game.types import ActType
+from measure_following_game.validation import Validation, validated
 
 
 class Reward(object):
@@ -20,14 +23,50 @@ class Reward(object):
     def __init__(self, window_size: PositiveInt = 16, **kwargs):
         self.window_size = window_size
         self.num_actions = window_size + 2  # +2 for `slide` and `stay`
-
-    @beartype
+        self._reward_table: np.ndarray | None = None
+        self.validation: Validation = kwargs.get("validation") or Validation()
+
+    @property
+    def reward_table(self) -> np.ndarray:
+        # reward_table[true_action, pred_action] == _calc_reward(...)
+        # negative true actions (-1, -2) index the `stay` and `slide` rows
+        if self._reward_table is None:
+            self._reward_table = self._build_reward_table()
+        return self._reward_table
+
+    @validated
     def __call__(self, true_action: int, pred_policy: ActType) -> float:
-        assert len(pred_policy) == self.num_actions
-        expected_reward = 0.0
-        for pred_action, pred_prob in enumerate(pred_policy):
-            expected_reward += pred_prob * self._calc_reward(true_action, pred_action)
-        return expected_reward
+        if self.validation.active:
+            assert len(pred_policy) == self.num_actions
+        return float(self.reward_table[true_action] @ pred_policy.astype(np.float64))
+
+    def total(self, true_actions: npt.ArrayLike, pred_policy: ActType) -> float:
+        # summed reward of one policy held over several frames (frame skip)
+        true_actions = np.asarray(true_actions, dtype=np.int64)
+        if len(true_actions) == 0:
+            return 0.0
+        rewards = self.reward_table[true_actions].sum(axis=0)
+        return float(rewards @ pred_policy.astype(np.float64))
+
+    def batch(
+        self, true_actions: npt.ArrayLike, pred_policies: npt.ArrayLike
+    ) -> np.ndarray:
+        # rewards of a whole trajectory or a whole vector of environments
+        true_actions = np.asarray(true_actions, dtype=np.int64)
+        pred_policies = np.asarray(pred_policies, dtype=np.float64)
+        assert true_actions.ndim == 1
+        assert pred_policies.shape == (len(true_actions), self.num_actions)
+        return np.einsum("ij,ij->i", self.reward_table[true_actions], pred_policies)
+
+    def _build_reward_table(self) -> np.ndarray:
+        reward_table = np.empty((self.num_actions, self.num_actions))
+        for true_action in range(self.num_actions):
+            for pred_action in range(self.num_actions):
+                reward_table[true_action, pred_action] = self._calc_reward(
+                    true_action, pred_action
+                )
+        reward_table.flags.writeable = False
+        return reward_table
 
     def _is_measure(self, action: int) -> bool:
         # action:
@@ -47,8 +86,9 @@ class TriangleReward(Reward):
 
     @beartype
     def __init__(self, window_size: PositiveInt = 16, **kwargs):
-        super().__init__(window_size)
+        super().__init__(window_size, **kwargs)
         self.threshold = window_size // 2
+        self._reward_table = self._build_reward_table()
 
     def _calc_reward(self, true_action: int, pred_action: int) -> float:
         if self._is_measure(true_action) and self._is_measure(pred_action):
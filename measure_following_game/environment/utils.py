@@ -1,21 +1,26 @@
 # -*- coding: utf-8 -*-
 
 __all__ = [
+    "make_async_vector_env",
     "make_env",
     "make_env_param",
+    "make_envs",
     "make_manager",
     "make_record",
     "make_renderer",
     "make_reward",
+    "make_vector_env",
 ]
 
+from functools import partial
 from typing import Any
 
 from beartype import beartype
 from sabanamusic.common.types import PathLike, PositiveInt
-from sabanamusic.models.musical import Record, MIDIRecord
+from sabanamusic.models.musical import Measure, Record, MIDIRecord
 
 from measure_following_game.environment import *
+from measure_following_game.validation import Validation
 
 
 @beartype
@@ -38,24 +43,30 @@ def make_env_param(
     record_options: dict[str, Any] = {},
     renderer_options: dict[str, Any] = {},
     manager_options: dict[str, Any] = {},
+    # validation
+    validation: str = "full",
+    validation_interval: PositiveInt = 100,
 ) -> EnvParam:
+    # by keyword: the fields of `EnvParam` are not in the order of the arguments
     return EnvParam(
-        score_root,
-        record_name,
-        window_size,
-        memory_size,
-        fps,
-        onset_only,
-        buffer_duration,
-        buffer_step_size,
-        reward_id,
-        manager_id,
-        renderer_id,
-        record_id,
-        reward_options,
-        record_options,
-        renderer_options,
-        manager_options,
+        score_root=score_root,
+        record_name=record_name,
+        window_size=window_size,
+        memory_size=memory_size,
+        fps=fps,
+        onset_only=onset_only,
+        buffer_duration=buffer_duration,
+        buffer_step_size=buffer_step_size,
+        reward_id=reward_id,
+        record_id=record_id,
+        renderer_id=renderer_id,
+        manager_id=manager_id,
+        reward_options=reward_options,
+        record_options=record_options,
+        renderer_options=renderer_options,
+        manager_options=manager_options,
+        validation=validation,
+        validation_interval=validation_interval,
     )
 
 
@@ -108,6 +119,14 @@ def make_renderer(
     match renderer_id.lower():
         case "grid":
             return GridContextRenderer(score_root, fps, onset_only, **renderer_options)
+        case "layout":
+            return LayoutContextRenderer(
+                score_root, fps, onset_only, **renderer_options
+            )
+        case "raster":
+            return RasterContextRenderer(
+                score_root, fps, onset_only, **renderer_options
+            )
         case _:
             raise KeyError(f"Unknown id: {renderer_id}")
 
@@ -126,16 +145,35 @@ def make_manager(
             return MIDIContextManager(
                 renderer, record, window_size, memory_size, **manager_options
             )
+        case "chroma":
+            return ChromaContextManager(
+                renderer, record, window_size, memory_size, **manager_options
+            )
         case _:
             raise KeyError(f"Unknown id: {manager_id}")
 
 
 @beartype
-def make_env(param: EnvParam) -> MeasureFollowingEnv:
-    reward = make_reward(param.reward_id, param.window_size)
+def make_env(
+    param: EnvParam,
+    score_measures: list[Measure] | ScoreFeatureStore | None = None,
+    validation: Validation | None = None,
+) -> MeasureFollowingEnv:
+    reward = make_reward(param.reward_id, param.window_size, param.reward_options)
+
+    renderer_options = dict(param.renderer_options)
+    if validation is None:
+        validation = Validation(param.validation, param.validation_interval)
+    renderer_options["validation"] = validation
+    if score_measures is not None:
+        renderer_options["score_measures"] = score_measures
 
     renderer = make_renderer(
-        param.renderer_id, param.score_root, param.fps, param.onset_only
+        param.renderer_id,
+        param.score_root,
+        param.fps,
+        param.onset_only,
+        renderer_options,
     )
 
     record = make_record(
@@ -146,14 +184,50 @@ def make_env(param: EnvParam) -> MeasureFollowingEnv:
         param.buffer_duration,
         param.buffer_step_size,
         param.onset_only,
+        param.record_options,
     )
 
+    if (similarity_cache := param.manager_options.get("similarity_cache")) is not None:
+        check_similarity_cache(param, similarity_cache)
     manager = make_manager(
         param.manager_id,
         renderer,
         record,
         param.window_size,
         param.memory_size,
+        param.manager_options,
     )
 
     return MeasureFollowingEnv(manager, reward)
+
+
+@beartype
+def make_envs(param: EnvParam, num_envs: PositiveInt) -> list[MeasureFollowingEnv]:
+    # the score is parsed once and shared by every environment, and so is the
+    # validation, so that a step of all of them is checked or not as a whole
+    validation = Validation(param.validation, param.validation_interval)
+    envs = [make_env(param, validation=validation)]
+    score_measures = envs[0].manager.score_measures
+    for _ in range(num_envs - 1):
+        envs.append(make_env(param, score_measures, validation))
+    return envs
+
+
+@beartype
+def make_vector_env(
+    param: EnvParam, num_envs: PositiveInt
+) -> VectorMeasureFollowingEnv:
+    return VectorMeasureFollowingEnv(make_envs(param, num_envs))
+
+
+@beartype
+def make_async_vector_env(
+    param: EnvParam,
+    num_envs: PositiveInt,
+    num_workers: PositiveInt | None = None,
+    context: str | None = "spawn",
+) -> AsyncVectorMeasureFollowingEnv:
+    # each worker parses the score once for the environments it owns
+    return AsyncVectorMeasureFollowingEnv(
+        partial(make_envs, param), num_envs, num_workers, context
+    )
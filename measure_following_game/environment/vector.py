@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ["VectorMeasureFollowingEnv"]
+
+from collections.abc import Sequence
+
+from beartype import beartype
+from gym import spaces
+import numpy as np
+import numpy.typing as npt
+
+from measure_following_game.environment.context import rasterize_batch
+from measure_following_game.environment.env import MeasureFollowingEnv
+
+
+class VectorMeasureFollowingEnv(object):
+    @beartype
+    def __init__(self, envs: Sequence[MeasureFollowingEnv]):
+        self.envs = list(envs)
+        if not self.envs:
+            raise ValueError("`envs` must contain at least one environment")
+
+        self.num_envs = len(self.envs)
+        self.managers = [env.manager for env in self.envs]
+        # environments of `make_envs` share one validation, so the steps of
+        # all of them follow the check decision of the vector step
+        self.validation = self.envs[0].validation
+        self.rewards = [env.reward for env in self.envs]
+
+        # environments built from one param share a reward table, so all
+        # rewards of a step can be scored in a single batched call
+        reward = self.rewards[0]
+        self.shared_reward = reward
+        for other in self.rewards[1:]:
+            if type(other) is not type(reward) or not np.array_equal(
+                other.reward_table, reward.reward_table
+            ):
+                self.shared_reward = None
+                break
+
+        manager = self.managers[0]
+        self.num_actions = manager.num_actions
+        self.window_shape = manager.window_shape
+        self.memory_shape = manager.memory_shape
+        for other in self.managers[1:]:
+            if (other.window_shape, other.memory_shape) != (
+                self.window_shape,
+                self.memory_shape,
+            ):
+                raise ValueError("all environments must share the same spaces")
+
+        self.metadata = self.envs[0].metadata
+        self.reward_range = self.envs[0].reward_range
+        self.single_action_space = self.envs[0].action_space
+        self.single_observation_space = self.envs[0].observation_space
+        self.action_space = spaces.Box(
+            low=0.0, high=1.0, shape=(self.num_envs, self.num_actions)
+        )
+        self.observation_space = spaces.Tuple(
+            (
+                spaces.Box(
+                    low=0.0, high=1.0, shape=(self.num_envs, *self.window_shape)
+                ),
+                spaces.Box(
+                    low=0.0, high=1.0, shape=(self.num_envs, *self.memory_shape)
+                ),
+            )
+        )
+
+        # observations are written into these buffers and returned as-is,
+        # so callers that keep them across steps must copy
+        self.similarity_matrices = np.zeros(
+            shape=(self.num_envs, *self.window_shape), dtype=np.float32
+        )
+        self.policy_memories = np.zeros(
+            shape=(self.num_envs, *self.memory_shape), dtype=np.float32
+        )
+        self.step_rewards = np.zeros(shape=self.num_envs, dtype=np.float32)
+        self.dones = np.zeros(shape=self.num_envs, dtype=bool)
+
+    def bind_buffers(
+        self,
+        similarity_matrices: np.ndarray,
+        policy_memories: np.ndarray,
+        step_rewards: np.ndarray,
+        dones: np.ndarray,
+    ):
+        # lets callers (e.g. shared-memory workers) own the output buffers
+        buffers = {
+            "similarity_matrices": similarity_matrices,
+            "policy_memories": policy_memories,
+            "step_rewards": step_rewards,
+            "dones": dones,
+        }
+        for name, buffer in buffers.items():
+            current = getattr(self, name)
+            if buffer.shape != current.shape or buffer.dtype != current.dtype:
+                raise ValueError(f"invalid buffer for `{name}`")
+        for name, buffer in buffers.items():
+            setattr(self, name, buffer)
+
+    @property
+    def observations(self) -> tuple[np.ndarray, np.ndarray]:
+        return (self.similarity_matrices, self.policy_memories)
+
+    def _write_observation(self, idx: int, observation):
+        similarity_matrix, policy_memory = observation
+        self.similarity_matrices[idx] = similarity_matrix
+        self.policy_memories[idx] = policy_memory
+
+    def _check_policies(self, pred_policies: np.ndarray):
+        if not (
+            np.all((0.0 <= pred_policies) & (pred_policies <= 1.0))
+            and np.allclose(np.sum(pred_policies, axis=1), 1.0)
+        ):
+            raise ValueError("each row of `pred_policies` must be a policy")
+
+    def step(
+        self, pred_policies: npt.NDArray[np.float32]
+    ) -> tuple[tuple[np.ndarray, np.ndarray], np.ndarray, np.ndarray, list[dict]]:
+        pred_policies = np.asarray(pred_policies, dtype=np.float32)
+        if pred_policies.shape != (self.num_envs, self.num_actions):
+            raise ValueError(f"invalid policy shape: {pred_policies.shape}")
+
+        # the steps of the environments nest in this check decision
+        try:
+            if self.validation.enter():
+                self._check_policies(pred_policies)
+            infos = self._step_managers(pred_policies)
+        finally:
+            self.validation.exit()
+        return self.observations, self.step_rewards, self.dones, infos
+
+    def _step_managers(self, pred_policies: np.ndarray) -> list[dict]:
+        infos = []
+        true_actions = np.empty(self.num_envs, dtype=np.int64)
+        for idx, manager in enumerate(self.managers):
+            observation, true_actions[idx], done, info = manager.step(
+                pred_policies[idx]
+            )
+            self.dones[idx] = done
+            if done:
+                # auto-reset: the last observation of the episode goes to info
+                info = dict(info)
+                info["final_observation"] = (
+                    observation[0].copy(),
+                    observation[1].copy(),
+                )
+                observation = manager.reset()
+            self._write_observation(idx, observation)
+            infos.append(info)
+
+        if self.shared_reward is not None:
+            self.step_rewards[:] = self.shared_reward.batch(true_actions, pred_policies)
+        else:
+            for idx, reward in enumerate(self.rewards):
+                self.step_rewards[idx] = reward(
+                    int(true_actions[idx]), pred_policies[idx]
+                )
+        # frame skip: the policy also scores on the frames skipped by the step
+        for idx, info in enumerate(infos):
+            if info.get("skipped_true_actions"):
+                self.step_rewards[idx] += self.rewards[idx].total(
+                    info["skipped_true_actions"], pred_policies[idx]
+                )
+        return infos
+
+    def render_batch(self, out: np.ndarray | None = None) -> np.ndarray:
+        # (num_envs, height, width, channels) frames of "raster" renderers
+        return rasterize_batch([manager.renderer for manager in self.managers], out)
+
+    @beartype
+    def reset(
+        self,
+        *,
+        seed: int | Sequence[int | None] | None = None,
+        return_info: bool = False,
+        options: dict | None = None,
+    ) -> tuple[np.ndarray, np.ndarray] | tuple[tuple[np.ndarray, np.ndarray], list]:
+        if seed is None or isinstance(seed, int):
+            seeds = [None if seed is None else seed + i for i in range(self.num_envs)]
+        else:
+            seeds = list(seed)
+            if len(seeds) != self.num_envs:
+                raise ValueError("`seed` must have one entry per environment")
+
+        infos = []
+        for idx, manager in enumerate(self.managers):
+            observation, info = manager.reset(
+                seed=seeds[idx], return_info=True, options=options
+            )
+            self._write_observation(idx, observation)
+            infos.append(info)
+        self.dones.fill(False)
+
+        if return_info:
+            return self.observations, infos
+        else:
+            return self.observations
+
+    def close(self):
+        for env in self.envs:
+            env.close()
+
+    def __del__(self):
+        self.close()
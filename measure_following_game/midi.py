@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ["read_midi_events", "write_midi"]
+
+from pathlib import Path
+import struct
+
+from beartype import beartype
+import numpy as np
+from sabanamusic.common.types import PathLike, PositiveInt
+
+# notes are (num_notes, 4) float arrays of onset (s), offset (s), pitch, velocity
+
+
+def _var_len(value: int) -> bytes:
+    # variable-length quantity of the standard MIDI file format
+    buffer = [value & 0x7F]
+    value >>= 7
+    while value:
+        buffer.append((value & 0x7F) | 0x80)
+        value >>= 7
+    return bytes(reversed(buffer))
+
+
+def _track_chunk(events: list[tuple[int, bytes]]) -> bytes:
+    # events are (absolute tick, message); end of track is appended
+    data, last_tick = bytearray(), 0
+    for tick, message in events:
+        data += _var_len(tick - last_tick) + message
+        last_tick = tick
+    data += _var_len(0) + b"\xff\x2f\x00"
+    return b"MTrk" + struct.pack(">I", len(data)) + bytes(data)
+
+
+@beartype
+def write_midi(
+    path: PathLike,
+    notes: np.ndarray,
+    tempo: float = 120.0,
+    ticks_per_beat: PositiveInt = 480,
+    time_signature: tuple[int, int] = (4, 4),
+):
+    # minimal format 1 SMF: a tempo track and a single piano track
+    microseconds_per_beat = int(round(60_000_000 / tempo))
+    numerator, denominator = time_signature
+    tempo_events = [
+        (0, b"\xff\x51\x03" + microseconds_per_beat.to_bytes(3, "big")),
+        (
+            0,
+            b"\xff\x58\x04" + bytes([numerator, int(np.log2(denominator)), 24, 8]),
+        ),
+    ]
+
+    ticks_per_second = ticks_per_beat * tempo / 60.0
+    note_events = []
+    for onset, offset, pitch, velocity in notes.tolist():
+        on_tick = int(round(onset * ticks_per_second))
+        off_tick = max(int(round(offset * ticks_per_second)), on_tick + 1)
+        pitch, velocity = int(pitch), int(velocity)
+        # note-offs sort before note-ons at the same tick
+        note_events.append((on_tick, 1, bytes([0x90, pitch, velocity])))
+        note_events.append((off_tick, 0, bytes([0x80, pitch, 64])))
+    note_events.sort(key=lambda event: event[:2])
+
+    header = b"MThd" + struct.pack(">IHHH", 6, 1, 2, ticks_per_beat)
+    with open(path, "wb") as file:
+        file.write(header)
+        file.write(_track_chunk(tempo_events))
+        file.write(_track_chunk([(tick, msg) for tick, _, msg in note_events]))
+
+
+def _read_var_len(data: bytes, idx: int) -> tuple[int, int]:
+    value = 0
+    while True:
+        byte = data[idx]
+        idx += 1
+        value = (value << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            return value, idx
+
+
+def read_midi_events(path: PathLike) -> np.ndarray:
+    # (num_events, 3) array of time (s), pitch and velocity of all note-on and
+    # note-off (velocity 0) events, in time order, honouring tempo changes
+    data = Path(path).read_bytes()
+    if data[:4] != b"MThd":
+        raise ValueError(f"not a standard MIDI file: {path}")
+    header_size, _, num_tracks, division = struct.unpack(">IHHH", data[4:14])
+    if division & 0x8000:
+        raise ValueError(f"SMPTE time division is not supported: {path}")
+
+    position = 8 + header_size
+    tempo_changes, notes = [(0, 500_000)], []  # (tick, microseconds per beat)
+    for _ in range(num_tracks):
+        if data[position : position + 4] != b"MTrk":
+            raise ValueError(f"malformed track chunk: {path}")
+        (length,) = struct.unpack(">I", data[position + 4 : position + 8])
+        idx, end = position + 8, position + 8 + length
+        tick, status = 0, 0
+        while idx < end:
+            delta, idx = _read_var_len(data, idx)
+            tick += delta
+            if data[idx] & 0x80:
+                status = data[idx]
+                idx += 1
+            # otherwise running status: the previous status byte is reused
+            if status == 0xFF:
+                kind = data[idx]
+                size, idx = _read_var_len(data, idx + 1)
+                if kind == 0x51:
+                    tempo_changes.append(
+                        (tick, int.from_bytes(data[idx : idx + 3], "big"))
+                    )
+                idx += size
+            elif status in (0xF0, 0xF7):
+                size, idx = _read_var_len(data, idx)
+                idx += size
+            else:
+                kind = status & 0xF0
+                if kind in (0x80, 0x90):
+                    pitch, velocity = data[idx], data[idx + 1]
+                    notes.append((tick, pitch, velocity if kind == 0x90 else 0))
+                idx += 1 if kind in (0xC0, 0xD0) else 2
+        position = end
+
+    # ticks to seconds through the piecewise-constant tempo map
+    tempo_changes.sort()
+    change_ticks = np.array([t for t, _ in tempo_changes], dtype=np.float64)
+    seconds_per_tick = np.array([u for _, u in tempo_changes]) * 1e-6 / division
+    change_times = np.concatenate(
+        [[0.0], np.cumsum(np.diff(change_ticks) * seconds_per_tick[:-1])]
+    )
+    events = np.array(notes, dtype=np.float64).reshape(-1, 3)
+    segment = np.searchsorted(change_ticks, events[:, 0], side="right") - 1
+    events[:, 0] = (
+        change_times[segment]
+        + (events[:, 0] - change_ticks[segment]) * seconds_per_tick[segment]
+    )
+    return events[np.argsort(events[:, 0], kind="stable")]
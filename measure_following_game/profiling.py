@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ["StepProfiler"]
+
+from collections.abc import Callable
+import time
+
+
+class StepProfiler(object):
+
+    # high-resolution timings of the phases of one step (or reset) and
+    # counters accumulated over the episode. phases are timed as laps: each
+    # `lap(name)` adds the time since the previous lap (or `begin`) to `name`.
+    # `end` finalizes the step, passes the metrics to `hook` and returns them.
+
+    def __init__(self, hook: Callable[[dict], None] | None = None):
+        self.hook = hook
+        self.timings: dict[str, int] = {}  # nanoseconds of the current step
+        self.counters: dict[str, int] = {}  # counts of the current episode
+        self.num_steps = 0
+        self._start = self._last = 0
+
+    def reset(self):
+        self.counters = {}
+        self.num_steps = 0
+
+    def begin(self):
+        self.timings = {}
+        self._start = self._last = time.perf_counter_ns()
+
+    def lap(self, name: str):
+        now = time.perf_counter_ns()
+        self.timings[name] = self.timings.get(name, 0) + now - self._last
+        self._last = now
+
+    def count(self, name: str, value: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def end(self, event: str = "step") -> dict:
+        total = time.perf_counter_ns() - self._start
+        if event == "step":
+            self.num_steps += 1
+        metrics = {
+            "event": event,
+            "num_steps": self.num_steps,
+            "timings": {k: v * 1e-9 for k, v in self.timings.items()},
+            "total": total * 1e-9,
+            "counters": dict(self.counters),
+        }
+        if self.hook is not None:
+            self.hook(metrics)
+        return metrics
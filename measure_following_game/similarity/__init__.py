@@ -0,0 +1,4 @@
+# -*- coding: utf-8 -*-
+
+from measure_following_game.similarity.dtw import *
+from measure_following_game.similarity.chroma import *
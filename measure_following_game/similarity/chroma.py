@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ["SlidingChromaCorrelation", "chroma_fold", "to_chroma"]
+
+import numpy as np
+import numpy.typing as npt
+
+from measure_following_game.similarity.dtw import as_frames
+
+NUM_PITCH_CLASSES = 12
+
+
+def chroma_fold(num_dims: int) -> np.ndarray:
+    # (num_dims, 12) matrix summing pitch dimensions into pitch classes.
+    # 128: midi pitch, 88: piano key (from A0), otherwise pitch classes
+    if num_dims == 128:
+        pitch_classes = np.arange(num_dims) % NUM_PITCH_CLASSES
+    elif num_dims == 88:
+        pitch_classes = (np.arange(num_dims) + 21) % NUM_PITCH_CLASSES
+    else:
+        pitch_classes = np.arange(num_dims) % NUM_PITCH_CLASSES
+    fold = np.zeros((num_dims, NUM_PITCH_CLASSES))
+    fold[np.arange(num_dims), pitch_classes] = 1.0
+    return fold
+
+
+def to_chroma(frames: npt.ArrayLike) -> np.ndarray:
+    frames = as_frames(frames)
+    return frames @ chroma_fold(frames.shape[1])
+
+
+def _fft_size(size: int) -> int:
+    return 1 << max(size - 1, 0).bit_length()
+
+
+class SlidingChromaCorrelation(object):
+
+    # Normalized cross-correlation of chroma queries (the score measures) at
+    # every offset against a reference (the record buffer), with FFTs along
+    # time: O(L log L) per query instead of the O(M N) of DTW. The score of a
+    # query starting at reference frame t (negative: only its tail overlaps)
+    # is <q, r[t:t+M]> / (|q| |r[t:t+M]|), so partial overlaps are penalized
+    # by the energy of the query that falls outside the reference. Spectra
+    # of the queries are cached per FFT size.
+
+    def __init__(self, queries: np.ndarray, lengths: npt.ArrayLike):
+        self.queries = np.asarray(queries, dtype=np.float64)
+        self.lengths = np.asarray(lengths, dtype=np.int64)
+        self.energies = np.sum(self.queries**2, axis=(1, 2))
+        self.spectra: dict[int, np.ndarray] = {}
+
+    @property
+    def query_length(self) -> int:
+        return self.queries.shape[1]
+
+    def _spectra(self, fft_size: int) -> np.ndarray:
+        if fft_size not in self.spectra:
+            self.spectra[fft_size] = np.conj(
+                np.fft.rfft(self.queries, n=fft_size, axis=1)
+            )
+        return self.spectra[fft_size]
+
+    def correlate(
+        self, indices: npt.ArrayLike, reference: npt.ArrayLike
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # best score of each query in `indices`, and the reference frames
+        # [head, tail) its best placement overlaps
+        indices = np.asarray(indices, dtype=np.int64)
+        reference = as_frames(reference)
+        num_queries, num_frames = len(indices), len(reference)
+        scores = np.zeros(num_queries)
+        heads = np.zeros(num_queries, dtype=np.int64)
+        tails = np.zeros(num_queries, dtype=np.int64)
+        if num_queries == 0 or num_frames == 0:
+            return scores, heads, tails
+
+        max_length = self.query_length
+        fft_size = _fft_size(num_frames + max_length - 1)
+        spectrum = np.fft.rfft(reference, n=fft_size, axis=0)
+        cross = np.sum(self._spectra(fft_size)[indices] * spectrum, axis=-1)
+        correlation = np.fft.irfft(cross, n=fft_size, axis=1)
+
+        # offsets -(M - 1) .. N - 1, negative ones wrap around the FFT buffer
+        offsets = np.arange(-(max_length - 1), num_frames)
+        correlation = correlation[:, offsets % fft_size]
+
+        lengths = self.lengths[indices][:, np.newaxis]
+        starts = np.clip(offsets, 0, num_frames)
+        ends = np.clip(offsets + lengths, 0, num_frames)
+        cumulative = np.concatenate([[0.0], np.cumsum(np.sum(reference**2, axis=1))])
+        reference_energies = cumulative[ends] - cumulative[starts]
+
+        norms = np.sqrt(self.energies[indices][:, np.newaxis] * reference_energies)
+        valid = (ends > starts) & (norms > 0.0)
+        normalized = np.where(valid, correlation / np.where(valid, norms, 1.0), -np.inf)
+
+        best = np.argmax(normalized, axis=1)
+        rows = np.arange(num_queries)
+        found = valid[rows, best]
+        scores[found] = np.clip(normalized[rows, best][found], 0.0, 1.0)
+        heads[found] = starts[best][found]
+        tails[found] = ends[rows, best][found]
+        return scores, heads, tails
@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+
+__all__ = [
+    "BatchedSubsequenceDTW",
+    "StreamingSubsequenceDTW",
+    "as_frames",
+    "frame_distances",
+    "frames_fingerprint",
+    "lower_bound_envelope",
+    "lower_bound_rows",
+    "nearest_frame_distances",
+    "pad_sequences",
+    "streamed_suffix",
+]
+
+from collections.abc import Sequence
+import hashlib
+
+import numpy as np
+import numpy.typing as npt
+
+
+def as_frames(sequence: npt.ArrayLike) -> np.ndarray:
+    frames = np.asarray(sequence, dtype=np.float64)
+    if frames.ndim == 1:
+        frames = frames[:, np.newaxis]
+    return frames
+
+
+def pad_sequences(
+    sequences: Sequence[npt.ArrayLike], num_dims: int | None = None
+) -> tuple[np.ndarray, np.ndarray]:
+    frames = [as_frames(sequence) for sequence in sequences]
+    lengths = np.array([len(f) for f in frames], dtype=np.int64)
+    if num_dims is None:
+        num_dims = max((f.shape[1] for f in frames), default=1)
+    max_length = max(int(lengths.max(initial=0)), 1)
+    padded = np.zeros((len(frames), max_length, num_dims))
+    for idx, f in enumerate(frames):
+        padded[idx, : len(f), : f.shape[1]] = f
+    return padded, lengths
+
+
+def frames_fingerprint(frames: np.ndarray) -> int:
+    # 64-bit content hash, used to find a record buffer in precomputed data
+    frames = np.ascontiguousarray(frames, dtype=np.float64)
+    digest = hashlib.blake2b(frames.tobytes(), digest_size=8).digest()
+    return int(np.frombuffer(digest, dtype=np.int64)[0])
+
+
+def streamed_suffix(streamed: np.ndarray | None, sequence: np.ndarray):
+    # frames of `sequence` that follow the already streamed ones, or None if
+    # `sequence` does not extend `streamed` (frames were evicted or replaced)
+    if (
+        streamed is not None
+        and len(streamed) <= len(sequence)
+        and np.array_equal(streamed, sequence[: len(streamed)])
+    ):
+        return sequence[len(streamed) :]
+    return None
+
+
+def frame_distances(query: np.ndarray, frames: np.ndarray) -> np.ndarray:
+    # euclidean distance between every query frame and every given frame
+    squared = (
+        np.sum(query**2, axis=-1)[..., :, np.newaxis]
+        + np.sum(frames**2, axis=-1)[np.newaxis, :]
+        - 2.0 * (query @ frames.T)
+    )
+    return np.sqrt(np.maximum(squared, 0.0))
+
+
+def _masked_row_sum(distances: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    mask = np.arange(distances.shape[1]) < np.asarray(lengths)[:, np.newaxis]
+    return np.sum(distances * mask, axis=1)
+
+
+def lower_bound_envelope(
+    queries: np.ndarray, lengths: npt.ArrayLike, frames: npt.ArrayLike
+) -> np.ndarray:
+    # LB_Keogh-style bound of the subsequence DTW distance of padded queries:
+    # every query frame is matched to at least one reference frame, and all of
+    # those lie inside the per-dimension envelope of the reference. O(B M P)
+    frames = as_frames(frames)
+    if len(frames) == 0:
+        return np.full(len(queries), np.inf)
+    lower, upper = frames.min(axis=0), frames.max(axis=0)
+    excess = np.maximum(queries - upper, 0.0) + np.maximum(lower - queries, 0.0)
+    return _masked_row_sum(np.sqrt(np.sum(excess**2, axis=-1)), lengths)
+
+
+def nearest_frame_distances(queries: np.ndarray, frames: npt.ArrayLike) -> np.ndarray:
+    # distance of every query frame to its nearest reference frame. the
+    # minimum over more frames is the minimum of the minima, so it can be
+    # streamed with `np.minimum` as frames arrive
+    frames = as_frames(frames)
+    if len(frames) == 0:
+        return np.full(queries.shape[:-1], np.inf)
+    return np.min(frame_distances(queries, frames), axis=-1)
+
+
+def lower_bound_rows(
+    queries: np.ndarray, lengths: npt.ArrayLike, frames: npt.ArrayLike
+) -> np.ndarray:
+    # tighter bound: the distance of every query frame to its nearest
+    # reference frame, without the warping recurrence. O(B M N P)
+    if len(as_frames(frames)) == 0:
+        return np.full(len(queries), np.inf)
+    return _masked_row_sum(nearest_frame_distances(queries, frames), lengths)
+
+
+class BatchedSubsequenceDTW(object):
+
+    # Subsequence DTW of a batch of queries (measures) against a reference
+    # (the record buffer) that grows one column at a time. Queries are padded
+    # to a common length and masked; only the last column of each accumulated
+    # cost matrix is kept, together with the reference column at which the
+    # best path into each cell started.
+
+    def __init__(self, queries: Sequence[npt.ArrayLike], num_dims: int | None = None):
+        self.queries, self.lengths = pad_sequences(queries, num_dims)
+        self.mask = np.arange(self.queries.shape[1]) < self.lengths[:, np.newaxis]
+        self.reset()
+
+    @classmethod
+    def from_padded(
+        cls, queries: np.ndarray, lengths: np.ndarray
+    ) -> "BatchedSubsequenceDTW":
+        # queries that are already padded, e.g. by a `ScoreFeatureStore`
+        batch = object.__new__(cls)
+        batch.queries = np.asarray(queries, dtype=np.float64)
+        batch.lengths = np.asarray(lengths, dtype=np.int64)
+        batch.mask = np.arange(batch.queries.shape[1]) < batch.lengths[:, np.newaxis]
+        batch.reset()
+        return batch
+
+    @property
+    def batch_size(self) -> int:
+        return len(self.lengths)
+
+    @property
+    def query_length(self) -> int:
+        return self.queries.shape[1]
+
+    def reset(self):
+        shape = (self.batch_size, self.query_length)
+        self.num_frames = 0
+        self.cost = np.full(shape, np.inf)
+        self.start = np.zeros(shape, dtype=np.int64)
+        self.distances = np.full(self.batch_size, np.inf)
+        self.heads = np.zeros(self.batch_size, dtype=np.int64)
+        self.tails = np.zeros(self.batch_size, dtype=np.int64)
+
+    def extend(self, frames: npt.ArrayLike):
+        frames = as_frames(frames)
+        if len(frames) == 0 or self.batch_size == 0:
+            self.num_frames += len(frames)
+            return
+
+        batch = np.arange(self.batch_size)
+        last_rows = np.maximum(self.lengths - 1, 0)
+        has_rows = self.lengths > 0
+        rows = np.broadcast_to(np.arange(self.query_length), self.cost.shape)
+        entry = np.empty(self.cost.shape)
+        local_costs = frame_distances(self.queries, frames)  # B x M x K
+        local_costs *= self.mask[:, :, np.newaxis]
+
+        for offset in range(len(frames)):
+            column = self.num_frames + offset
+            prefix = np.cumsum(local_costs[:, :, offset], axis=1)
+
+            # best predecessor in the previous column (horizontal or diagonal)
+            diagonal = np.empty_like(self.cost)
+            diagonal[:, 0] = np.inf
+            diagonal[:, 1:] = self.cost[:, :-1]
+            use_diagonal = diagonal < self.cost
+            previous = np.where(use_diagonal, diagonal, self.cost)
+            previous_start = np.where(
+                use_diagonal, np.roll(self.start, 1, axis=1), self.start
+            )
+
+            # vertical steps inside the column are resolved as a min-plus scan;
+            # entering at row 0 means starting a fresh subsequence here
+            entry[:, 0] = 0.0
+            entry[:, 1:] = previous[:, 1:] - prefix[:, :-1]
+            running = np.minimum.accumulate(entry, axis=1)
+            origin = np.maximum.accumulate(np.where(entry == running, rows, 0), axis=1)
+
+            self.cost = prefix + running
+            self.start = np.where(
+                origin == 0,
+                column,
+                np.take_along_axis(previous_start, origin, axis=1),
+            )
+
+            last_cost = self.cost[batch, last_rows]
+            improved = has_rows & (last_cost < self.distances)
+            self.distances[improved] = last_cost[improved]
+            self.heads[improved] = self.start[batch, last_rows][improved]
+            self.tails[improved] = column + 1
+
+        self.num_frames += len(frames)
+
+    def take(self, indices: npt.ArrayLike) -> "BatchedSubsequenceDTW":
+        indices = np.asarray(indices, dtype=np.int64)
+        taken = object.__new__(type(self))
+        taken.queries, taken.lengths = self.queries[indices], self.lengths[indices]
+        taken.mask = self.mask[indices]
+        taken.num_frames = self.num_frames
+        taken.cost, taken.start = self.cost[indices], self.start[indices]
+        taken.distances = self.distances[indices]
+        taken.heads, taken.tails = self.heads[indices], self.tails[indices]
+        return taken
+
+    def copy(self) -> "BatchedSubsequenceDTW":
+        # the queries are shared, the streamed state is copied
+        copied = object.__new__(type(self))
+        copied.__dict__.update(self.__dict__)
+        copied.cost, copied.start = self.cost.copy(), self.start.copy()
+        copied.distances = self.distances.copy()
+        copied.heads, copied.tails = self.heads.copy(), self.tails.copy()
+        return copied
+
+    @classmethod
+    def concatenate(
+        cls, batches: Sequence["BatchedSubsequenceDTW"]
+    ) -> "BatchedSubsequenceDTW":
+        # every batch must have streamed the same reference frames
+        assert len({b.num_frames for b in batches}) == 1
+        query_length = max(b.query_length for b in batches)
+
+        def pad(array: np.ndarray, value) -> np.ndarray:
+            width = [(0, 0)] * array.ndim
+            width[1] = (0, query_length - array.shape[1])
+            return np.pad(array, width, constant_values=value)
+
+        merged = object.__new__(cls)
+        merged.queries = np.concatenate([pad(b.queries, 0.0) for b in batches])
+        merged.lengths = np.concatenate([b.lengths for b in batches])
+        merged.mask = np.concatenate([pad(b.mask, False) for b in batches])
+        merged.num_frames = batches[0].num_frames
+        merged.cost = np.concatenate([pad(b.cost, np.inf) for b in batches])
+        merged.start = np.concatenate([pad(b.start, 0) for b in batches])
+        merged.distances = np.concatenate([b.distances for b in batches])
+        merged.heads = np.concatenate([b.heads for b in batches])
+        merged.tails = np.concatenate([b.tails for b in batches])
+        return merged
+
+
+class StreamingSubsequenceDTW(BatchedSubsequenceDTW):
+
+    # single-query view of `BatchedSubsequenceDTW`
+
+    def __init__(self, query: npt.ArrayLike):
+        super().__init__([query])
+        self.query = self.queries[0, : self.lengths[0]]
+
+    @property
+    def distance(self) -> float:
+        return float(self.distances[0])
+
+    @property
+    def head(self) -> int:
+        return int(self.heads[0])
+
+    @property
+    def tail(self) -> int:
+        return int(self.tails[0])
+
+    @property
+    def alignment(self) -> tuple[int, int]:
+        return (self.head, self.tail)
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+
+__all__ = [
+    "SyntheticScore",
+    "generate_dataset",
+    "generate_record",
+    "generate_score",
+    "write_musicxml",
+]
+
+from argparse import ArgumentParser
+from dataclasses import dataclass
+from pathlib import Path
+
+from beartype import beartype
+import numpy as np
+from sabanamusic.common.types import PathLike, PositiveInt
+
+from measure_following_game.midi import write_midi
+
+_PITCH_STEPS = ["C", "C", "D", "D", "E", "F", "F", "G", "G", "A", "A", "B"]
+
+
+@beartype
+def write_musicxml(
+    path: PathLike,
+    measure_notes: list[np.ndarray],
+    tempo: float = 120.0,
+    beats: PositiveInt = 4,
+    divisions: PositiveInt = 4,
+):
+    # minimal partwise MusicXML; notes sharing an onset are written as chords
+    # and gaps as rests, quantized to `divisions` per quarter note
+    seconds_per_division = 60.0 / tempo / divisions
+    measure_length = beats * divisions
+    lines = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        '<score-partwise version="3.1">',
+        '  <part-list><score-part id="P1"><part-name>Piano</part-name>'
+        "</score-part></part-list>",
+        '  <part id="P1">',
+    ]
+    measure_onset = 0.0
+    for number, notes in enumerate(measure_notes, start=1):
+        lines.append(f'    <measure number="{number}">')
+        if number == 1:
+            lines.append(
+                f"      <attributes><divisions>{divisions}</divisions>"
+                f"<time><beats>{beats}</beats><beat-type>4</beat-type></time>"
+                "<clef><sign>G</sign><line>2</line></clef></attributes>"
+            )
+
+        positions = np.round((notes[:, 0] - measure_onset) / seconds_per_division)
+        positions = np.clip(positions.astype(int), 0, measure_length - 1)
+        cursor = 0
+        for position in np.unique(positions).tolist():
+            if position > cursor:
+                lines.append(
+                    f"      <note><rest/><duration>{position - cursor}</duration></note>"
+                )
+            following = positions[positions > position]
+            tail = int(following.min()) if len(following) else measure_length
+            for chord_idx, pitch in enumerate(notes[positions == position, 2].tolist()):
+                pitch = int(pitch)
+                step = _PITCH_STEPS[pitch % 12]
+                alter = (
+                    "<alter>1</alter>" if step == _PITCH_STEPS[pitch % 12 - 1] else ""
+                )
+                chord = "<chord/>" if chord_idx > 0 else ""
+                lines.append(
+                    f"      <note>{chord}<pitch><step>{step}</step>{alter}"
+                    f"<octave>{pitch // 12 - 1}</octave></pitch>"
+                    f"<duration>{tail - position}</duration></note>"
+                )
+            cursor = tail
+        if cursor < measure_length:
+            lines.append(
+                f"      <note><rest/><duration>{measure_length - cursor}</duration></note>"
+            )
+        lines.append("    </measure>")
+        measure_onset += measure_length * seconds_per_division
+    lines += ["  </part>", "</score-partwise>", ""]
+    Path(path).write_text("\n".join(lines), encoding="utf-8")
+
+
+@dataclass
+class SyntheticScore:
+    tempo: float  # beats per minute
+    quarter_length: float  # quarter notes per measure
+    measure_notes: list[np.ndarray]  # notes of each measure, in score time
+
+    @property
+    def num_measures(self) -> int:
+        return len(self.measure_notes)
+
+    @property
+    def measure_duration(self) -> float:
+        return self.quarter_length * 60.0 / self.tempo
+
+
+@beartype
+def generate_score(
+    score_root: PathLike,
+    num_measures: PositiveInt = 100,
+    seed: int = 0,
+    tempo: float = 116.0,
+    quarter_length: PositiveInt = 4,
+    notes_per_measure: tuple[int, int] = (4, 16),
+    pitch_range: tuple[int, int] = (48, 84),
+) -> SyntheticScore:
+    # writes score.csv, score.midi and score.musicxml into `score_root`
+    rng = np.random.default_rng(seed)
+    score_root = Path(score_root)
+    score_root.mkdir(parents=True, exist_ok=True)
+
+    grid_size = quarter_length * 4  # sixteenth notes
+    measure_duration = quarter_length * 60.0 / tempo
+    grid_duration = measure_duration / grid_size
+    low, high = pitch_range
+
+    measure_notes, pitch = [], (low + high) // 2
+    for idx in range(num_measures):
+        num_notes = int(rng.integers(notes_per_measure[0], notes_per_measure[1] + 1))
+        positions = np.sort(rng.integers(0, grid_size, size=num_notes))
+        # the melody is a random walk, repeated positions become chords
+        pitches = np.clip(
+            pitch + np.cumsum(rng.integers(-4, 5, size=num_notes)), low, high
+        )
+        pitch = int(pitches[-1])
+        lengths = rng.integers(1, 5, size=num_notes)
+        onsets = idx * measure_duration + positions * grid_duration
+        offsets = np.minimum(
+            onsets + lengths * grid_duration, (idx + 1) * measure_duration
+        )
+        velocities = np.full(num_notes, 80.0)
+        measure_notes.append(np.stack([onsets, offsets, pitches, velocities], axis=1))
+
+    score = SyntheticScore(float(tempo), float(quarter_length), measure_notes)
+    duration = score.measure_duration
+    with open(score_root / "score.csv", "w") as file:
+        file.write("onset,duration,quarter length,num notes\n")
+        for idx, notes in enumerate(measure_notes):
+            file.write(
+                f"{idx * duration:.4f},{duration:.4f},"
+                f"{quarter_length:.4f},{len(notes):.4f}\n"
+            )
+    write_midi(score_root / "score.midi", np.concatenate(measure_notes), tempo)
+    write_musicxml(score_root / "score.musicxml", measure_notes, tempo, quarter_length)
+    return score
+
+
+@beartype
+def generate_record(
+    score: SyntheticScore,
+    record_root: PathLike,
+    seed: int = 0,
+    start_delay: float = 1.0,
+    tempo_variation: float = 0.05,
+    onset_noise: float = 0.02,
+    velocity_noise: float = 10.0,
+    num_jumps: int = 0,
+    max_jump: PositiveInt = 8,
+    drop_prob: float = 0.0,
+) -> list[int]:
+    # writes `<record_root>.csv` (onset, action) and `<record_root>.midi` of a
+    # performance of `score`: the local tempo drifts as a log-normal random
+    # walk, onsets are jittered, notes may be dropped and `num_jumps` repeats
+    # (backward) or skips (forward) of up to `max_jump` measures are inserted.
+    # returns the performed measure order.
+    rng = np.random.default_rng(seed)
+    record_root = Path(record_root)
+    record_root.parent.mkdir(parents=True, exist_ok=True)
+
+    order = list(range(score.num_measures))
+    for _ in range(num_jumps):
+        source = int(rng.integers(1, len(order)))
+        target = int(
+            np.clip(
+                order[source - 1] + rng.integers(-max_jump, max_jump + 1),
+                0,
+                score.num_measures - 1,
+            )
+        )
+        order = order[:source] + list(range(target, score.num_measures))
+
+    log_tempo = np.cumsum(rng.normal(0.0, tempo_variation, size=len(order)))
+    stretches = np.exp(np.clip(log_tempo, -1.0, 1.0))
+
+    measure_onsets, performed, time = [], [], start_delay
+    for measure, stretch in zip(order, stretches.tolist()):
+        notes = score.measure_notes[measure].copy()
+        score_onset = measure * score.measure_duration
+        notes[:, :2] = time + (notes[:, :2] - score_onset) * stretch
+        notes[:, :2] += rng.normal(0.0, onset_noise, size=(len(notes), 1))
+        notes[:, :2] = np.maximum(notes[:, :2], 0.0)
+        notes[:, 3] = np.clip(
+            notes[:, 3] + rng.normal(0.0, velocity_noise, size=len(notes)), 1, 127
+        )
+        performed.append(notes[rng.random(len(notes)) >= drop_prob])
+        measure_onsets.append(time)
+        time += score.measure_duration * stretch
+
+    with open(record_root.with_suffix(".csv"), "w") as file:
+        file.write("onset,action\n")
+        for onset, measure in zip(measure_onsets, order):
+            file.write(f"{onset:.4f},{measure}\n")
+    write_midi(record_root.with_suffix(".midi"), np.concatenate(performed), score.tempo)
+    return order
+
+
+@beartype
+def generate_dataset(
+    score_root: PathLike,
+    num_measures: PositiveInt = 100,
+    num_records: PositiveInt = 1,
+    seed: int = 0,
+    **record_options,
+) -> SyntheticScore:
+    # a score directory in the layout of `samples/` with records named
+    # record/synthetic_<i>, each deterministic from `seed`
+    score = generate_score(score_root, num_measures, seed=seed)
+    for idx in range(num_records):
+        record_root = Path(score_root) / "record" / f"synthetic_{idx}"
+        generate_record(score, record_root, seed=seed + idx + 1, **record_options)
+    return score
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="generate a synthetic score and records")
+    parser.add_argument("score_root", type=Path)
+    parser.add_argument("--num-measures", type=int, default=100)
+    parser.add_argument("--num-records", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tempo-variation", type=float, default=0.05)
+    parser.add_argument("--onset-noise", type=float, default=0.02)
+    parser.add_argument("--num-jumps", type=int, default=0)
+    parser.add_argument("--drop-prob", type=float, default=0.0)
+    args = parser.parse_args()
+
+    generate_dataset(
+        args.score_root,
+        args.num_measures,
+        args.num_records,
+        args.seed,
+        tempo_variation=args.tempo_variation,
+        onset_noise=args.onset_noise,
+        num_jumps=args.num_jumps,
+        drop_prob=args.drop_prob,
+    )
@@ -10,7 +10,7 @@ import numpy.typing as npt
 
 
 def _is_normalized(ndarray: np.ndarray) -> bool:
-    return np.all(np.logical_and(0.0 <= ndarray, ndarray <= 1.0))
+    return bool(((0.0 <= ndarray) & (ndarray <= 1.0)).all())
 
 
 def _is_normalized_matrix(ndarray: np.ndarray) -> bool:
@@ -21,16 +21,17 @@ def _is_policy(ndarray: np.ndarray) -> bool:
     return (
         ndarray.ndim == 1
         and _is_normalized(ndarray)
-        and np.isclose(np.sum(ndarray), 1.0)
+        and bool(np.isclose(ndarray.sum(), 1.0))
     )
 
 
 def _is_policy_matrix(ndarray: np.ndarray) -> bool:
-    assert ndarray.ndim == 2
-    for row in ndarray:
-        if not _is_policy(row):
-            return False
-    return True
+    # every row is a policy, checked without a python loop over rows
+    return (
+        ndarray.ndim == 2
+        and _is_normalized(ndarray)
+        and bool(np.isclose(ndarray.sum(axis=1), 1.0).all())
+    )
 
 
 ActType = Annotated[npt.NDArray[np.float32], Is[_is_policy]]
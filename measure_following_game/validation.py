@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ["VALIDATION_LEVELS", "Validation", "validated"]
+
+from collections.abc import Callable
+import functools
+
+from beartype import beartype
+
+VALIDATION_LEVELS = ("full", "sampled", "off")
+
+
+class Validation(object):
+
+    # runtime-validation level shared by the components of an environment.
+    # "full" checks every call, "sampled" every `interval`-th top-level call
+    # and "off" never. calls nested in a checked (or unchecked) call follow
+    # the decision of the outermost one, so one env step is either checked by
+    # every component or by none.
+
+    def __init__(self, level: str = "full", interval: int = 100):
+        if level not in VALIDATION_LEVELS:
+            raise ValueError(f"unknown validation level: {level}")
+        if interval < 1:
+            raise ValueError("`interval` must be positive")
+        self.level = level
+        self.interval = interval
+        self.num_calls = 0
+        self.depth = 0
+        self.active = level != "off"
+
+    def enter(self) -> bool:
+        if self.depth == 0:
+            if self.level == "sampled":
+                self.active = self.num_calls % self.interval == 0
+            self.num_calls += 1
+        self.depth += 1
+        return self.active
+
+    def exit(self):
+        self.depth -= 1
+
+
+def validated(method: Callable) -> Callable:
+    # `beartype` that honours the `validation` attribute of the instance
+    checked = beartype(method)
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        validation = getattr(self, "validation", None)
+        if validation is None:
+            return checked(self, *args, **kwargs)
+        try:
+            if validation.enter():
+                return checked(self, *args, **kwargs)
+            return method(self, *args, **kwargs)
+        finally:
+            validation.exit()
+
+    return wrapper
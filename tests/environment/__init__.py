@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+
+from pathlib import Path
+
+import numpy as np
+
+from measure_following_game.environment.utils import make_env, make_env_param
+
+SAMPLES_ROOT = Path(__file__).parents[2] / "samples"
+
+
+def make_seeded_env(seed: int = 0, reset: bool = True, **options):
+    # an env of the demo record with `options` of `make_env_param`. the layout
+    # is drawn at construction and at reset, before `seed` applies, so both
+    # are seeded for the envs of one seed to match
+    options.setdefault("score_root", SAMPLES_ROOT)
+    options.setdefault("record_name", "record/demo")
+    env_param = make_env_param(**options)
+    np.random.seed(seed)
+    env = make_env(env_param)
+    if reset:
+        np.random.seed(seed)
+        env.reset(seed=seed)
+    return env
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+import os
+from pathlib import Path
+import signal
+import unittest
+
+import numpy as np
+
+from measure_following_game.environment.utils import *
+
+
+class AsyncVectorEnvTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        score_root = Path(__file__).parents[2] / "samples"
+        record_name = "record/demo"
+        cls.env_param = make_env_param(score_root=score_root, record_name=record_name)
+        cls.num_envs = 3
+
+    def test_step(self):
+        vector_env = make_async_vector_env(self.env_param, self.num_envs, 2)
+        try:
+            similarity_matrices, policy_memories = vector_env.reset(seed=0)
+            self.assertEqual(
+                similarity_matrices.shape, (self.num_envs, *vector_env.window_shape)
+            )
+            self.assertEqual(
+                policy_memories.shape, (self.num_envs, *vector_env.memory_shape)
+            )
+
+            pred_policies = np.zeros((self.num_envs, vector_env.num_actions))
+            pred_policies[:, -1] = 1.0
+            vector_env.step_async(pred_policies)
+            with self.assertRaises(RuntimeError):
+                vector_env.step_async(pred_policies)
+            _, rewards, dones, infos = vector_env.step_wait()
+            self.assertEqual(rewards.shape, (self.num_envs,))
+            self.assertEqual(dones.shape, (self.num_envs,))
+            self.assertEqual(len(infos), self.num_envs)
+        finally:
+            vector_env.close()
+
+    def test_worker_crash(self):
+        vector_env = make_async_vector_env(self.env_param, 2, 2)
+        vector_env.reset()
+        vector_env.processes[0].kill()
+        vector_env.processes[0].join()
+
+        pred_policies = np.zeros((2, vector_env.num_actions), dtype=np.float32)
+        pred_policies[:, -1] = 1.0
+        with self.assertRaises(RuntimeError):
+            vector_env.step(pred_policies)
+        self.assertTrue(vector_env.closed)
+
+    def test_timeout(self):
+        vector_env = make_async_vector_env(self.env_param, 2, 2)
+        vector_env.reset()
+        os.kill(vector_env.processes[1].pid, signal.SIGSTOP)
+
+        pred_policies = np.zeros((2, vector_env.num_actions), dtype=np.float32)
+        pred_policies[:, -1] = 1.0
+        vector_env.step_async(pred_policies)
+        with self.assertRaises(TimeoutError):
+            vector_env.step_wait(timeout=0.5)
+        self.assertTrue(vector_env.closed)
+        self.assertFalse(any(process.is_alive() for process in vector_env.processes))
+        with self.assertRaises(RuntimeError):
+            vector_env.step(pred_policies)
+        with self.assertRaises(RuntimeError):
+            vector_env.reset()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+from pathlib import Path
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+from sabanamusic.models.musical import make_score_measures
+
+from measure_following_game.environment.cache import *
+from measure_following_game.environment.cache import CACHE_DIRNAME
+
+
+class ScoreCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.score_root = Path(self.temp_dir) / "samples"
+        shutil.copytree(
+            Path(__file__).parents[2] / "samples",
+            self.score_root,
+            ignore=shutil.ignore_patterns(CACHE_DIRNAME),
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_matches_parsed_measures(self):
+        expected = make_score_measures(score_root=self.score_root, fps=20)
+        for _ in range(2):  # cache miss, then cache hit
+            measures = load_score_measures(self.score_root, fps=20)
+            self.assertEqual(len(measures), len(expected))
+            for measure, other in zip(measures, expected):
+                np.testing.assert_array_equal(
+                    measure.repr_sequence, other.repr_sequence
+                )
+                np.testing.assert_array_equal(
+                    measure.pitch_histogram, other.pitch_histogram
+                )
+        self.assertEqual(len(list(get_cache_dir(self.score_root).glob("*.npz"))), 1)
+
+    def test_invalidation(self):
+        load_score_measures(self.score_root, fps=20)
+        load_score_measures(self.score_root, fps=10)
+        load_score_measures(self.score_root, fps=20, onset_only=False)
+        self.assertEqual(len(list(get_cache_dir(self.score_root).glob("*.npz"))), 3)
+
+        score_file = self.score_root / "score.pdf"
+        score_file.write_bytes(score_file.read_bytes() + b"\n")
+        load_score_measures(self.score_root, fps=20)
+        self.assertEqual(len(list(get_cache_dir(self.score_root).glob("*.npz"))), 4)
+
+        # measures parsed by another version of sabanamusic are not reused
+        with mock.patch(
+            "measure_following_game.environment.cache.get_library_version",
+            return_value="0.0.0+other",
+        ):
+            load_score_measures(self.score_root, fps=20)
+        self.assertEqual(len(list(get_cache_dir(self.score_root).glob("*.npz"))), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,10 +3,24 @@
 from pathlib import Path
 import unittest
 
+from beartype.roar import BeartypeCallHintParamViolation
 from gym import spaces
 import numpy as np
+from sabanamusic.similarity.algorithms import calc_algorithmic_similarity
 
+from measure_following_game.environment.context import (
+    ChromaContextManager,
+    calc_bound_similarities,
+)
+from measure_following_game.environment.context.renderer.grid import (
+    ACTIVATE,
+    PLAIN,
+)
+from measure_following_game.environment.realtime import make_streaming_manager
+from measure_following_game.midi import read_midi_events
 from measure_following_game.environment.utils import *
+from tests.environment import make_seeded_env
+from tests.similarity import has_dtw_compact
 
 
 class EnvTest(unittest.TestCase):
@@ -41,6 +55,405 @@ class EnvTest(unittest.TestCase):
         self.assertEqual(policy_memory.shape, env.manager.memory_shape)
         self.assertEqual(policy_memory.dtype, np.float32)
 
+    def test_render_modes(self):
+        # render modes belong to each env, not to every env built so far
+        grid_env = make_seeded_env(reset=False, renderer_id="grid")
+        layout_env = make_seeded_env(reset=False, renderer_id="layout")
+        headless_env = make_seeded_env(
+            reset=False, renderer_id="grid", renderer_options={"headless": True}
+        )
+        self.assertEqual(grid_env.metadata["render_modes"], ["human", "rgb_array"])
+        self.assertEqual(layout_env.metadata["render_modes"], [])
+        self.assertEqual(headless_env.metadata["render_modes"], ["rgb_array"])
+        self.assertEqual(
+            grid_env.manager.metadata["render_modes"], ["human", "rgb_array"]
+        )
+
+    def test_headless_render(self):
+        env = make_seeded_env(renderer_options={"headless": True})
+
+        renderer = env.manager.renderer
+        self.assertIsNone(renderer.surf)
+
+        rgb_array = env.render("rgb_array")
+        self.assertEqual(
+            rgb_array.shape, (3, renderer.screen_height, renderer.screen_width)
+        )
+        self.assertIsNone(renderer.screen)
+
+        with self.assertRaises(KeyError):
+            env.render("human")
+
+    def test_validation_levels(self):
+        def make(validation: str):
+            return make_seeded_env(
+                renderer_id="layout", validation=validation, validation_interval=2
+            )
+
+        env = make("full")
+        invalid_policy = np.full(env.manager.num_actions, 0.5, dtype=np.float32)
+        self.assertIs(env.manager.validation, env.reward.validation)
+        with self.assertRaises(BeartypeCallHintParamViolation):
+            env.step(invalid_policy)
+
+        env = make("off")
+        env.step(invalid_policy)
+
+        env = make("sampled")  # the reset above was the first checked call
+        env.step(invalid_policy)
+        with self.assertRaises(BeartypeCallHintParamViolation):
+            env.step(invalid_policy)
+
+    def test_profile(self):
+        env = make_env(self.env_param)
+        _, info = env.reset(seed=0, return_info=True)
+        self.assertNotIn("profile", info)
+
+        metrics = []
+        env_param = make_env_param(
+            score_root=self.env_param.score_root,
+            record_name=self.env_param.record_name,
+            renderer_id="layout",
+            manager_options={"profile_hook": metrics.append},
+        )
+        env = make_env(env_param)
+        _, info = env.reset(seed=0, return_info=True)
+        self.assertEqual(info["profile"]["event"], "reset")
+
+        policy = np.zeros(env.manager.num_actions, dtype=np.float32)
+        policy[-1] = 1.0
+        for _ in range(3):
+            _, _, _, info = env.step(policy)
+
+        profile = info["profile"]
+        self.assertEqual(len(metrics), 4)
+        self.assertIs(metrics[-1], profile)
+        self.assertEqual(profile["num_steps"], 3)
+        self.assertEqual(profile["counters"]["stays"], 3)
+        self.assertEqual(profile["counters"]["dtw_calls"], 4)
+        for phase in ("navigate", "record_step", "fill_similarity_matrix"):
+            self.assertGreaterEqual(profile["timings"][phase], 0.0)
+        self.assertGreaterEqual(profile["total"], sum(profile["timings"].values()))
+
+    def test_anytime_similarity(self):
+        def make(similarity_budget: float | None):
+            return make_seeded_env(
+                renderer_id="layout",
+                manager_options={"similarity_budget": similarity_budget},
+            )
+
+        exact_env, anytime_env, cheap_env = make(None), make(60.0), make(0.0)
+        policy = np.zeros(exact_env.manager.num_actions, dtype=np.float32)
+        policy[-2] = 1.0  # slide, so that new measures enter the window
+        infos = []
+        for env in (exact_env, anytime_env, cheap_env):
+            for _ in range(3):
+                observation, _, _, info = env.step(policy)
+            self.assertTrue(np.all((0.0 <= observation[0]) & (observation[0] <= 1.0)))
+            infos.append(info)
+
+        self.assertNotIn("exact_features", infos[0])
+        num_measures = anytime_env.manager.num_window_measures
+        self.assertTrue(np.all(infos[1]["exact_features"][:num_measures]))
+        self.assertFalse(np.any(infos[2]["exact_features"]))
+        np.testing.assert_allclose(
+            anytime_env.manager.similarity_matrix,
+            exact_env.manager.similarity_matrix,
+            rtol=1e-6,
+        )
+
+    def test_prune_similarity(self):
+        def make(prune_ratio: float | None):
+            return make_seeded_env(
+                renderer_id="layout", manager_options={"prune_ratio": prune_ratio}
+            )
+
+        exact_env, loose_env, tight_env = make(None), make(np.inf), make(1.0)
+        policy = np.zeros(exact_env.manager.num_actions, dtype=np.float32)
+        policy[-2] = 1.0
+        infos = []
+        for env in (exact_env, loose_env, tight_env):
+            for _ in range(3):
+                _, _, _, info = env.step(policy)
+            infos.append(info)
+
+        # nothing is pruned with an infinite ratio
+        self.assertEqual(infos[1]["dtw_pruned"], 0)
+        np.testing.assert_allclose(
+            loose_env.manager.similarity_matrix,
+            exact_env.manager.similarity_matrix,
+            rtol=1e-6,
+        )
+        # computed rows are exact, pruned ones keep bounded features
+        num_measures = tight_env.manager.num_window_measures
+        info = infos[2]
+        self.assertEqual(info["dtw_pruned"] + info["dtw_computed"], num_measures)
+        exact = info["exact_features"]
+        self.assertEqual(int(exact.sum()), info["dtw_computed"])
+        np.testing.assert_allclose(
+            tight_env.manager.similarity_matrix[exact],
+            exact_env.manager.similarity_matrix[exact],
+            rtol=1e-6,
+        )
+
+    def test_prune_keeps_argmax(self):
+        # a pruned measure is never more similar than the best computed one,
+        # so the argmax of the exact features is always computed
+        def make(prune_ratio: float | None):
+            return make_seeded_env(
+                renderer_id="layout", manager_options={"prune_ratio": prune_ratio}
+            )
+
+        # the bound holds for any distance above the DTW bound and any
+        # histogram distance
+        rng = np.random.default_rng(0)
+        lower_bounds = rng.uniform(0.0, 50.0, 100)
+        distances = lower_bounds + rng.uniform(0.0, 10.0, 100)
+        euclidean_distances = rng.uniform(0.0, np.sqrt(2.0), 100)
+        similarities = [
+            calc_algorithmic_similarity(distances=distances, scales=[1.0, 1.0])
+            for distances in zip(distances.tolist(), euclidean_distances.tolist())
+        ]
+        self.assertTrue(np.all(calc_bound_similarities(lower_bounds) >= similarities))
+
+        exact_env, pruned_env = make(None), make(1.0)
+        policy = np.zeros(exact_env.manager.num_actions, dtype=np.float32)
+        num_pruned = 0
+        for step in range(40):
+            policy.fill(0.0)
+            policy[-2 if step % 4 == 0 else -1] = 1.0
+            _, _, done, info = pruned_env.step(policy)
+            exact_env.step(policy)
+            if done:
+                break
+            exact = info["exact_features"]
+            if np.all(exact):
+                continue
+            num_pruned += 1
+            num_measures = pruned_env.manager.num_window_measures
+            similarities = exact_env.manager.similarity_matrix[:num_measures, 0]
+            computed = similarities[exact[:num_measures]]
+            pruned = similarities[~exact[:num_measures]]
+            self.assertLessEqual(pruned.max(), computed.max() + 1e-6)
+            self.assertTrue(exact[np.argmax(similarities)])
+            # the features of pruned measures bound their similarities
+            bounds = pruned_env.manager.similarity_matrix[:num_measures, 0]
+            self.assertTrue(np.all(bounds[~exact[:num_measures]] >= pruned - 1e-6))
+        self.assertGreater(num_pruned, 0)
+
+    def test_prune_streams_bounds(self):
+        # on a buffer that grows frame by frame, pruned measures stream their
+        # bounds, so pruning cuts the local-cost work of the whole fill
+        events = read_midi_events(self.env_param.score_root / "record" / "demo.midi")
+
+        def follow(prune_ratio: float | None) -> dict:
+            env_param = make_env_param(
+                score_root=self.env_param.score_root,
+                renderer_id="layout",
+                manager_options={"prune_ratio": prune_ratio, "profile": True},
+            )
+            np.random.seed(0)
+            manager = make_streaming_manager(env_param, clock=lambda: 0.0)
+            np.random.seed(0)
+            manager.reset(seed=0)
+            for timestamp, pitch, velocity in events.tolist():
+                manager.record.push(int(pitch), int(velocity), timestamp=timestamp)
+            policy = np.zeros(manager.num_actions, dtype=np.float32)
+            policy[-1] = 1.0
+            for _ in range(200):
+                manager.follow(policy)
+            return manager.profiler.counters
+
+        exact, pruned = follow(None), follow(1.0)
+        self.assertGreater(pruned["dtw_pruned"], 0)
+        self.assertLess(pruned["dtw_cells"], exact["dtw_cells"])
+        self.assertLess(pruned["dtw_cells"] + pruned["bound_cells"], exact["dtw_cells"])
+
+    @unittest.skipUnless(has_dtw_compact(), "dtw_compact is not implemented")
+    def test_matches_compact_dtw(self):
+        # the batched similarity kernel gives the features of the per-measure
+        # `dtw_compact` loop it replaced, on the demo record
+        def make(**manager_options):
+            return make_seeded_env(
+                renderer_id="layout", manager_options=manager_options
+            )
+
+        batched_env, compact_env = make(), make(compact_dtw=True)
+        batched, compact = batched_env.manager, compact_env.manager
+        policy = np.zeros(batched.num_actions, dtype=np.float32)
+        for _ in range(40):
+            np.testing.assert_allclose(
+                batched.similarity_matrix, compact.similarity_matrix, atol=1e-5
+            )
+            true_action = batched.record.true_action - batched.window_head
+            policy.fill(0.0)
+            policy[true_action if 0 <= true_action < 16 else -2] = 1.0
+            _, _, done, _ = batched_env.step(policy)
+            compact_env.step(policy)
+            if done:
+                break
+
+    def test_decision_interval(self):
+        def make(**manager_options):
+            return make_seeded_env(manager_options=manager_options)
+
+        frame_env, skip_env = make(), make(decision_interval=4)
+        policy = np.zeros(frame_env.manager.num_actions, dtype=np.float32)
+        policy[-1] = 1.0  # stay, so that both follow the same frames
+
+        _, reward, _, info = skip_env.step(policy)
+        rewards = [frame_env.step(policy)[1] for _ in range(4)]
+        self.assertEqual(skip_env.manager.record_steps, 4)
+        self.assertEqual(len(info["skipped_true_actions"]), 3)
+        self.assertAlmostEqual(reward, sum(rewards), places=5)
+        np.testing.assert_allclose(
+            skip_env.manager.similarity_matrix,
+            frame_env.manager.similarity_matrix,
+            rtol=1e-6,
+        )
+
+        # onset-triggered decisions stop at the first frame with onsets, found
+        # frame by frame on an env without frame skip
+        frame_env = make()
+        for num_steps in range(1, 64):
+            _, _, done, _ = frame_env.step(policy)
+            self.assertFalse(done)
+            if frame_env.manager._has_new_onsets():
+                break
+        else:
+            self.fail("no onsets in the first 63 frames")
+        onset_env = make(decision_interval=64, onset_trigger=True)
+        _, _, _, info = onset_env.step(policy)
+        self.assertEqual(onset_env.manager.record_steps, num_steps)
+        self.assertEqual(len(info["skipped_true_actions"]), num_steps - 1)
+        self.assertTrue(onset_env.manager._has_new_onsets())
+
+    def test_relocalization(self):
+        env_param = make_env_param(
+            score_root=self.env_param.score_root,
+            record_name=self.env_param.record_name,
+            renderer_id="layout",
+            manager_options={"num_candidates": 3},
+        )
+        env = make_env(env_param)
+        _, info = env.reset(seed=0, return_info=True)
+        manager = env.manager
+        self.assertEqual(len(info["candidates"]), 3)
+        self.assertTrue(np.all(np.diff(info["candidate_scores"]) <= 0.0))
+
+        policy = np.zeros(manager.num_actions, dtype=np.float32)
+        policy[-1] = 1.0
+        _, _, _, info = env.step(policy)
+        np.testing.assert_array_equal(info["candidates"], manager.candidates)
+
+        # jumps are possible to every measure, also behind the window
+        renderer = manager.renderer
+        last = manager.num_score_measures - 1
+        self.assertTrue(renderer.jump(last))
+        self.assertIn(last, renderer.visible_indices)
+        self.assertTrue(renderer.jump(0))
+        self.assertEqual(renderer.window_head, 0)
+        self.assertEqual(renderer.cursor, 0)
+        self.assertFalse(renderer.jump(last + 1))
+
+        self.assertTrue(manager.relocalize(0))
+        self.assertIn(int(manager.candidates[0]), renderer.visible_indices)
+        self.assertFalse(manager.relocalize(3))
+
+    def test_chroma_manager(self):
+        env_param = make_env_param(
+            score_root=self.env_param.score_root,
+            record_name=self.env_param.record_name,
+            manager_id="chroma",
+            renderer_id="layout",
+        )
+        self.assertEqual(env_param.manager_id, "chroma")
+        self.assertEqual(env_param.record_id, "midi")
+
+        env = make_env(env_param)
+        manager = env.manager
+        self.assertIsInstance(manager, ChromaContextManager)
+        self.assertEqual(manager.window_shape, (env_param.window_size, 3))
+
+        env.reset(seed=0)
+        policy = np.zeros(manager.num_actions, dtype=np.float32)
+        policy[-2] = 1.0
+        for _ in range(3):
+            observation, _, _, _ = env.step(policy)
+            self.assertTrue(env.observation_space.contains(observation))
+
+    def test_dirty_rect_render(self):
+        def make():
+            return make_seeded_env(renderer_options={"headless": True})
+
+        env = make()
+        renderer = env.manager.renderer
+        env.render("rgb_array")
+        self.assertEqual(renderer.pending_rects["rgb_array"], [])
+
+        policy = np.zeros(env.manager.num_actions, dtype=np.float32)
+        for action in (1, 3, -2, 0):
+            policy.fill(0.0)
+            policy[action] = 1.0
+            env.step(policy)
+            incremental = env.render("rgb_array").copy()
+            for index in renderer.visible_indices:
+                expected = ACTIVATE if index == renderer.cursor else PLAIN
+                self.assertEqual(renderer.measure_colors[index], expected)
+            # a renderer that draws the same state from scratch
+            fresh_env = make()
+            fresh_env.set_state(env.get_state())
+            np.testing.assert_array_equal(incremental, fresh_env.render("rgb_array"))
+
+        # nothing changed, so nothing is redrawn
+        drawn = dict(renderer.measure_colors)
+        env.render("rgb_array")
+        self.assertEqual(renderer.measure_colors, drawn)
+        self.assertEqual(renderer.pending_rects["rgb_array"], [])
+
+    def test_render_into_buffer(self):
+        env = make_seeded_env(
+            renderer_options={"headless": True, "resolution": (84, 120)}
+        )
+
+        frame = env.render("rgb_array")
+        self.assertEqual(frame.shape, (3, 84, 120))
+        self.assertTrue(frame.flags["C_CONTIGUOUS"])
+        self.assertIs(env.render("rgb_array"), frame)  # the buffer is reused
+
+        out = np.zeros((3, 84, 120), dtype=np.uint8)
+        self.assertIs(env.render("rgb_array", out=out), out)
+        np.testing.assert_array_equal(out, frame)
+        with self.assertRaises(ValueError):
+            env.render("rgb_array", out=np.zeros((84, 120, 3), dtype=np.uint8))
+
+    def test_state_restore(self):
+        env = make_seeded_env(renderer_options={"headless": True})
+        policy = np.zeros(env.manager.num_actions, dtype=np.float32)
+        policy[1] = 1.0
+        env.step(policy)
+        env.render("rgb_array")
+
+        def rollout(actions):
+            results = []
+            for action in actions:
+                policy.fill(0.0)
+                policy[action] = 1.0
+                (similarity, memory), reward, done, _ = env.step(policy)
+                frame = env.render("rgb_array").copy()
+                results.append((similarity.copy(), memory.copy(), reward, done, frame))
+            return results
+
+        state = env.get_state()
+        self.assertFalse(state.similarity_matrix.flags.writeable)
+        expected = rollout((2, -2, 0, -1))
+        env.set_state(state)
+        rollout((-2, -2, 3))  # another branch
+        env.set_state(state)
+        for result, expected_result in zip(rollout((2, -2, 0, -1)), expected):
+            for value, expected_value in zip(result, expected_result):
+                np.testing.assert_array_equal(value, expected_value)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+import numpy as np
+
+from measure_following_game.environment.features import *
+from measure_following_game.similarity import pad_sequences
+
+
+class ScoreFeatureStoreTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.measures = [
+            MeasureFeatures(idx, rng.random((rng.integers(1, 6), 4)), rng.random(12))
+            for idx in range(8)
+        ]
+        self.store = ScoreFeatureStore.from_measures(
+            self.measures, onsets=np.arange(8) * 2.0, durations=np.full(8, 2.0)
+        )
+
+    def test_items(self):
+        self.assertEqual(len(self.store), len(self.measures))
+        for measure, expected in zip(self.store, self.measures):
+            self.assertEqual(measure.index, expected.index)
+            np.testing.assert_array_equal(measure.repr_sequence, expected.repr_sequence)
+            np.testing.assert_array_equal(
+                measure.pitch_histogram, expected.pitch_histogram
+            )
+        self.assertEqual(self.store[-1].onset, 14.0)
+
+    def test_window_views(self):
+        window = self.store[2:5]
+        self.assertEqual(len(window), 3)
+        self.assertEqual(window.first_index, 2)
+        self.assertTrue(np.shares_memory(window.repr_frames, self.store.repr_frames))
+        self.assertTrue(
+            np.shares_memory(window.pitch_histograms, self.store.pitch_histograms)
+        )
+        for idx, measure in enumerate(window):
+            expected = self.measures[2 + idx]
+            self.assertEqual(measure.index, expected.index)
+            np.testing.assert_array_equal(measure.repr_sequence, expected.repr_sequence)
+        np.testing.assert_array_equal(window.onsets, [4.0, 6.0, 8.0])
+
+    def test_pad_repr_sequences(self):
+        indices = [5, 1, 3]
+        padded, lengths = self.store.pad_repr_sequences(indices, num_dims=6)
+        expected, expected_lengths = pad_sequences(
+            [self.measures[idx].repr_sequence for idx in indices], num_dims=6
+        )
+        np.testing.assert_array_equal(lengths, expected_lengths)
+        np.testing.assert_array_equal(padded, expected)
+
+
+class PitchHistogramIndexTest(unittest.TestCase):
+    def test_query(self):
+        rng = np.random.default_rng(0)
+        histograms = rng.random((50, 12))
+        index = PitchHistogramIndex(histograms, first_index=10)
+
+        query = histograms[7] * 3.0  # the scale of the query does not matter
+        indices, scores = index.query(query, k=5)
+        self.assertEqual(len(indices), 5)
+        self.assertEqual(indices[0], 17)
+        self.assertAlmostEqual(float(scores[0]), 1.0, places=5)
+        self.assertTrue(np.all(np.diff(scores) <= 0.0))
+
+        normalized = histograms / np.linalg.norm(histograms, axis=1, keepdims=True)
+        expected = np.argsort(-(normalized @ (query / np.linalg.norm(query))))[:5]
+        np.testing.assert_array_equal(indices, expected + 10)
+
+        self.assertEqual(len(index.query(query, k=100)[0]), 50)
+        self.assertEqual(len(index.query(query, k=0)[0]), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+from pathlib import Path
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from measure_following_game.environment.precompute import *
+from measure_following_game.environment.utils import *
+from tests.environment import make_seeded_env
+
+
+class PrecomputeTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.temp_dir = tempfile.mkdtemp()
+        score_root = Path(cls.temp_dir) / "samples"
+        shutil.copytree(Path(__file__).parents[2] / "samples", score_root)
+        record_name = "record/demo"
+        cls.env_param = make_env_param(score_root=score_root, record_name=record_name)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.temp_dir)
+
+    def test_cache_path(self):
+        path = get_similarity_cache_path(self.env_param)
+        self.assertEqual(path, get_similarity_cache_path(self.env_param))
+
+        other_param = make_env_param(
+            score_root=self.env_param.score_root,
+            record_name=self.env_param.record_name,
+            fps=self.env_param.fps + 1,
+        )
+        self.assertNotEqual(path, get_similarity_cache_path(other_param))
+
+    def make_env(self, seed: int, **manager_options):
+        return make_seeded_env(
+            seed,
+            score_root=self.env_param.score_root,
+            renderer_id="layout",
+            manager_options=manager_options,
+        )
+
+    def test_lookup(self):
+        cache_path = precompute_similarity(self.env_param)
+        table = np.load(cache_path, mmap_mode="r")
+        with np.load(cache_path.with_suffix(".steps.npz")) as steps:
+            true_actions = steps["true_actions"]
+
+        env = make_env(self.env_param)
+        manager = env.manager
+        self.assertEqual(table.shape[1:], (manager.num_score_measures, 3))
+        self.assertEqual(len(true_actions), len(table))
+
+        # episodes from the first measure and from random ones, followed by
+        # the true actions, see the features of live DTW
+        first_seed = next(
+            seed
+            for seed in range(100)
+            if self.make_env(seed).manager.record.true_action == 0
+        )
+        start_measures = set()
+        for seed in (first_seed, 0, 1, 2):
+            live_env = self.make_env(seed)
+            lookup_env = self.make_env(seed, similarity_cache=cache_path)
+            live, lookup = live_env.manager, lookup_env.manager
+            start_measures.add(live.record.true_action)
+            self.assertIsNotNone(lookup.similarity_table_offset)
+            policy = np.zeros(live.num_actions, dtype=np.float32)
+            for _ in range(30):
+                np.testing.assert_allclose(
+                    lookup.similarity_matrix, live.similarity_matrix, atol=1e-6
+                )
+                true_action = live.record.true_action - live.window_head
+                policy.fill(0.0)
+                policy[true_action if 0 <= true_action < 16 else -2] = 1.0
+                _, _, done, _ = live_env.step(policy)
+                lookup_env.step(policy)
+                if done:
+                    break
+        self.assertIn(0, start_measures)
+        self.assertGreater(len(start_measures), 1)
+
+        # a buffer that is not in the table is followed by live DTW
+        live_env = self.make_env(0)
+        lookup_env = self.make_env(0, similarity_cache=cache_path)
+        lookup = lookup_env.manager
+        lookup.similarity_table_steps["fingerprints"] += 1
+        np.random.seed(0)
+        lookup_env.reset(seed=0)
+        self.assertIsNone(lookup.similarity_table_offset)
+        np.testing.assert_allclose(
+            lookup.similarity_matrix, live_env.manager.similarity_matrix, atol=1e-6
+        )
+
+    def test_cache_mismatch(self):
+        cache_path = precompute_similarity(self.env_param)
+        other_param = make_env_param(
+            score_root=self.env_param.score_root,
+            record_name=self.env_param.record_name,
+            buffer_duration=self.env_param.buffer_duration + 1,
+            manager_options={"similarity_cache": cache_path},
+        )
+        with self.assertRaises(ValueError):
+            make_env(other_param)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+import numpy as np
+
+from measure_following_game.environment.context import rasterize_batch
+from tests.environment import make_seeded_env
+
+
+class RasterContextRendererTest(unittest.TestCase):
+    def make_env(self, renderer_id: str, seed: int = 0, **renderer_options):
+        return make_seeded_env(
+            seed, renderer_id=renderer_id, renderer_options=renderer_options
+        )
+
+    def test_matches_grid(self):
+        grid_env = self.make_env("grid", headless=True, channel_last=True)
+        raster_env = self.make_env("raster", channel_last=True)
+
+        policy = np.zeros(grid_env.manager.num_actions, dtype=np.float32)
+        for action in (1, -2, 2):
+            policy.fill(0.0)
+            policy[action] = 1.0
+            grid_env.step(policy)
+            raster_env.step(policy)
+            expected = grid_env.render("rgb_array")
+            frame = raster_env.render("rgb_array")
+            self.assertEqual(frame.shape, expected.shape)
+            # edges may round to a neighbouring pixel
+            self.assertGreater(np.mean(np.all(frame == expected, axis=-1)), 0.99)
+
+    def test_resolution(self):
+        env = self.make_env("raster", resolution=(84, 84), grayscale=True)
+        renderer = env.manager.renderer
+        frame = env.render("rgb_array")
+        self.assertEqual(frame.shape, (1, 84, 84))
+        self.assertEqual(frame.dtype, np.uint8)
+        self.assertTrue(np.shares_memory(frame, renderer.frame))
+
+        out = np.zeros((1, 84, 84), dtype=np.uint8)
+        self.assertIs(env.render("rgb_array", out=out), out)
+        np.testing.assert_array_equal(out, frame)
+
+    def test_foreign_snapshot(self):
+        env = self.make_env("raster", resolution=(84, 84))
+        # a layout of its own, not the one of `env`
+        other = self.make_env("raster", seed=1, resolution=(84, 84))
+        renderer = other.manager.renderer
+
+        policy = np.zeros(env.manager.num_actions, dtype=np.float32)
+        for action in (1, 2, -1):
+            policy.fill(0.0)
+            policy[action] = 1.0
+            env.step(policy)
+            snapshot = env.manager.renderer.snapshot()
+            expected = env.manager.renderer.rasterize().copy()
+            frame = renderer.rasterize_snapshot(snapshot, np.zeros_like(expected))
+            np.testing.assert_array_equal(frame, expected)
+            self.assertEqual(renderer.screen_height, snapshot.display_height)
+
+    def test_batch(self):
+        envs = [self.make_env("raster", resolution=(84, 84)) for _ in range(3)]
+        renderers = [env.manager.renderer for env in envs]
+        out = np.zeros((3, 84, 84, 3), dtype=np.uint8)
+        self.assertIs(rasterize_batch(renderers, out), out)
+        for idx, renderer in enumerate(renderers):
+            np.testing.assert_array_equal(out[idx], renderer.rasterize().copy())
+
+        with self.assertRaises(ValueError):
+            rasterize_batch(renderers, out[:2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+from pathlib import Path
+import unittest
+
+import numpy as np
+
+from measure_following_game.environment.realtime import *
+from measure_following_game.environment.record import *
+from measure_following_game.environment.utils import *
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class StreamingRecordTest(unittest.TestCase):
+    def test_frames(self):
+        clock = FakeClock()
+        record = StreamingRecord(
+            fps=10, buffer_duration=1, buffer_step_size=4, num_dims=12, clock=clock
+        )
+        record.push(60, 80, timestamp=0.05)
+        record.push(64, 80, timestamp=0.15)
+        record.push(60, 0, timestamp=0.25)
+        clock.now = 0.3
+        record.push(67, 80)  # stamped on arrival
+
+        self.assertTrue(record.next_frame_has_onsets())
+        for _ in range(4):
+            record.step()
+        self.assertFalse(record.next_frame_has_onsets())
+        self.assertEqual(record.num_frames, 5)  # with the initial silent frame
+        np.testing.assert_array_equal(record.onset_indices, [1, 2, 4])
+        np.testing.assert_array_equal(
+            record.get_repr_sequence()[:, [0, 4, 7]], np.eye(3)
+        )
+        np.testing.assert_array_equal(record.roll[3, [0, 4, 7]], [0.0, 1.0, 0.0])
+
+        for _ in range(5):
+            record.step()
+        self.assertEqual(record.num_frames, 10)
+        record.step()  # a full buffer evicts `buffer_step_size` frames
+        self.assertEqual(record.num_frames, 7)
+        self.assertFalse(record.done)
+        record.close()
+        record.step()
+        self.assertTrue(record.done)
+
+    def test_pitch_histogram(self):
+        # onsets are counted, not the frames a note is held
+        record = StreamingRecord(fps=10, num_dims=12, clock=FakeClock())
+        record.push(60, 80, timestamp=0.05)
+        record.push(64, 80, timestamp=0.25)
+        for _ in range(5):
+            record.step()
+        histogram = record.get_pitch_histogram((0, record.num_frames))
+        np.testing.assert_allclose(histogram[[0, 4]], [0.5, 0.5])
+
+    def test_state(self):
+        record = StreamingRecord(fps=10, num_dims=12, clock=FakeClock())
+        record.push(60, 80, timestamp=0.05)
+        record.push(64, 80, timestamp=0.25)
+        state = get_record_state(record)
+        for _ in range(4):
+            record.step()
+        expected = record.get_repr_sequence().copy()
+
+        set_record_state(record, state)
+        self.assertEqual(record.num_frames, 1)
+        self.assertEqual(len(record.pending), 2)
+        for _ in range(4):
+            record.step()
+        np.testing.assert_array_equal(record.get_repr_sequence(), expected)
+        self.assertEqual(state["buffer_frames"], 1)  # the state is kept
+
+
+class RecordStateTest(unittest.TestCase):
+    def test_midi_record(self):
+        score_root = Path(__file__).parents[2] / "samples"
+        record = make_record("midi", score_root, "record/demo")
+        record.reset(0)
+        for _ in range(30):
+            record.step()
+        state = get_record_state(record)
+        expected = (record.get_repr_sequence().copy(), record.true_action)
+
+        for _ in range(30):
+            record.step()
+        for array in vars(record).values():
+            if isinstance(array, np.ndarray) and array.flags.writeable:
+                array[...] = 0  # a record updating its buffers in place
+        set_record_state(record, state)
+        np.testing.assert_array_equal(record.get_repr_sequence(), expected[0])
+        self.assertEqual(record.true_action, expected[1])
+
+
+class RealTimeFollowerTest(unittest.TestCase):
+    def test_replay(self):
+        score_root = Path(__file__).parents[2] / "samples"
+        env_param = make_env_param(score_root=score_root, renderer_id="layout")
+        manager = make_streaming_manager(env_param)
+
+        def stay(observation):
+            policy = np.zeros(manager.num_actions, dtype=np.float32)
+            policy[-1] = 1.0
+            return policy
+
+        frames = []
+        follower = RealTimeFollower(
+            manager, stay, on_frame=lambda obs, info: frames.append(info)
+        )
+        source = MIDIFileSource(score_root / "record" / "demo.midi", speed=20.0)
+        stats = asyncio.run(follower.run(source))
+
+        self.assertTrue(manager.done)
+        self.assertEqual(stats["num_frames"], len(frames))
+        self.assertGreater(stats["num_frames"], 0)
+        self.assertEqual(stats["deadline"], 1.0 / env_param.fps)
+        self.assertEqual(
+            stats["missed_deadlines"], sum(info["missed"] for info in frames)
+        )
+        self.assertGreater(manager.record.onset_indices.size, 0)
+
+    def test_latency(self):
+        # a policy that takes 0.2 s on the clock of the record misses every
+        # deadline (1/20 s), and the frames it falls behind are dropped
+        score_root = Path(__file__).parents[2] / "samples"
+        env_param = make_env_param(score_root=score_root, renderer_id="layout")
+        clock = FakeClock()
+        manager = make_streaming_manager(env_param, clock=clock)
+
+        def slow_stay(observation):
+            clock.now += 0.2
+            policy = np.zeros(manager.num_actions, dtype=np.float32)
+            policy[-1] = 1.0
+            return policy
+
+        async def source():
+            yield 60, 80
+            await asyncio.sleep(60)  # the performance goes on
+
+        follower = RealTimeFollower(manager, slow_stay)
+        stats = asyncio.run(follower.run(source(), max_duration=1.0))
+        self.assertGreater(stats["num_frames"], 0)
+        self.assertEqual(stats["missed_deadlines"], stats["num_frames"])
+        self.assertGreaterEqual(stats["mean_latency"], 0.15)
+        self.assertGreater(stats["dropped_frames"], 0)
+        self.assertEqual(manager.record_steps, manager.record.frame)
+
+    def test_decision_interval(self):
+        score_root = Path(__file__).parents[2] / "samples"
+        env_param = make_env_param(
+            score_root=score_root,
+            renderer_id="layout",
+            manager_options={"decision_interval": 3},
+        )
+        manager = make_streaming_manager(env_param)
+        record = manager.record
+
+        def stay(observation):
+            policy = np.zeros(manager.num_actions, dtype=np.float32)
+            policy[-1] = 1.0
+            return policy
+
+        # `follow` closes a single frame, whatever the interval
+        manager.reset()
+        manager.follow(stay(None))
+        self.assertEqual(record.frame, 1)
+
+        frames = []
+
+        def on_frame(observation, info):
+            # no frame is closed before it ended
+            self.assertLessEqual(info["frame"] / record.fps, record.elapsed)
+            frames.append(info["frame"])
+
+        follower = RealTimeFollower(manager, stay, on_frame=on_frame, catch_up=False)
+        source = MIDIFileSource(score_root / "record" / "demo.midi", speed=20.0)
+        asyncio.run(follower.run(source))
+        self.assertGreater(len(frames), 1)
+        np.testing.assert_array_equal(np.diff(frames), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+from pathlib import Path
+import struct
+import tempfile
+import unittest
+
+import numpy as np
+
+from measure_following_game.environment import EpisodeRecorder
+from tests.environment import make_seeded_env
+
+
+class EpisodeRecorderTest(unittest.TestCase):
+    def test_png_sequence(self):
+        env = make_seeded_env(renderer_id="layout")
+        policy = np.zeros(env.manager.num_actions, dtype=np.float32)
+        policy[1] = 1.0
+        with tempfile.TemporaryDirectory() as output_dir:
+            random_state = np.random.get_state()[1].copy()
+            recorder = EpisodeRecorder(
+                env.manager.renderer, output_dir, resolution=(42, 64)
+            )
+            np.testing.assert_array_equal(np.random.get_state()[1], random_state)
+            for _ in range(5):
+                env.step(policy)
+                self.assertTrue(recorder.capture())
+            stats = recorder.close()
+            self.assertEqual(stats, {"captured": 5, "written": 5, "dropped": 0})
+
+            paths = sorted(Path(output_dir).glob("frame_*.png"))
+            self.assertEqual(len(paths), 5)
+            data = paths[0].read_bytes()
+            self.assertEqual(data[:8], b"\x89PNG\r\n\x1a\n")
+            self.assertEqual(data[12:16], b"IHDR")
+            self.assertEqual(struct.unpack(">II", data[16:24]), (64, 42))
+
+    def test_drop(self):
+        env = make_seeded_env(renderer_id="layout")
+        with tempfile.TemporaryDirectory() as output_dir:
+            recorder = EpisodeRecorder(
+                env.manager.renderer, output_dir, max_queue_size=1, block=False
+            )
+            results = [recorder.capture() for _ in range(50)]
+            stats = recorder.close()
+            self.assertEqual(stats["captured"], sum(results))
+            self.assertEqual(stats["dropped"], results.count(False))
+            self.assertEqual(stats["written"], stats["captured"])
+
+    def test_env_recording(self):
+        env = make_seeded_env(renderer_id="layout")
+        policy = np.zeros(env.manager.num_actions, dtype=np.float32)
+        policy[1] = 1.0
+        with tempfile.TemporaryDirectory() as output_dir:
+            env.start_recording(output_dir, resolution=(42, 64), grayscale=True)
+            env.reset(seed=0)
+            for _ in range(3):
+                env.step(policy)
+            stats = env.stop_recording()
+            self.assertIsNone(env.recorder)
+            self.assertEqual(stats["written"], 4)
+            self.assertEqual(len(list(Path(output_dir).glob("*.png"))), 4)
+            self.assertEqual(env.stop_recording(), {})
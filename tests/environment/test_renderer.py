@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+
+from pathlib import Path
+import unittest
+
+import numpy as np
+
+from measure_following_game.environment.utils import *
+
+
+class LayoutRendererTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.score_root = Path(__file__).parents[2] / "samples"
+
+    def make_renderer(self, renderer_id: str):
+        np.random.seed(0)  # the initial layout is random
+        return make_renderer(renderer_id, self.score_root)
+
+    def test_matches_grid(self):
+        layout = self.make_renderer("layout")
+        grid = self.make_renderer("grid")
+        self.assertEqual(layout.render_modes, [])
+
+        for seed in range(3):
+            # a new random layout is drawn before `seed` is applied
+            np.random.seed(seed)
+            layout_start = layout.reset(seed=seed)
+            np.random.seed(seed)
+            self.assertEqual(layout_start, grid.reset(seed=seed))
+            for _ in range(len(layout.sheet_view.sheet.staves)):
+                self.assertEqual(layout.window_head, grid.window_head)
+                self.assertEqual(layout.num_window_measures, grid.num_window_measures)
+                layout.slide()
+                grid.slide()
+
+    def test_render(self):
+        layout = self.make_renderer("layout")
+        with self.assertRaises(KeyError):
+            layout.render("rgb_array")
+
+
+if __name__ == "__main__":
+    unittest.main()
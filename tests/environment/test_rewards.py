@@ -72,6 +72,45 @@ class TriangleRewardTest(unittest.TestCase):
         pred_actions_3 = np.array([0, 0, 0, 0, 0, 0, 0, 1, 0], dtype=np.float32)
         self.assertEqual(reward(true_action, pred_actions_3), 0.0)
 
+    def test_reward_table(self):
+        window_size = random.randint(2, 40)
+        reward = TriangleReward(window_size=window_size)
+
+        self.assertEqual(reward.reward_table.shape, (window_size + 2,) * 2)
+        for true_action in range(reward.num_actions):
+            for pred_action in range(reward.num_actions):
+                self.assertAlmostEqual(
+                    reward.reward_table[true_action, pred_action],
+                    reward._calc_reward(true_action, pred_action),
+                )
+
+    def test_batch(self):
+        reward = TriangleReward(window_size=10)  # num_actions = 12
+
+        true_actions = np.array([0, 3, 9, -1, -2])
+        pred_policies = np.random.dirichlet([1] * 12, size=5).astype(np.float32)
+        rewards = reward.batch(true_actions, pred_policies)
+
+        self.assertEqual(rewards.shape, (5,))
+        for idx, (true_action, pred_policy) in enumerate(
+            zip(true_actions, pred_policies)
+        ):
+            self.assertAlmostEqual(rewards[idx], reward(int(true_action), pred_policy))
+
+        with self.assertRaises(AssertionError):
+            reward.batch(true_actions, pred_policies[:-1])
+
+    def test_total(self):
+        reward = TriangleReward(window_size=10)
+
+        true_actions = [0, 3, 9, -1]
+        pred_policy = np.random.dirichlet([1] * 12).astype(np.float32)
+        self.assertAlmostEqual(
+            reward.total(true_actions, pred_policy),
+            sum(reward(true_action, pred_policy) for true_action in true_actions),
+        )
+        self.assertEqual(reward.total([], pred_policy), 0.0)
+
 
 if __name__ == "__main__":
     unittest.main()
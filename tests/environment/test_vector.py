@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+
+from pathlib import Path
+import unittest
+
+import numpy as np
+
+from measure_following_game.environment.utils import *
+
+
+class VectorEnvTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        score_root = Path(__file__).parents[2] / "samples"
+        record_name = "record/demo"
+        cls.env_param = make_env_param(score_root=score_root, record_name=record_name)
+        cls.num_envs = 3
+
+    def test_shared_score(self):
+        vector_env = make_vector_env(self.env_param, self.num_envs)
+        score_measures = vector_env.managers[0].score_measures
+        for manager in vector_env.managers[1:]:
+            self.assertIs(manager.score_measures, score_measures)
+
+    def test_shared_validation(self):
+        env_param = make_env_param(
+            score_root=self.env_param.score_root,
+            record_name=self.env_param.record_name,
+            validation="sampled",
+            validation_interval=4,
+        )
+        vector_env = make_vector_env(env_param, self.num_envs)
+        validation = vector_env.validation
+        for env in vector_env.envs:
+            manager = env.manager
+            self.assertIs(env.validation, validation)
+            self.assertIs(env.reward.validation, validation)
+            self.assertIs(manager.validation, validation)
+            self.assertIs(manager.renderer.validation, validation)
+
+        # one check decision per vector step, for every environment
+        vector_env.reset(seed=0)
+        pred_policies = np.zeros(
+            (self.num_envs, vector_env.num_actions), dtype=np.float32
+        )
+        pred_policies[:, -1] = 1.0
+        num_calls = validation.num_calls
+        for _ in range(8):
+            vector_env.step(pred_policies)
+        self.assertEqual(validation.num_calls - num_calls, 8)
+
+    def test_step(self):
+        vector_env = make_vector_env(self.env_param, self.num_envs)
+        manager = vector_env.managers[0]
+
+        similarity_matrices, policy_memories = vector_env.reset(seed=0)
+        self.assertEqual(
+            similarity_matrices.shape, (self.num_envs, *manager.window_shape)
+        )
+        self.assertEqual(policy_memories.shape, (self.num_envs, *manager.memory_shape))
+
+        pred_policies = np.zeros((self.num_envs, manager.num_actions), np.float32)
+        pred_policies[:, -1] = 1.0
+        observations, rewards, dones, infos = vector_env.step(pred_policies)
+        self.assertIs(observations[0], similarity_matrices)
+        self.assertEqual(rewards.shape, (self.num_envs,))
+        self.assertEqual(dones.shape, (self.num_envs,))
+        self.assertEqual(len(infos), self.num_envs)
+
+        with self.assertRaises(ValueError):
+            vector_env.step(pred_policies[:-1])
+
+    def make_envs(self, seed: int = 0):
+        # a vector env and separate envs with the same layouts
+        env_param = make_env_param(
+            score_root=self.env_param.score_root,
+            record_name=self.env_param.record_name,
+            renderer_id="layout",
+        )
+        np.random.seed(seed)
+        vector_env = make_vector_env(env_param, self.num_envs)
+        np.random.seed(seed)
+        envs = make_envs(env_param, self.num_envs)
+        return vector_env, envs
+
+    def reset_envs(self, vector_env, envs):
+        np.random.seed(1)  # layouts are drawn again by the resets
+        observations = vector_env.reset(seed=0)
+        np.random.seed(1)
+        for idx, env in enumerate(envs):
+            similarity_matrix, policy_memory = env.reset(seed=idx)
+            np.testing.assert_array_equal(observations[0][idx], similarity_matrix)
+            np.testing.assert_array_equal(observations[1][idx], policy_memory)
+
+    def test_matches_envs(self):
+        vector_env, envs = self.make_envs()
+        self.reset_envs(vector_env, envs)
+
+        # each env is compared until its first episode ends; the next one
+        # starts at a measure drawn without a seed
+        rng = np.random.default_rng(0)
+        active = set(range(self.num_envs))
+        for _ in range(20):
+            pred_policies = rng.dirichlet(
+                np.ones(vector_env.num_actions), size=self.num_envs
+            ).astype(np.float32)
+            pred_policies /= pred_policies.sum(axis=1, keepdims=True)
+            observations, rewards, dones, infos = vector_env.step(pred_policies)
+            for idx in sorted(active):
+                observation, reward, done, _ = envs[idx].step(pred_policies[idx])
+                self.assertEqual(dones[idx], done)
+                self.assertAlmostEqual(rewards[idx], reward, places=5)
+                if done:
+                    expected = infos[idx]["final_observation"]
+                    active.remove(idx)
+                else:
+                    expected = (observations[0][idx], observations[1][idx])
+                np.testing.assert_array_equal(expected[0], observation[0])
+                np.testing.assert_array_equal(expected[1], observation[1])
+        self.assertLess(len(active), self.num_envs)
+
+    def test_auto_reset(self):
+        vector_env, envs = self.make_envs()
+        self.reset_envs(vector_env, envs)
+        manager, env = vector_env.managers[0], envs[0]
+
+        pred_policies = np.zeros(
+            (self.num_envs, vector_env.num_actions), dtype=np.float32
+        )
+        pred_policies[:, -1] = 1.0
+        while True:
+            observation, _, done, _ = env.step(pred_policies[0])
+            observations, _, dones, infos = vector_env.step(pred_policies)
+            self.assertEqual(dones[0], done)
+            if done:
+                break
+            self.assertNotIn("final_observation", infos[0])
+
+        final_observation = infos[0]["final_observation"]
+        np.testing.assert_array_equal(final_observation[0], observation[0])
+        np.testing.assert_array_equal(final_observation[1], observation[1])
+
+        # the env is in the first step of a new episode
+        self.assertFalse(manager.done)
+        self.assertEqual(manager.record_steps, 0)
+        np.testing.assert_array_equal(observations[0][0], manager.similarity_matrix)
+        _, policy_memory = env.reset()
+        np.testing.assert_array_equal(observations[1][0], policy_memory)
+
+
+if __name__ == "__main__":
+    unittest.main()
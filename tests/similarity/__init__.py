@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+from sabanamusic.similarity.algorithms import dtw_compact
+
+
+def has_dtw_compact() -> bool:
+    # whether `dtw_compact` of the installed sabanamusic can be run; builds
+    # without the compiled extension leave it unimplemented
+    try:
+        dtw_compact(np.zeros((1, 1)), np.zeros((1, 1)), subsequence=True)
+    except NotImplementedError:
+        return False
+    return True
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+import numpy as np
+
+from measure_following_game.similarity import *
+
+
+def naive_correlation(query, reference):
+    # best normalized correlation over every (partial) placement of `query`
+    best = (0.0, 0, 0)
+    for offset in range(-(len(query) - 1), len(reference)):
+        head, tail = max(offset, 0), min(offset + len(query), len(reference))
+        overlap = query[head - offset : tail - offset]
+        window = reference[head:tail]
+        norm = np.linalg.norm(query) * np.linalg.norm(window)
+        if tail > head and norm > 0.0:
+            score = float(np.sum(overlap * window) / norm)
+            if score > best[0]:
+                best = (score, head, tail)
+    return best
+
+
+class ChromaTest(unittest.TestCase):
+    def test_chroma_fold(self):
+        frames = np.zeros((2, 128))
+        frames[0, [60, 72]] = 1.0  # C4, C5
+        frames[1, 61] = 1.0  # C#4
+        chroma = to_chroma(frames)
+        self.assertEqual(chroma.shape, (2, 12))
+        np.testing.assert_array_equal(chroma[0], np.eye(12)[0] * 2.0)
+        np.testing.assert_array_equal(chroma[1], np.eye(12)[1])
+
+        piano = np.zeros((1, 88))
+        piano[0, 39] = 1.0  # C4 is key 40 of the piano
+        np.testing.assert_array_equal(to_chroma(piano)[0], np.eye(12)[0])
+
+    def test_matches_naive(self):
+        rng = np.random.default_rng(0)
+        queries = [rng.random((rng.integers(1, 8), 12)) for _ in range(6)]
+        queries.append(np.zeros((0, 12)))
+        reference = rng.random((20, 12))
+        padded, lengths = pad_sequences(queries, num_dims=12)
+        correlation = SlidingChromaCorrelation(padded, lengths)
+
+        indices = [3, 0, 6, 5]
+        scores, heads, tails = correlation.correlate(indices, reference)
+        for idx, query_idx in enumerate(indices):
+            score, head, tail = naive_correlation(queries[query_idx], reference)
+            self.assertAlmostEqual(scores[idx], score)
+            self.assertEqual((heads[idx], tails[idx]), (head, tail))
+
+    def test_finds_embedded_query(self):
+        rng = np.random.default_rng(1)
+        reference = rng.random((30, 12))
+        query = reference[12:18].copy()
+        correlation = SlidingChromaCorrelation(*pad_sequences([query], num_dims=12))
+        scores, heads, tails = correlation.correlate([0], reference)
+        self.assertAlmostEqual(scores[0], 1.0)
+        self.assertEqual((heads[0], tails[0]), (12, 18))
+
+
+if __name__ == "__main__":
+    unittest.main()
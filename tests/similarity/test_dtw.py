@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+import numpy as np
+from sabanamusic.similarity.algorithms import dtw_compact
+
+from measure_following_game.similarity.dtw import *
+from tests.similarity import has_dtw_compact
+
+
+def naive_subsequence_dtw(query, reference):
+    # distance, head and tail of the full cost matrix. ties prefer the
+    # horizontal step over the diagonal one and both over the vertical one
+    query, reference = as_frames(query), as_frames(reference)
+    costs = frame_distances(query, reference)
+    num_rows, num_cols = costs.shape
+    accumulated = np.full((num_rows, num_cols), np.inf)
+    starts = np.zeros((num_rows, num_cols), dtype=np.int64)
+    accumulated[0] = costs[0]
+    starts[0] = np.arange(num_cols)
+    for j in range(num_cols):
+        for i in range(1, num_rows):
+            best, start = np.inf, 0
+            if j > 0:
+                best, start = accumulated[i, j - 1], starts[i, j - 1]
+                if accumulated[i - 1, j - 1] < best:
+                    best, start = accumulated[i - 1, j - 1], starts[i - 1, j - 1]
+            if accumulated[i - 1, j] < best:
+                best, start = accumulated[i - 1, j], starts[i - 1, j]
+            accumulated[i, j] = costs[i, j] + best
+            starts[i, j] = start
+    tail = int(np.argmin(accumulated[-1]))
+    return float(accumulated[-1, tail]), int(starts[-1, tail]), tail + 1
+
+
+class StreamingSubsequenceDTWTest(unittest.TestCase):
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+
+    def test_matches_naive(self):
+        for _ in range(10):
+            query = self.rng.random((self.rng.integers(1, 8), 4))
+            reference = self.rng.random((self.rng.integers(1, 20), 4))
+            stream = StreamingSubsequenceDTW(query)
+            stream.extend(reference)
+            distance, head, tail = naive_subsequence_dtw(query, reference)
+            self.assertAlmostEqual(stream.distance, distance)
+            self.assertEqual(stream.head, head)
+            self.assertEqual(stream.tail, tail)
+
+    def test_incremental_extension(self):
+        query = self.rng.random((5, 12))
+        reference = self.rng.random((30, 12))
+
+        full = StreamingSubsequenceDTW(query)
+        full.extend(reference)
+
+        stream = StreamingSubsequenceDTW(query)
+        for head in range(0, 30, 7):
+            stream.extend(reference[head : head + 7])
+
+        self.assertEqual(stream.num_frames, 30)
+        self.assertAlmostEqual(stream.distance, full.distance)
+        self.assertEqual(stream.alignment, full.alignment)
+
+    def test_finds_embedded_subsequence(self):
+        query = self.rng.random((6, 12))
+        reference = np.concatenate(
+            [self.rng.random((10, 12)) + 5.0, query, self.rng.random((8, 12)) + 5.0]
+        )
+        stream = StreamingSubsequenceDTW(query)
+        stream.extend(reference)
+        self.assertAlmostEqual(stream.distance, 0.0)
+        self.assertEqual(stream.alignment, (10, 16))
+
+    def test_reset(self):
+        stream = StreamingSubsequenceDTW(self.rng.random((3, 2)))
+        stream.extend(self.rng.random((4, 2)))
+        stream.reset()
+        self.assertEqual(stream.num_frames, 0)
+        self.assertEqual(stream.distance, float("inf"))
+
+
+class BatchedSubsequenceDTWTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        self.queries = [rng.random((rng.integers(1, 10), 8)) for _ in range(6)]
+        self.reference = rng.random((25, 8))
+
+    def test_matches_single_queries(self):
+        batch = BatchedSubsequenceDTW(self.queries)
+        batch.extend(self.reference[:11])
+        batch.extend(self.reference[11:])
+        for idx, query in enumerate(self.queries):
+            stream = StreamingSubsequenceDTW(query)
+            stream.extend(self.reference)
+            self.assertAlmostEqual(batch.distances[idx], stream.distance)
+            self.assertEqual(batch.heads[idx], stream.head)
+            self.assertEqual(batch.tails[idx], stream.tail)
+
+    def test_take_and_concatenate(self):
+        full = BatchedSubsequenceDTW(self.queries)
+        full.extend(self.reference)
+
+        kept = BatchedSubsequenceDTW(self.queries[:3])
+        kept.extend(self.reference[:20])
+        kept = kept.take([2, 0])
+        kept.extend(self.reference[20:])
+
+        fresh = BatchedSubsequenceDTW(self.queries[3:])
+        fresh.extend(self.reference)
+
+        merged = BatchedSubsequenceDTW.concatenate([kept, fresh])
+        order = [2, 0, 3, 4, 5]
+        np.testing.assert_allclose(merged.distances, full.distances[order])
+        np.testing.assert_array_equal(merged.heads, full.heads[order])
+        np.testing.assert_array_equal(merged.tails, full.tails[order])
+
+    def test_lower_bounds(self):
+        batch = BatchedSubsequenceDTW(self.queries)
+        batch.extend(self.reference)
+        envelope = lower_bound_envelope(batch.queries, batch.lengths, self.reference)
+        rows = lower_bound_rows(batch.queries, batch.lengths, self.reference)
+        self.assertTrue(np.all(envelope <= rows + 1e-9))
+        self.assertTrue(np.all(rows <= batch.distances + 1e-9))
+
+        empty = lower_bound_rows(batch.queries, batch.lengths, np.empty((0, 8)))
+        self.assertTrue(np.all(np.isinf(empty)))
+
+        # nearest-frame distances stream over chunks of the reference
+        streamed = np.minimum(
+            nearest_frame_distances(batch.queries, self.reference[:10]),
+            nearest_frame_distances(batch.queries, self.reference[10:]),
+        )
+        np.testing.assert_allclose(
+            streamed, nearest_frame_distances(batch.queries, self.reference)
+        )
+
+
+@unittest.skipUnless(has_dtw_compact(), "dtw_compact is not implemented")
+class DTWCompactTest(unittest.TestCase):
+
+    # the streaming engine must reproduce the distance and alignment of
+    # `dtw_compact`, which the features were computed with before it
+
+    def test_matches_dtw_compact(self):
+        rng = np.random.default_rng(2)
+        for _ in range(10):
+            # piano-roll like frames: sparse binary pitch vectors
+            query = (rng.random((rng.integers(1, 12), 128)) > 0.95).astype(float)
+            reference = (rng.random((rng.integers(1, 60), 128)) > 0.95).astype(float)
+            batch = BatchedSubsequenceDTW([query])
+            batch.extend(reference)
+            distance, (head, tail) = dtw_compact(query, reference, subsequence=True)
+            self.assertAlmostEqual(batch.distances[0], distance, places=5)
+            self.assertEqual((batch.heads[0], batch.tails[0]), (head, tail))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+from pathlib import Path
+import struct
+import tempfile
+import unittest
+
+import numpy as np
+
+from measure_following_game.environment.utils import *
+from measure_following_game.synthetic import *
+
+
+def count_midi_notes(path: Path) -> int:
+    data = path.read_bytes()
+    assert data[:4] == b"MThd"
+    _, _, num_tracks, _ = struct.unpack(">IHHH", data[4:14])
+    position, num_notes = 14, 0
+    for _ in range(num_tracks):
+        assert data[position : position + 4] == b"MTrk"
+        (length,) = struct.unpack(">I", data[position + 4 : position + 8])
+        track = data[position + 8 : position + 8 + length]
+        idx = 0
+        while idx < len(track):
+            while track[idx] & 0x80:  # delta time
+                idx += 1
+            idx += 1
+            status = track[idx]
+            if status == 0xFF:
+                idx += 3 + track[idx + 2]
+            else:
+                num_notes += (status & 0xF0) == 0x90
+                idx += 3
+        position += 8 + length
+    return num_notes
+
+
+class SyntheticTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = Path(self.temp_dir.name)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_deterministic(self):
+        for name in ("a", "b"):
+            generate_dataset(self.root / name, 50, num_records=2, seed=3, num_jumps=2)
+        for path in (self.root / "a").rglob("*.*"):
+            other = self.root / "b" / path.relative_to(self.root / "a")
+            self.assertEqual(path.read_bytes(), other.read_bytes())
+
+    def test_layout(self):
+        score = generate_score(self.root, 120, seed=1)
+        rows = np.loadtxt(self.root / "score.csv", delimiter=",", skiprows=1)
+        self.assertEqual(rows.shape, (120, 4))
+        np.testing.assert_allclose(np.diff(rows[:, 0]), rows[:-1, 1], atol=1e-3)
+        num_notes = sum(len(notes) for notes in score.measure_notes)
+        self.assertEqual(rows[:, 3].sum(), num_notes)
+        self.assertEqual(count_midi_notes(self.root / "score.midi"), num_notes)
+
+        order = generate_record(
+            score, self.root / "record" / "demo", seed=2, num_jumps=3, drop_prob=0.1
+        )
+        rows = np.loadtxt(self.root / "record" / "demo.csv", delimiter=",", skiprows=1)
+        np.testing.assert_array_equal(rows[:, 1], order)
+        self.assertTrue(np.all(np.diff(rows[:, 0]) > 0))
+        self.assertGreater(len(order), 0)
+        self.assertEqual(order[-1], 119)
+
+    def test_env(self):
+        generate_dataset(self.root, 64, seed=0)
+        env_param = make_env_param(
+            score_root=self.root,
+            record_name="record/synthetic_0",
+            renderer_id="layout",
+        )
+        env = make_env(env_param)
+        env.reset(seed=0)
+        policy = np.zeros(env.manager.num_actions, dtype=np.float32)
+        policy[-1] = 1.0
+        for _ in range(10):
+            env.step(policy)
+
+
+if __name__ == "__main__":
+    unittest.main()